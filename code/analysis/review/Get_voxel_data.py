@@ -12,18 +12,118 @@ import pandas as pd
 import numpy
 import sys
 import argparse
-import nilearn
+from concurrent.futures import ProcessPoolExecutor
 
 #base_path = '/Users/koch/Tardis/damson'
 
-def Get_voxel_data(base_path):
+
+# Function to get joint histogram of labels of both sessions of a participant
+# (number of voxels with each label in session 1 x label in session 2)
+def GetLabelHistogram(base_path,
+                      sub_id,
+                      seg_type):
+
+    from GetFsMask import LoadLabelVolumes
+
+    volumes = LoadLabelVolumes(base_path, sub_id, seg_type)
+    labels_ses1 = volumes['labels'][0].reshape(-1)
+    labels_ses2 = volumes['labels'][1].reshape(-1)
+
+    # Consecutive ids of all labels of both sessions
+    label_values, label_ids = np.unique(
+        np.concatenate([labels_ses1, labels_ses2]), return_inverse=True)
+    n_labels = len(label_values)
+    ids_ses1 = label_ids[:len(labels_ses1)]
+    ids_ses2 = label_ids[len(labels_ses1):]
+
+    hist = np.bincount(ids_ses1 * n_labels + ids_ses2,
+                       minlength=n_labels * n_labels)
+    hist = hist.reshape(n_labels, n_labels)
+
+    return(label_values, hist)
+
+
+# Function to get number of voxels of a mask (voxels with a label of the mask
+# in both sessions) from joint histogram of labels
+def CountMaskVoxels(label_values,
+                    hist,
+                    mask_index):
+
+    ids = np.where(np.isin(label_values, mask_index))[0]
+    return(int(hist[np.ix_(ids, ids)].sum()))
+
+
+# Function to count voxels of each mask of a participant and, if requested,
+# of each label of each segmentation (census)
+def CountSubjectVoxels(base_path,
+                       sub_id,
+                       mask_seg,
+                       mask_list,
+                       census_segs=None):
+
+    sys.path.append(os.path.join(base_path,
+                                 'code',
+                                 'decoding',
+                                 'utils'))
+
+    from GetFsMask import ClearLabelCache
+
+    if census_segs is None:
+        census_segs = []
+
+    # Give message to user
+    print('\t' + sub_id + '...')
+
+    # Number of voxels of each mask
+    label_values, hist = GetLabelHistogram(base_path, sub_id, mask_seg)
+    out = pd.DataFrame(
+        {'participant_id': sub_id,
+         'mask_index': ['-'.join(str(i) for i in mask_index)
+                        for mask_index in mask_list],
+         'n_voxels': [CountMaskVoxels(label_values, hist, mask_index)
+                      for mask_index in mask_list]})
+
+    # Number of voxels of each label of segmentation (labels of table of
+    # segmentation, labels with the same value in both sessions)
+    census = list()
+    for seg_type in census_segs:
+        seg_path = os.path.join(base_path,
+                                'derivatives',
+                                'preprocessing',
+                                'fmriprep',
+                                'desc-' + seg_type + '_dseg.tsv')
+        seg = pd.read_csv(seg_path, sep='\t')
+        label_values, hist = GetLabelHistogram(base_path, sub_id, seg_type)
+        n_voxels = np.zeros(len(seg), dtype=int)
+        present = np.isin(seg['index'], label_values)
+        n_voxels[present] = np.diagonal(hist)[
+            np.searchsorted(label_values, seg['index'][present])]
+        census.append(pd.DataFrame({'participant_id': sub_id,
+                                    'mask_seg': seg_type,
+                                    'mask_index': seg['index'],
+                                    'name': seg['name'],
+                                    'n_voxels': n_voxels}))
+    if len(census) > 0:
+        census = pd.concat(census, ignore_index=True)
+    else:
+        census = None
+
+    # Label volumes of participant are not needed anymore (cache would grow
+    # with each participant of this process)
+    ClearLabelCache(sub_id)
+
+    return(out, census)
+
+
+def Get_voxel_data(base_path,
+                   census=False,
+                   n_jobs=1):
 
     # Load function to load mask
     sys.path.append(os.path.join(base_path,
                                  'code',
                                  'decoding',
                                  'utils'))
-    from GetFsMask import GetFsMask
 
     # Get all participants
     path = os.path.join(base_path, 'bids', 'participants.tsv')
@@ -48,39 +148,24 @@ def Get_voxel_data(base_path):
         list([1024]),
         # MTL
         list([17, 53, 1006, 1016, 2006, 2016])])
+    mask_list = [sorted(x) for x in mask_list]
 
-    # Allocate empty data frame holding number of voxels for each mask and
-    # participant
-    out = pd.DataFrame(columns=('participant_id',
-                                'mask_index',
-                                'n_voxels'))
+    # If requested, also count voxels of all labels of both segmentations
+    census_segs = ['aparcaseg', 'aseg'] if census else []
 
-    # Loop over all participants
+    # Count voxels of each participant (joint histogram of labels of both
+    # sessions, participants in parallel)
     print('Calculating n of voxels per mask...')
-    for sub_id in sub_list:
-        print('\t' + sub_id + '...')
-        # Loop over each mask
-        for mask_index in mask_list:
-
-            # Get participant-specific intersection of masks for both sessions
-            mask_intersect = GetFsMask(base_path=base_path,
-                                       train_test_modality='train-raw_test-raw',
-                                       sub_id=sub_id,
-                                       seg_type=mask_seg,
-                                       mask_index=mask_index,
-                                       save_mask=False)
-            # Convert nifti image object to matrix
-            mask_intersect = nilearn.image.get_data(mask_intersect)
-            # Count number of 1 in mask matrix (number of masked voxels)
-            n_voxels = np.sum(mask_intersect)
-
-            # Append number of voxels in data table
-            out = out.append({'participant_id':sub_id,
-                              'mask_index':'-'.join(str(i) for i in mask_index),
-                              'n_voxels':n_voxels},
-                             ignore_index = True)
+    sub_args = [(base_path, sub_id, mask_seg, mask_list, census_segs)
+                for sub_id in sub_list]
+    if n_jobs == 1:
+        results = [CountSubjectVoxels(*x) for x in sub_args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(CountSubjectVoxels, *zip(*sub_args)))
 
     # Save output
+    out = pd.concat([x[0] for x in results], ignore_index=True)
     out_file = os.path.join(base_path,
                             'derivatives',
                             'analysis',
@@ -92,18 +177,45 @@ def Get_voxel_data(base_path):
                na_rep='n/a',
                header=True,
                index=False)
+    if census:
+        out = pd.concat([x[1] for x in results], ignore_index=True)
+        out_file = os.path.join(base_path,
+                                'derivatives',
+                                'analysis',
+                                'review',
+                                'data_n_voxel_census.tsv')
+        print('Writing output to ' + out_file + '...')
+        out.to_csv(out_file,
+                   sep = '\t',
+                   na_rep='n/a',
+                   header=True,
+                   index=False)
     print('...done!')
 
 
 # # Enable command line parsing of arguments
-parser = argparse.ArgumentParser(description='Script to get number of voxels for each mask of each participant')
-parser.add_argument('--base_path',
-                    default=None,
-                    type=str,
-                    required=True,
-                    help='path to DAMSON repository',
-                    metavar='BASE_PATH')
-args = parser.parse_args()
-
-# Call function
-Get_voxel_data(base_path = args.base_path)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Script to get number of voxels for each mask of each participant')
+    parser.add_argument('--base_path',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='path to DAMSON repository',
+                        metavar='BASE_PATH')
+    parser.add_argument('--census',
+                        dest='census',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used number of voxels of every label of aparcaseg and aseg (same label in both sessions) is additionally written to data_n_voxel_census.tsv')
+    parser.add_argument('--n_jobs',
+                        default=1,
+                        type=int,
+                        required=False,
+                        help='number of processes participants are distributed over',
+                        metavar='N_JOBS')
+    args = parser.parse_args()
+
+    # Call function
+    Get_voxel_data(base_path = args.base_path,
+                   census = args.census,
+                   n_jobs = args.n_jobs)
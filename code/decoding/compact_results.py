@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:48:20 2026
+
+@author: koch
+"""
+
+import os
+import sys
+import argparse
+
+
+# Function to compact outputs of decoding of all participants into one store
+# (SQLite database, one table for each output kind and a table of ingested
+# files holding parameters encoded in file names). Only new or changed files
+# are ingested
+def main(base_path,
+         store_file=None,
+         modalities=None,
+         kinds=None):
+
+    # base_path = os.path.join(os.path.expanduser('~'), 'Tardis', 'damson')
+    # store_file = None
+    # modalities = ['train-raw_test-raw']
+    # kinds = ['acc', 'conf']
+
+    # Import own functions
+    sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
+    from ResultStore import UpdateStore, output_kinds
+
+    if store_file is None:
+        store_file = os.path.join(base_path, 'derivatives', 'decoding',
+                                  'results.sqlite')
+    if kinds is None:
+        kinds = output_kinds
+
+    # Give message to user
+    print('Ingesting new or changed output files...')
+    n_files = UpdateStore(base_path=base_path,
+                          store_file=store_file,
+                          modalities=modalities,
+                          kinds=kinds)
+    for key, val in n_files.items():
+        print('\t', key, ':', val)
+    print('...done!')
+
+
+# Enable command line parsing of arguments
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact decoding outputs of all participants into one store')
+    parser.add_argument('--base_path',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='path to DAMSON repository',
+                        metavar='BASE_PATH')
+    parser.add_argument('--store_file',
+                        default=None,
+                        type=str,
+                        required=False,
+                        help='SQLite file of store (default: .../derivatives/decoding/results.sqlite)',
+                        metavar='STORE_FILE')
+    parser.add_argument('--modalities',
+                        nargs='+',
+                        default=None,
+                        type=str,
+                        required=False,
+                        help='decoding modalities to ingest (e.g. train-raw_test-raw, default: all)',
+                        metavar='MODALITIES')
+    parser.add_argument('--kinds',
+                        nargs='+',
+                        default=None,
+                        type=str,
+                        required=False,
+                        choices=['pred', 'events', 'eventstats', 'acc', 'conf'],
+                        help='outputs to ingest (default: all)',
+                        metavar='KINDS')
+    args = parser.parse_args()
+
+    # Call main function
+    main(base_path=args.base_path,
+         store_file=args.store_file,
+         modalities=args.modalities,
+         kinds=args.kinds)
@@ -83,6 +83,7 @@ def main(base_path,
     sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
     from Classify import Classify
     from CreateOutput import CreateOutput
+    from CorrelatePatterns import CorrelatePatterns
 
 
     # Sort inputs with length > 1
@@ -227,15 +228,10 @@ def main(base_path,
         [np.mean(beta_mat[train_cond == x], axis=0)
          for x in (np.arange(n_bins)+ 1)]
         )
-    for bin_count, bin_id in enumerate(np.arange(n_bins)+ 1):
-        # Correlate each mean pattern with each direction representation in
-        # held-out set
-        bin_mask = test_cond == bin_id
-        # If there are events of this specific bin correlate it with mean
-        # patterns
-        if any(bin_mask == True):
-            cor[bin_mask] = [np.corrcoef(x, mean_pattern)[0][1:(n_bins+1)]
-                             for x in raw_mat[bin_mask]]
+    # Correlate each mean pattern with each direction representation in
+    # held-out set (events of other bins keep a correlation of 0)
+    bin_mask = np.isin(test_cond, np.arange(n_bins) + 1)
+    cor[bin_mask] = CorrelatePatterns(raw_mat[bin_mask], mean_pattern)
 
     # Add event type and prediction
     cor = pd.DataFrame(cor)
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:40 2026
+
+@author: koch
+"""
+
+import os
+import sys
+import itertools
+import argparse
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+
+
+# Raw data of current participant inside worker processes (list of masks, each
+# a list of sessions, set by InitBatchWorker)
+worker_data = dict()
+
+
+# Attach worker process to raw data of participant (inherited from parent
+# process, not copied) and limit BLAS/OpenMP threads of worker
+def InitBatchWorker(raw_mat_list, n_threads):
+    worker_data['raw_mat_list'] = raw_mat_list
+    threadpool_limits(limits=n_threads)
+
+
+# Decode a single mask with a single configuration (returns error message in
+# case decoding stopped, other tasks continue)
+def RunBatchTask(task):
+
+    sys.path.append(os.path.join(task['decode_args']['base_path'], 'code',
+                                 'decoding', 'train-raw_test-raw'))
+    from classifier import DecodeMask
+
+    # Turn of .loc wanings
+    pd.options.mode.chained_assignment = None
+
+    # Give message to user
+    print('Decoding ' + task['label'] + '...')
+
+    try:
+        DecodeMask(raw_mat=worker_data['raw_mat_list'][task['mask_count']],
+                   **task['decode_args'])
+    except (SystemExit, Exception) as error:
+        return(type(error).__name__ + ': ' + str(error))
+
+    return(None)
+
+
+# Function to decode a grid of participants x masks x configurations, loading
+# the functional data of each participant only once
+def main(base_path,
+         sub_list,
+         mask_seg,
+         mask_list,
+         event_file_list,
+         classifier_list,
+         balancing_list,
+         session_list,
+         smoothing_fwhm=0,
+         essential_confounds=True,
+         detrend=True,
+         high_pass=1/128,
+         pull_extremes=False,
+         ext_std_thres=8,
+         standardize='zscore',
+         n_bins=6,
+         balance_strategy='longest',
+         x_val_split='fold',
+         buffering=False,
+         testset_buffer=False,
+         perm=False,
+         n_perm=0,
+         n_folds_within=4,
+         reorganize=False,
+         perm_mode='loop',
+         perm_batch_size=100,
+         logreg_solver='full',
+         use_cache=False,
+         n_jobs=1,
+         n_cpus=None,
+         output_format='tsv',
+         checkpoint=False,
+         perm_output='full'):
+
+    # base_path = os.path.join(os.path.expanduser('~'), 'Tardis', 'damson')
+    # sub_list = ['sub-older068', 'sub-younger001']
+    # mask_seg = 'aparcaseg'
+    # mask_list = [[17, 53], [1006, 2006]]
+    # event_file_list = ['walk-fwd']
+    # classifier_list = ['logreg', 'svm']
+    # balancing_list = ['upsample', 'SMOTE']
+    # session_list = ['within', 'across']
+    # smoothing_fwhm = 3
+    # essential_confounds = True
+    # detrend = True
+    # high_pass = 1/128
+    # pull_extremes = False
+    # ext_std_thres = 8
+    # standardize = 'zscore'
+    # n_bins = 6
+    # balance_strategy = 'longest'
+    # x_val_split = 'fold'
+    # buffering = False
+    # testset_buffer = False
+    # perm = False
+    # n_perm = 0
+    # n_folds_within = 3
+    # reorganize = True
+    # perm_mode = 'batch'
+    # perm_batch_size = 100
+    # logreg_solver = 'full'
+    # use_cache = True
+    # n_jobs = 2
+    # n_cpus = None
+    # output_format = 'tsv'
+    # checkpoint = False
+    # perm_output = 'full'
+
+    # Turn of .loc wanings
+    pd.options.mode.chained_assignment = None  # default='warn'
+
+    sys.path.append(os.path.join(base_path, 'code', 'decoding',
+                                 'train-raw_test-raw', 'utils'))
+    from CreateRawMatrix import CreateRawMatrix
+
+    # Warn about combination of buffer=False & testset_buffer=True (cannot be
+    # combined)
+    if (not buffering) & testset_buffer :
+        print('\n', 'WARNING:', '\n',
+              'Cannot combine unbuffered training and buffered testing set.', '\n',
+              'Falling back to unbuffered testing set', '\n')
+        testset_buffer = False
+
+    # Sort masks (same order of segmentation codes as in classifier.py)
+    mask_list = [sorted(x) for x in mask_list]
+
+    # Configurations decoded for each participant and mask (within-session
+    # decoding always uses sub_fold for cross-validation)
+    configs = list(itertools.product(event_file_list,
+                                     classifier_list,
+                                     balancing_list,
+                                     session_list))
+
+    # Give message to user
+    print('Grid:')
+    print('\t', 'participants :', sub_list)
+    print('\t', 'masks :', mask_list)
+    print('\t', 'configurations (event_file, classifier, balancing_option, session) :')
+    for config in configs:
+        print('\t\t', config)
+
+    # Workers share CPUs of job (BLAS/OpenMP threads of each worker limited)
+    if n_cpus is None:
+        n_cpus = len(os.sched_getaffinity(0))
+    n_threads = max(1, n_cpus // n_jobs)
+    threadpool_limits(limits=n_threads)
+
+    failed = []
+    for sub_id in sub_list:
+
+        # ===
+        # Get raw data matrices (TR x voxel) of all masks at once
+        # ===
+
+        # Give message to user
+        print('Loading raw data of ' + sub_id + '...')
+
+        raw_mat_list = CreateRawMatrix(base_path=base_path,
+                                       sub_id=sub_id,
+                                       mask_seg=mask_seg,
+                                       mask_index=mask_list,
+                                       smoothing_fwhm=smoothing_fwhm,
+                                       essential_confounds=essential_confounds,
+                                       detrend=detrend,
+                                       high_pass=high_pass,
+                                       pull_extremes=pull_extremes,
+                                       ext_std_thres=ext_std_thres,
+                                       standardize=standardize,
+                                       use_cache=use_cache)
+
+        # Tasks of participant (each mask with each configuration, masks
+        # first so workers decoding the same mask run close in time)
+        tasks = []
+        for (mask_count, mask_index), config in itertools.product(
+                enumerate(mask_list), configs):
+            event_file, classifier, balancing_option, session = config
+            within_session = session == 'within'
+            decode_args = {'base_path': base_path,
+                           'sub_id': sub_id,
+                           'mask_seg': mask_seg,
+                           'mask_index': mask_index,
+                           'event_file': event_file,
+                           'classifier': classifier,
+                           'smoothing_fwhm': smoothing_fwhm,
+                           'essential_confounds': essential_confounds,
+                           'detrend': detrend,
+                           'high_pass': high_pass,
+                           'ext_std_thres': ext_std_thres,
+                           'standardize': standardize,
+                           'n_bins': n_bins,
+                           'balancing_option': balancing_option,
+                           'balance_strategy': balance_strategy,
+                           'x_val_split': ('sub_fold' if within_session
+                                           else x_val_split),
+                           'buffering': buffering,
+                           'testset_buffer': testset_buffer,
+                           'perm': perm,
+                           'n_perm': n_perm,
+                           'within_session': within_session,
+                           'n_folds_within': n_folds_within,
+                           'reorganize': reorganize,
+                           'perm_mode': perm_mode,
+                           'perm_batch_size': perm_batch_size,
+                           'n_jobs': 1,
+                           'logreg_solver': logreg_solver,
+                           'n_threads': n_threads,
+                           'output_format': output_format,
+                           'checkpoint': checkpoint,
+                           'perm_output': perm_output}
+            label = ' '.join([sub_id,
+                              'mask-' + '-'.join(map(str, mask_index)),
+                              event_file, classifier, balancing_option,
+                              session])
+            tasks.append({'label': label,
+                          'mask_count': mask_count,
+                          'decode_args': decode_args})
+
+        # Decode all tasks of participant (workers are forked, so raw data is
+        # not copied to each worker)
+        if n_jobs == 1:
+            InitBatchWorker(raw_mat_list, n_threads)
+            errors = [RunBatchTask(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=n_jobs,
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=InitBatchWorker,
+                    initargs=(raw_mat_list, n_threads)) as pool:
+                errors = list(pool.map(RunBatchTask, tasks))
+        worker_data.clear()
+
+        failed.extend([(task['label'], error)
+                       for task, error in zip(tasks, errors)
+                       if error is not None])
+
+    # Give message to user
+    print('Decoded', len(sub_list) * len(mask_list) * len(configs), 'tasks,',
+          len(failed), 'failed')
+    for label, error in failed:
+        print('\t', label, ':', error)
+    if len(failed) > 0:
+        sys.exit('Decoding failed for ' + str(len(failed)) + ' tasks.')
+
+    print('...done!')
+
+
+# Only parse command line arguments when run as a script
+if __name__ == '__main__':
+    # Enable command line parsing of arguments
+    parser = argparse.ArgumentParser(description='DAMSON batch decoding script')
+    parser.add_argument('--base_path',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='path to DAMSON repository',
+                        metavar='BASE_PATH')
+    parser.add_argument('--sub_id',
+                        nargs='+',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='participants to be processed (e.g. sub-younger001 sub-older068)',
+                        metavar='SUB_ID')
+    parser.add_argument('--mask_seg',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['aseg', 'aparcaseg'],
+                        help='FreeSurfer segmentation type to use (influences mask indices)',
+                        metavar='MASK_SEG')
+    parser.add_argument('--mask_list',
+                        nargs='+',
+                        default=None,
+                        type=lambda x: [int(i) for i in x.split()],
+                        required=True,
+                        help='masks to decode, each given as quoted codes of segmentations (e.g. "17 53" "1006 2006")',
+                        metavar='MASK_LIST')
+    parser.add_argument('--event_file',
+                        nargs='+',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='(standard) events to be used (e.g. walk-fwd walk-bwd)',
+                        metavar='EVENT_FILE')
+    parser.add_argument('--classifier',
+                        nargs='+',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['svm', 'svm-precomputed', 'logreg'],
+                        help='classifiers to use for prediction',
+                        metavar='CLASSIFIER')
+    parser.add_argument('--balancing_option',
+                        nargs='+',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['downsample', 'upsample', 'SMOTE', 'none'],
+                        help='Types of sampling to balance events',
+                        metavar='BALANCING_OPTION')
+    parser.add_argument('--session',
+                        nargs='+',
+                        default=['within'],
+                        type=str,
+                        required=False,
+                        choices=['within', 'across'],
+                        help='within-session (x-val over sub_fold) and/or across-session decoding (x-val over X_VAL_SPLIT)',
+                        metavar='SESSION')
+    parser.add_argument('--smoothing_fwhm',
+                        default=None,
+                        type=int,
+                        required=True,
+                        help='FWHM of smoothing kernel applied before masking (in mm)',
+                        metavar='FWHM')
+    parser.add_argument('--essential_confounds',
+                        default=None,
+                        type=bool,
+                        required=True,
+                        help='Bool if confounds should be narrowed down to motion, noise, and FD',
+                        metavar='ESSENTIAL_CONFOUNDS')
+    parser.add_argument('--detrend',
+                        default=None,
+                        type=bool,
+                        required=True,
+                        help='boolean to use "detrend" option for nilearns signal.clean',
+                        metavar='DETREND')
+    parser.add_argument('--high_pass',
+                        default=None,
+                        type=float,
+                        required=True,
+                        help='high pass filter value for nilearns signal.clean',
+                        metavar='HIGH_PASS')
+    parser.add_argument('--pull_extremes',
+                        default=False,
+                        type=lambda x: x == 'True',
+                        required=False,
+                        help='True to include pulling extreme data towards the mean (default: False)',
+                        metavar='PULL_EXTREMES')
+    parser.add_argument('--ext_std_thres',
+                        default=None,
+                        type=int,
+                        required=True,
+                        help='max std allowed of a value before being pulled towards the mean',
+                        metavar='STD_THRES')
+    parser.add_argument('--standardize',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='standardize argument to nilearns signal.clean (e.g. "zscore")',
+                        metavar='STANDARDIZE')
+    parser.add_argument('--n_bins',
+                        default=None,
+                        type=int,
+                        required=True,
+                        help='number of directional bins',
+                        metavar='N_BINS')
+    parser.add_argument('--balance_strategy',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['longest', 'random'],
+                        help='way to chose events to up- or downsample during balancing',
+                        metavar='BALANCE_STRATEGY')
+    parser.add_argument('--x_val_split',
+                        default='fold',
+                        type=str,
+                        required=False,
+                        choices=['fold', 'session'],
+                        help='way to chose folds for cross-validation of across-session decoding',
+                        metavar='X_VAL_SPLIT')
+    parser.add_argument('--buffering',
+                        dest='buffering',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used buffered events are used')
+    parser.add_argument('--testset_buffer',
+                        dest='testset_buffer',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used the testing set also includes the buffer')
+    parser.add_argument('--perm',
+                        dest='perm',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used classification is done with permuted training labels')
+    parser.add_argument('--n_perm',
+                        default=0,
+                        type=int,
+                        required=False,
+                        help='number of permutations',
+                        metavar='N_PERM')
+    parser.add_argument('--n_folds_within',
+                        default=4,
+                        type=int,
+                        required=False,
+                        help='number of folds for within-session decoding',
+                        metavar='N_FOLDS_WITHIN')
+    parser.add_argument('--reorganize',
+                        dest='reorganize',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used folds are reorganized to be as balanced as possible')
+    parser.add_argument('--perm_mode',
+                        default='loop',
+                        type=str,
+                        required=False,
+                        choices=['loop', 'batch'],
+                        help='way to run permutations ("loop": one classification per permutation, "batch": chunks of permutations share splits and balancing, logistic regressions of all permutations of a chunk are fitted at once)',
+                        metavar='PERM_MODE')
+    parser.add_argument('--perm_batch_size',
+                        default=100,
+                        type=int,
+                        required=False,
+                        help='number of permutations of a chunk (fitted together if --perm_mode batch)',
+                        metavar='PERM_BATCH_SIZE')
+    parser.add_argument('--logreg_solver',
+                        default='full',
+                        type=str,
+                        required=False,
+                        choices=['full', 'sample'],
+                        help='space logistic regression is fitted in (see classifier.py)',
+                        metavar='LOGREG_SOLVER')
+    parser.add_argument('--use_cache',
+                        dest='use_cache',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used preprocessed raw data is stored in (and loaded from) .../derivatives/decoding/cache')
+    parser.add_argument('--n_jobs',
+                        default=1,
+                        type=int,
+                        required=False,
+                        help='number of processes tasks (mask x configuration) of a participant are distributed over',
+                        metavar='N_JOBS')
+    parser.add_argument('--n_cpus',
+                        default=None,
+                        type=int,
+                        required=False,
+                        help='number of CPUs of the job, BLAS/OpenMP threads of each worker are limited to N_CPUS / N_JOBS (default: all CPUs available to the process)',
+                        metavar='N_CPUS')
+    parser.add_argument('--output_format',
+                        default='tsv',
+                        type=str,
+                        required=False,
+                        choices=['tsv', 'parquet'],
+                        help='file format of outputs (see classifier.py)',
+                        metavar='OUTPUT_FORMAT')
+    parser.add_argument('--perm_output',
+                        default='full',
+                        type=str,
+                        required=False,
+                        choices=['full', 'summary'],
+                        help='outputs of permutations (see classifier.py)',
+                        metavar='PERM_OUTPUT')
+    parser.add_argument('--checkpoint',
+                        dest='checkpoint',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used results of permutations are checkpointed in .../derivatives/decoding/checkpoint (see classifier.py)')
+    args = parser.parse_args()
+
+    # Call main function
+    main(base_path=args.base_path,
+         sub_list=args.sub_id,
+         mask_seg=args.mask_seg,
+         mask_list=args.mask_list,
+         event_file_list=args.event_file,
+         classifier_list=args.classifier,
+         balancing_list=args.balancing_option,
+         session_list=args.session,
+         smoothing_fwhm=args.smoothing_fwhm,
+         essential_confounds=args.essential_confounds,
+         detrend=args.detrend,
+         high_pass=args.high_pass,
+         pull_extremes=args.pull_extremes,
+         ext_std_thres=args.ext_std_thres,
+         standardize=args.standardize,
+         n_bins=args.n_bins,
+         balance_strategy=args.balance_strategy,
+         x_val_split=args.x_val_split,
+         buffering=args.buffering,
+         testset_buffer=args.testset_buffer,
+         perm=args.perm,
+         n_perm=args.n_perm,
+         n_folds_within=args.n_folds_within,
+         reorganize=args.reorganize,
+         perm_mode=args.perm_mode,
+         perm_batch_size=args.perm_batch_size,
+         logreg_solver=args.logreg_solver,
+         use_cache=args.use_cache,
+         n_jobs=args.n_jobs,
+         n_cpus=args.n_cpus,
+         output_format=args.output_format,
+         checkpoint=args.checkpoint,
+         perm_output=args.perm_output)
+
+
+# python3 batch_classifier.py --base_path /home/mpib/koch/damson --sub_id sub-younger001 sub-older068 --mask_seg aparcaseg --mask_list "17 53" "1006 2006" --event_file walk-fwd --classifier logreg svm --balancing_option upsample --session within across --smoothing_fwhm 3 --essential_confounds True --detrend True --high_pass 0.0078125 --ext_std_thres 8 --standardize zscore --n_bins 6 --balance_strategy longest --n_folds_within 3 --reorganize --use_cache --n_jobs 2
@@ -12,6 +12,7 @@ import pandas as pd
 import numpy
 import sys
 import argparse
+from threadpoolctl import threadpool_limits
 
 # Main function for decoding and saving results
 def main(base_path,
@@ -37,7 +38,19 @@ def main(base_path,
          n_perm=0,
          within_session=False,
          n_folds_within = 4,
-         reorganize=False):
+         reorganize=False,
+         perm_mode='loop',
+         perm_batch_size=100,
+         n_jobs=1,
+         use_cache=False,
+         mask_list=None,
+         logreg_solver='full',
+         warm_start='off',
+         split_jobs=1,
+         n_cpus=None,
+         output_format='tsv',
+         checkpoint=False,
+         perm_output='full'):
 
     # base_path = os.path.join(os.path.expanduser('~'), 'Tardis', 'damson')
     # sub_id = 'sub-older068'
@@ -63,6 +76,18 @@ def main(base_path,
     # within_session=True
     # n_folds_within = 3
     # reorganize=True
+    # perm_mode='batch'
+    # perm_batch_size=100
+    # n_jobs=2
+    # use_cache=True
+    # mask_list=[[17, 53], [1006, 2006]]
+    # logreg_solver='sample'
+    # warm_start='off'
+    # split_jobs=1
+    # n_cpus=None
+    # output_format='tsv'
+    # checkpoint=False
+    # perm_output='full'
     
     
     # Turn of .loc wanings
@@ -93,7 +118,19 @@ def main(base_path,
                   'n_perm': n_perm,
                   'within_session': within_session,
                   'n_folds_within': n_folds_within,
-                  'reorganize': reorganize}
+                  'reorganize': reorganize,
+                  'perm_mode': perm_mode,
+                  'perm_batch_size': perm_batch_size,
+                  'n_jobs': n_jobs,
+                  'use_cache': use_cache,
+                  'mask_list': mask_list,
+                  'logreg_solver': logreg_solver,
+                  'warm_start': warm_start,
+                  'split_jobs': split_jobs,
+                  'n_cpus': n_cpus,
+                  'output_format': output_format,
+                  'checkpoint': checkpoint,
+                  'perm_output': perm_output}
     print('Used parameters:')
     for key, val in parameters.items() :
         print('\t', key, ':', val)
@@ -114,25 +151,47 @@ def main(base_path,
               'Falling back to x_val_split = "sub_fold"', '\n')
         x_val_split = 'sub_fold'
     
+    # Warn about combination of warm start and parallel hold-out splits
+    # (warm start depends on order of fits)
+    if (warm_start != 'off') & (split_jobs > 1):
+        print('\n', 'WARNING:', '\n',
+              'Cannot combine warm start with parallel hold-out splits.', '\n',
+              'Falling back to warm_start = "off"', '\n')
+        warm_start = 'off'
+    
+    # Warn about combination of warm start and batched permutations (all
+    # logistic regressions of a chunk are fitted at once)
+    if (warm_start != 'off') & (perm_mode == 'batch'):
+        print('\n', 'WARNING:', '\n',
+              'Cannot combine warm start with batched permutations.', '\n',
+              'Falling back to warm_start = "off"', '\n')
+        warm_start = 'off'
+    
+    # Limit BLAS/OpenMP threads of each worker so processes (permutations)
+    # times threads (hold-out splits) times BLAS threads match CPUs of job
+    if n_cpus is None:
+        n_cpus = len(os.sched_getaffinity(0))
+    n_threads = max(1, n_cpus // (n_jobs * split_jobs))
+    threadpool_limits(limits=n_threads)
+    
     # ===    
     # Import own functions specific for train-raw_test-raw
     # ===
     sys.path.append(os.path.join(base_path, 'code', 'decoding', 'train-raw_test-raw', 'utils'))
     from CreateRawMatrix import CreateRawMatrix
-    from CreateConditions import CreateConditions
-    from AverageMultiTrEvents import AverageMultiTrEvents
-    from RawClassification import RawClassification
-    # ===    
-    # Import own generel decoding functions
-    # ===
-    sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
-    from CreateOutput import CreateOutput
     
     
     # Sort inputs with length > 1
     if isinstance(mask_index, list) :
         mask_index.sort()
     
+    # In case multiple masks are given, all masks are decoded after loading
+    # the functional images only once
+    if mask_list is not None:
+        mask_list = [sorted(x) for x in mask_list]
+    else:
+        mask_list = [np.atleast_1d(mask_index).tolist()]
+    
     # ===
     # Get raw data matrices (TR x voxel)
     # ===
@@ -140,17 +199,115 @@ def main(base_path,
     # Give message to user
     print('Loading raw data...')
     
-    raw_mat = CreateRawMatrix(base_path=base_path,
-                              sub_id=sub_id,
-                              mask_seg=mask_seg,
-                              mask_index=mask_index,
-                              smoothing_fwhm=smoothing_fwhm,
-                              essential_confounds=essential_confounds,
-                              detrend=detrend,
-                              high_pass=high_pass,
-                              pull_extremes=pull_extremes,
-                              ext_std_thres=ext_std_thres,
-                              standardize=standardize)
+    # (list of masks, each a list of sessions)
+    raw_mat_list = CreateRawMatrix(base_path=base_path,
+                                   sub_id=sub_id,
+                                   mask_seg=mask_seg,
+                                   mask_index=mask_list,
+                                   smoothing_fwhm=smoothing_fwhm,
+                                   essential_confounds=essential_confounds,
+                                   detrend=detrend,
+                                   high_pass=high_pass,
+                                   pull_extremes=pull_extremes,
+                                   ext_std_thres=ext_std_thres,
+                                   standardize=standardize,
+                                   use_cache=use_cache)
+    
+    # Decode each mask
+    for mask_index, raw_mat in zip(mask_list, raw_mat_list):
+        
+        # Give message to user
+        print('Decoding mask ' + '-'.join(map(str, mask_index)) + '...')
+        
+        DecodeMask(base_path=base_path,
+                   sub_id=sub_id,
+                   raw_mat=raw_mat,
+                   mask_seg=mask_seg,
+                   mask_index=mask_index,
+                   event_file=event_file,
+                   classifier=classifier,
+                   smoothing_fwhm=smoothing_fwhm,
+                   essential_confounds=essential_confounds,
+                   detrend=detrend,
+                   high_pass=high_pass,
+                   ext_std_thres=ext_std_thres,
+                   standardize=standardize,
+                   n_bins=n_bins,
+                   balancing_option=balancing_option,
+                   balance_strategy=balance_strategy,
+                   x_val_split=x_val_split,
+                   buffering=buffering,
+                   testset_buffer=testset_buffer,
+                   perm=perm,
+                   n_perm=n_perm,
+                   within_session=within_session,
+                   n_folds_within=n_folds_within,
+                   reorganize=reorganize,
+                   perm_mode=perm_mode,
+                   perm_batch_size=perm_batch_size,
+                   n_jobs=n_jobs,
+                   logreg_solver=logreg_solver,
+                   warm_start=warm_start,
+                   split_jobs=split_jobs,
+                   n_threads=n_threads,
+                   output_format=output_format,
+                   checkpoint=checkpoint,
+                   perm_output=perm_output)
+
+
+# Function decoding a single mask from its raw data matrices (list of sessions,
+# TR x voxel)
+def DecodeMask(base_path,
+               sub_id,
+               raw_mat,
+               mask_seg,
+               mask_index,
+               event_file,
+               classifier,
+               smoothing_fwhm,
+               essential_confounds,
+               detrend,
+               high_pass,
+               ext_std_thres,
+               standardize,
+               n_bins,
+               balancing_option,
+               balance_strategy,
+               x_val_split,
+               buffering,
+               testset_buffer,
+               perm,
+               n_perm,
+               within_session,
+               n_folds_within,
+               reorganize,
+               perm_mode,
+               perm_batch_size,
+               n_jobs,
+               logreg_solver='full',
+               warm_start='off',
+               split_jobs=1,
+               n_threads=None,
+               output_format='tsv',
+               checkpoint=False,
+               perm_output='full'):
+    
+    # ===    
+    # Import own functions specific for train-raw_test-raw
+    # ===
+    sys.path.append(os.path.join(base_path, 'code', 'decoding', 'train-raw_test-raw', 'utils'))
+    from CreateConditions import CreateConditions
+    from AverageMultiTrEvents import AverageMultiTrEvents
+    from RawClassification import RawClassification
+    from RawPermutation import RawPermutation
+    from SplitPlan import AssignFolds
+    # ===    
+    # Import own generel decoding functions
+    # ===
+    sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
+    from CreateOutput import (CreateOutput, GetOutputFilePattern,
+                              GetOutputFiles)
+    from PermCheckpoint import RemovePermCheckpoint, SavePermDone
     
     # Get number of TRs in first session
     n_tr_ses_1 = raw_mat[0].shape[0]
@@ -196,49 +353,21 @@ def main(base_path,
     cond, raw_mat = AverageMultiTrEvents(cond = cond,
                                          raw_mat = raw_mat)
     
+    # For SVM with precomputed kernel get linear kernel of all examples once
+    # (split into blocks for each hold-out split, balancing, and permutation)
+    gram = None
+    if classifier == 'svm-precomputed':
+        gram = np.array(raw_mat, dtype=np.float64)
+        gram = np.dot(gram, gram.T)
+    
     # Get fold for within_session decoding (allows different fold number)
-    cond.loc[:, 'sub_fold'] = 0
-    for i_session in np.unique(cond.loc[:,'session']):
-        for i_dir in np.arange(1, n_bins+1):
-            dir_mask = np.logical_and(cond.loc[:, 'session'] == i_session,
-                                          cond.loc[:, 'event_type'] == i_dir)
-            n_dir = np.sum(dir_mask)
-            split = (
-                np.tile(np.arange(1, n_folds_within+1),
-                        int(np.ceil(n_dir/n_folds_within)))[np.arange(n_dir)]
-                )
-            split.sort()
-            cond.loc[dir_mask, 'sub_fold'] = split
-    
-    
-    # If requested, reorganize folds within session to be as balanced as
+    # and, if requested, reorganize folds within session to be as balanced as
     # possible
-    if reorganize:
-        for i_session in np.unique(cond.loc[:,'session']):
-            for i_dir in np.arange(1, n_bins+1):
-                if buffering :
-                    for i_buffer in np.arange(1,3) :
-                        dir_mask = np.logical_and(cond.loc[:, 'session'] == i_session,
-                                                  cond.loc[:, 'event_type'] == i_dir)
-                        dir_mask = np.logical_and(dir_mask, 
-                                                  cond.loc[:, 'buffer'] == i_buffer)
-                        n_dir = np.sum(dir_mask)
-                        # Reorganize fold (sub_fold already organized due to constrains
-                        # of within session decoding (e.g. fewer events))
-                        new_fold = np.tile([2*i_session-1,2*i_session],
-                                           int(np.ceil(n_dir/2)))[np.arange(n_dir)]
-                        new_fold.sort()
-                        cond.loc[dir_mask, 'fold'] = new_fold
-                else :
-                    dir_mask = np.logical_and(cond.loc[:, 'session'] == i_session,
-                                              cond.loc[:, 'event_type'] == i_dir)
-                    n_dir = np.sum(dir_mask)
-                    # Reorganize fold (sub_fold already organized due to constrains
-                    # of within session decoding (e.g. fewer events))
-                    new_fold = np.tile([2*i_session-1,2*i_session],
-                                       int(np.ceil(n_dir/2)))[np.arange(n_dir)]
-                    new_fold.sort()
-                    cond.loc[dir_mask, 'fold'] = new_fold
+    cond = AssignFolds(cond=cond,
+                       n_bins=n_bins,
+                       n_folds_within=n_folds_within,
+                       reorganize=reorganize,
+                       buffering=buffering)
     
     
     # bla_mask =  np.logical_and(cond.loc[:, 'fold'] == 1,
@@ -306,6 +435,9 @@ def main(base_path,
                         result_cond, acc, acc_across, counts = (
                             RawClassification(base_path=base_path,
                                               raw_mat=raw_mat,
+                                              gram=gram,
+                                              logreg_solver=logreg_solver,
+                                              split_jobs=split_jobs,
                                               cond=cond,
                                               train_mask=train_mask_session,
                                               classifier=classifier,
@@ -348,76 +480,96 @@ def main(base_path,
                                      buffer=buffer,
                                      perm=perm,
                                      within_session=i_session,
-                                     reorganize=reorganize)
+                                     reorganize=reorganize,
+                                     output_format=output_format)
                         
                     elif perm:
-                        # Create chained permutation data frames
-                        permutation_cond = pd.DataFrame()
-                        permutation_acc = pd.DataFrame()
-                        permutation_acc_across = pd.DataFrame()
-                        permutation_counts = pd.DataFrame()
-                        # Loop over permutations, each run shuffeling labels in a different manner
-                        for i_perm in np.arange(n_perm):
-                            
-                            # Give message to user:
-                            print('Permutation count: ' + str(i_perm))
-                            
-                            # Classification with permuted labels
-                            result_cond, acc_perm, acc_across_perm, counts_perm = (
-                                RawClassification(base_path=base_path,
-                                                  raw_mat=raw_mat,
-                                                  cond=cond,
-                                                  train_mask=train_mask_session,
-                                                  classifier=classifier,
-                                                  n_bins=n_bins,
-                                                  x_val_split=x_val_split,
-                                                  balancing_option=balancing_option,
-                                                  balance_strategy=balance_strategy,
-                                                  buffering=buffering,
-                                                  testset_buffer=testset_buffer,
-                                                  perm=perm)
-                                )
-                            # Add variable of permutation
-                            result_cond['i_perm'] = i_perm
-                            #acc_perm['i_perm'] = i_perm
-                            counts_perm['i_perm'] = i_perm
-                            # Chain permutation results to one data frame
-                            permutation_cond = permutation_cond.append(result_cond, ignore_index = True)
-                            permutation_acc = np.append(permutation_acc, acc_perm)
-                            permutation_acc_across = np.append(permutation_acc_across, acc_across_perm)
-                            permutation_counts = permutation_counts.append(counts_perm, ignore_index = True)
+                        # Output files (in case of checkpoint, a restarted job skips calls
+                        # whose outputs were written with the same parameters)
+                        perm_files = GetOutputFiles(
+                            GetOutputFilePattern(base_path=base_path,
+                                                 train_test_modality='train-raw_test-raw',
+                                                 sub_id=sub_id,
+                                                 event_file=event_file,
+                                                 mask_index=mask_index,
+                                                 x_val_split=x_val_split,
+                                                 classifier=classifier,
+                                                 balancing_option=balancing_option,
+                                                 buffer=buffer,
+                                                 perm=perm,
+                                                 within_session=i_session,
+                                                 reorganize=reorganize),
+                            perm=perm,
+                            output_format=output_format,
+                            perm_output=perm_output)
+                        # Classification with permuted labels (chained over all permutations)
+                        perm_result = RawPermutation(base_path=base_path,
+                                                     sub_id=sub_id,
+                                                     mask_index=mask_index,
+                                                     raw_mat=raw_mat,
+                                                     gram=gram,
+                                                     logreg_solver=logreg_solver,
+                                                     cond=cond,
+                                                     train_mask=train_mask_session,
+                                                     classifier=classifier,
+                                                     n_bins=n_bins,
+                                                     x_val_split=x_val_split,
+                                                     balancing_option=balancing_option,
+                                                     balance_strategy=balance_strategy,
+                                                     n_perm=n_perm,
+                                                     buffering=buffering,
+                                                     testset_buffer=testset_buffer,
+                                                     perm_mode=perm_mode,
+                                                     perm_batch_size=perm_batch_size,
+                                                     n_jobs=n_jobs,
+                                                     warm_start=warm_start,
+                                                     split_jobs=split_jobs,
+                                                     n_threads=n_threads,
+                                                     checkpoint=checkpoint,
+                                                     out_files=perm_files)
+                        if perm_result is not None:
+                            (permutation_cond, permutation_acc, permutation_acc_across,
+                             permutation_counts, checkpoint_dir,
+                             checkpoint_key) = perm_result
 
-                        # Give message to user
-                        print('Saving output...')
-                        CreateOutput(base_path=base_path,
-                                     train_test_modality='train-raw_test-raw',
-                                     conditions=permutation_cond,
-                                     n_bins=n_bins,
-                                     sub_id=sub_id,
-                                     mask_seg=mask_seg,
-                                     mask_index=mask_index,
-                                     classifier=classifier,
-                                     smoothing_fwhm=smoothing_fwhm,
-                                     essential_confounds=essential_confounds,
-                                     detrend=detrend,
-                                     high_pass=high_pass,
-                                     ext_std_thres=ext_std_thres,
-                                     standardize=standardize,
-                                     event_file=event_file,
-                                     balancing_option=balancing_option,
-                                     balance_strategy=balance_strategy,
-                                     x_val_split=x_val_split,
-                                     testset_buffer=testset_buffer,
-                                     proba_cols=proba_cols,
-                                     cor_cols=cor_cols,
-                                     event_counts=permutation_counts,
-                                     accuracy=permutation_acc,
-                                     accuracy_across=permutation_acc_across,
-                                     session_label=session_label,
-                                     buffer=buffer,
-                                     perm=perm,
-                                     within_session=i_session,
-                                     reorganize=reorganize)
+                            # Give message to user
+                            print('Saving output...')
+                            CreateOutput(base_path=base_path,
+                                         train_test_modality='train-raw_test-raw',
+                                         conditions=permutation_cond,
+                                         n_bins=n_bins,
+                                         sub_id=sub_id,
+                                         mask_seg=mask_seg,
+                                         mask_index=mask_index,
+                                         classifier=classifier,
+                                         smoothing_fwhm=smoothing_fwhm,
+                                         essential_confounds=essential_confounds,
+                                         detrend=detrend,
+                                         high_pass=high_pass,
+                                         ext_std_thres=ext_std_thres,
+                                         standardize=standardize,
+                                         event_file=event_file,
+                                         balancing_option=balancing_option,
+                                         balance_strategy=balance_strategy,
+                                         x_val_split=x_val_split,
+                                         testset_buffer=testset_buffer,
+                                         proba_cols=proba_cols,
+                                         cor_cols=cor_cols,
+                                         event_counts=permutation_counts,
+                                         accuracy=permutation_acc,
+                                         accuracy_across=permutation_acc_across,
+                                         session_label=session_label,
+                                         buffer=buffer,
+                                         perm=perm,
+                                         within_session=i_session,
+                                         reorganize=reorganize,
+                                         output_format=output_format,
+                                         perm_output=perm_output)
+                            # Outputs are marked as complete (key of run) before checkpoint is
+                            # removed
+                            if checkpoint:
+                                SavePermDone(key=checkpoint_key, out_files=perm_files)
+                                RemovePermCheckpoint(checkpoint_dir)
                         
             elif not within_session:
                 # No permutation
@@ -425,6 +577,9 @@ def main(base_path,
                     # Classify betas (includes leave-one-out)
                     result_cond, acc, acc_across, counts = RawClassification(base_path=base_path,
                                                                  raw_mat=raw_mat,
+                                                                 gram=gram,
+                                                                 logreg_solver=logreg_solver,
+                                                                 split_jobs=split_jobs,
                                                                  cond=cond,
                                                                  train_mask=train_mask,
                                                                  classifier=classifier,
@@ -470,80 +625,101 @@ def main(base_path,
                                  session_label=session_label,
                                  buffer=buffer,
                                  perm=perm,
-                                 reorganize=reorganize)
+                                 reorganize=reorganize,
+                                 output_format=output_format)
                     
                 # Permuting training labels
                 elif perm:
-                    # Create chained permutation data frames
-                    permutation_cond = pd.DataFrame()
-                    permutation_acc = pd.DataFrame()
-                    permutation_acc_across = pd.DataFrame()
-                    permutation_counts = pd.DataFrame()
-                    # Loop over permutations, each run shuffeling labels in a different manner
-                    for i_perm in np.arange(n_perm):
-                        
-                        # Give message to user:
-                        print('Permutation count: ' + str(i_perm))
-                        
-                        # Classification with permuted labels
-                        result_cond, acc_perm, acc_across_perm, counts_perm = (
-                            RawClassification(base_path=base_path,
-                                              raw_mat=raw_mat,
-                                              cond=cond,
-                                              train_mask=train_mask,
-                                              classifier=classifier,
-                                              n_bins=n_bins,
-                                              x_val_split=x_val_split,
-                                              balancing_option=balancing_option,
-                                              balance_strategy=balance_strategy,
-                                              buffering=buffering,
-                                              testset_buffer=testset_buffer,
-                                              perm=perm)
-                            )
-                        # Add variable of permutation
-                        result_cond['i_perm'] = i_perm
-                        counts_perm['i_perm'] = i_perm
-                        # Chain permutation results to one data frame
-                        permutation_cond = permutation_cond.append(result_cond, ignore_index = True)
-                        permutation_acc = np.append(permutation_acc, acc_perm)
-                        permutation_acc_across = np.append(permutation_acc_across, acc_across_perm)
-                        permutation_counts = permutation_counts.append(counts_perm, ignore_index = True)
-                        
-                    # ===
-                    # Create output
-                    # ===
-                    
-                    # Give message to user
-                    print('Saving output...')
-                    
-                    CreateOutput(base_path=base_path,
-                                 train_test_modality='train-raw_test-raw',
-                                 conditions=permutation_cond,
-                                 n_bins=n_bins,
-                                 sub_id=sub_id,
-                                 mask_seg=mask_seg,
-                                 mask_index=mask_index,
-                                 classifier=classifier,
-                                 smoothing_fwhm=smoothing_fwhm,
-                                 essential_confounds=essential_confounds,
-                                 detrend=detrend,
-                                 high_pass=high_pass,
-                                 ext_std_thres=ext_std_thres,
-                                 standardize=standardize,
-                                 event_file=event_file,
-                                 balancing_option=balancing_option,
-                                 balance_strategy=balance_strategy,
-                                 x_val_split=x_val_split,
-                                 testset_buffer=testset_buffer,
-                                 proba_cols=proba_cols,
-                                 cor_cols=cor_cols,
-                                 event_counts=permutation_counts,
-                                 accuracy=permutation_acc,
-                                 accuracy_across=permutation_acc_across,
-                                 session_label=session_label,
-                                 buffer=buffer,
-                                 perm=perm,
-                                 reorganize=reorganize)
+                    # Output files (in case of checkpoint, a restarted job skips calls
+                    # whose outputs were written with the same parameters)
+                    perm_files = GetOutputFiles(
+                        GetOutputFilePattern(base_path=base_path,
+                                             train_test_modality='train-raw_test-raw',
+                                             sub_id=sub_id,
+                                             event_file=event_file,
+                                             mask_index=mask_index,
+                                             x_val_split=x_val_split,
+                                             classifier=classifier,
+                                             balancing_option=balancing_option,
+                                             buffer=buffer,
+                                             perm=perm,
+                                             within_session=None,
+                                             reorganize=reorganize),
+                        perm=perm,
+                        output_format=output_format,
+                        perm_output=perm_output)
+                    # Classification with permuted labels (chained over all permutations)
+                    perm_result = RawPermutation(base_path=base_path,
+                                                 sub_id=sub_id,
+                                                 mask_index=mask_index,
+                                                 raw_mat=raw_mat,
+                                                 gram=gram,
+                                                 logreg_solver=logreg_solver,
+                                                 cond=cond,
+                                                 train_mask=train_mask,
+                                                 classifier=classifier,
+                                                 n_bins=n_bins,
+                                                 x_val_split=x_val_split,
+                                                 balancing_option=balancing_option,
+                                                 balance_strategy=balance_strategy,
+                                                 n_perm=n_perm,
+                                                 buffering=buffering,
+                                                 testset_buffer=testset_buffer,
+                                                 perm_mode=perm_mode,
+                                                 perm_batch_size=perm_batch_size,
+                                                 n_jobs=n_jobs,
+                                                 warm_start=warm_start,
+                                                 split_jobs=split_jobs,
+                                                 n_threads=n_threads,
+                                                 checkpoint=checkpoint,
+                                                 out_files=perm_files)
+                    if perm_result is not None:
+                        (permutation_cond, permutation_acc, permutation_acc_across,
+                         permutation_counts, checkpoint_dir,
+                         checkpoint_key) = perm_result
+
+                        # ===
+                        # Create output
+                        # ===
+
+                        # Give message to user
+                        print('Saving output...')
+
+                        CreateOutput(base_path=base_path,
+                                     train_test_modality='train-raw_test-raw',
+                                     conditions=permutation_cond,
+                                     n_bins=n_bins,
+                                     sub_id=sub_id,
+                                     mask_seg=mask_seg,
+                                     mask_index=mask_index,
+                                     classifier=classifier,
+                                     smoothing_fwhm=smoothing_fwhm,
+                                     essential_confounds=essential_confounds,
+                                     detrend=detrend,
+                                     high_pass=high_pass,
+                                     ext_std_thres=ext_std_thres,
+                                     standardize=standardize,
+                                     event_file=event_file,
+                                     balancing_option=balancing_option,
+                                     balance_strategy=balance_strategy,
+                                     x_val_split=x_val_split,
+                                     testset_buffer=testset_buffer,
+                                     proba_cols=proba_cols,
+                                     cor_cols=cor_cols,
+                                     event_counts=permutation_counts,
+                                     accuracy=permutation_acc,
+                                     accuracy_across=permutation_acc_across,
+                                     session_label=session_label,
+                                     buffer=buffer,
+                                     perm=perm,
+                                     reorganize=reorganize,
+                                     output_format=output_format,
+                                     perm_output=perm_output)
+                        # Outputs are marked as complete (key of run) before checkpoint is
+                        # removed
+                        if checkpoint:
+                            SavePermDone(key=checkpoint_key, out_files=perm_files)
+                            RemovePermCheckpoint(checkpoint_dir)
                     
             
     elif not buffering:
@@ -557,6 +733,9 @@ def main(base_path,
                     result_cond, acc, acc_across, counts = (
                         RawClassification(base_path=base_path,
                                           raw_mat=raw_mat,
+                                          gram=gram,
+                                          logreg_solver=logreg_solver,
+                                          split_jobs=split_jobs,
                                           cond=cond,
                                           train_mask=train_mask,
                                           classifier=classifier,
@@ -597,74 +776,95 @@ def main(base_path,
                                  session_label=session_label,
                                  perm=perm,
                                  within_session=i_session,
-                                 reorganize=reorganize)
+                                 reorganize=reorganize,
+                                 output_format=output_format)
                     
                 elif perm:
-                    # Create chained permutation data frames
-                    permutation_cond = pd.DataFrame()
-                    permutation_acc = pd.DataFrame()
-                    permutation_acc_across = pd.DataFrame()
-                    permutation_counts = pd.DataFrame()
-                    # Loop over permutations, each run shuffeling labels in a different manner
-                    for i_perm in np.arange(n_perm):
-                        
-                        # Give message to user:
-                        print('Permutation count: ' + str(i_perm))
-                        
-                        # Classification with permuted labels
-                        result_cond, acc_perm, acc_across_perm, counts_perm = (
-                            RawClassification(base_path=base_path,
-                                              raw_mat=raw_mat,
-                                              cond=cond,
-                                              train_mask=train_mask,
-                                              classifier=classifier,
-                                              n_bins=n_bins,
-                                              x_val_split=x_val_split,
-                                              balancing_option=balancing_option,
-                                              balance_strategy=balance_strategy,
-                                              buffering=buffering,
-                                              testset_buffer=testset_buffer,
-                                              perm=perm)
-                            )
-                        # Add variable of permutation
-                        result_cond['i_perm'] = i_perm
-                        counts_perm['i_perm'] = i_perm
-                        # Chain permutation results to one data frame
-                        permutation_cond = permutation_cond.append(result_cond, ignore_index = True)
-                        permutation_acc = np.append(permutation_acc, acc_perm)
-                        permutation_acc_across = np.append(permutation_acc_across, acc_across_perm)
-                        permutation_counts = permutation_counts.append(counts_perm, ignore_index = True)
+                    # Output files (in case of checkpoint, a restarted job skips calls
+                    # whose outputs were written with the same parameters)
+                    perm_files = GetOutputFiles(
+                        GetOutputFilePattern(base_path=base_path,
+                                             train_test_modality='train-raw_test-raw',
+                                             sub_id=sub_id,
+                                             event_file=event_file,
+                                             mask_index=mask_index,
+                                             x_val_split=x_val_split,
+                                             classifier=classifier,
+                                             balancing_option=balancing_option,
+                                             buffer=None,
+                                             perm=perm,
+                                             within_session=i_session,
+                                             reorganize=reorganize),
+                        perm=perm,
+                        output_format=output_format,
+                        perm_output=perm_output)
+                    # Classification with permuted labels (chained over all permutations)
+                    perm_result = RawPermutation(base_path=base_path,
+                                                 sub_id=sub_id,
+                                                 mask_index=mask_index,
+                                                 raw_mat=raw_mat,
+                                                 gram=gram,
+                                                 logreg_solver=logreg_solver,
+                                                 cond=cond,
+                                                 train_mask=train_mask,
+                                                 classifier=classifier,
+                                                 n_bins=n_bins,
+                                                 x_val_split=x_val_split,
+                                                 balancing_option=balancing_option,
+                                                 balance_strategy=balance_strategy,
+                                                 n_perm=n_perm,
+                                                 buffering=buffering,
+                                                 testset_buffer=testset_buffer,
+                                                 perm_mode=perm_mode,
+                                                 perm_batch_size=perm_batch_size,
+                                                 n_jobs=n_jobs,
+                                                 warm_start=warm_start,
+                                                 split_jobs=split_jobs,
+                                                 n_threads=n_threads,
+                                                 checkpoint=checkpoint,
+                                                 out_files=perm_files)
+                    if perm_result is not None:
+                        (permutation_cond, permutation_acc, permutation_acc_across,
+                         permutation_counts, checkpoint_dir,
+                         checkpoint_key) = perm_result
 
-                    # Give message to user
-                    print('Saving output...')
-                    CreateOutput(base_path=base_path,
-                                 train_test_modality='train-raw_test-raw',
-                                 conditions=permutation_cond,
-                                 n_bins=n_bins,
-                                 sub_id=sub_id,
-                                 mask_seg=mask_seg,
-                                 mask_index=mask_index,
-                                 classifier=classifier,
-                                 smoothing_fwhm=smoothing_fwhm,
-                                 essential_confounds=essential_confounds,
-                                 detrend=detrend,
-                                 high_pass=high_pass,
-                                 ext_std_thres=ext_std_thres,
-                                 standardize=standardize,
-                                 event_file=event_file,
-                                 balancing_option=balancing_option,
-                                 balance_strategy=balance_strategy,
-                                 x_val_split=x_val_split,
-                                 testset_buffer=testset_buffer,
-                                 proba_cols=proba_cols,
-                                 cor_cols=cor_cols,
-                                 event_counts=permutation_counts,
-                                 accuracy=permutation_acc,
-                                 accuracy_across=permutation_acc_across,
-                                 session_label=session_label,
-                                 perm=perm,
-                                 within_session=i_session,
-                                 reorganize=reorganize)
+                        # Give message to user
+                        print('Saving output...')
+                        CreateOutput(base_path=base_path,
+                                     train_test_modality='train-raw_test-raw',
+                                     conditions=permutation_cond,
+                                     n_bins=n_bins,
+                                     sub_id=sub_id,
+                                     mask_seg=mask_seg,
+                                     mask_index=mask_index,
+                                     classifier=classifier,
+                                     smoothing_fwhm=smoothing_fwhm,
+                                     essential_confounds=essential_confounds,
+                                     detrend=detrend,
+                                     high_pass=high_pass,
+                                     ext_std_thres=ext_std_thres,
+                                     standardize=standardize,
+                                     event_file=event_file,
+                                     balancing_option=balancing_option,
+                                     balance_strategy=balance_strategy,
+                                     x_val_split=x_val_split,
+                                     testset_buffer=testset_buffer,
+                                     proba_cols=proba_cols,
+                                     cor_cols=cor_cols,
+                                     event_counts=permutation_counts,
+                                     accuracy=permutation_acc,
+                                     accuracy_across=permutation_acc_across,
+                                     session_label=session_label,
+                                     perm=perm,
+                                     within_session=i_session,
+                                     reorganize=reorganize,
+                                     output_format=output_format,
+                                     perm_output=perm_output)
+                        # Outputs are marked as complete (key of run) before checkpoint is
+                        # removed
+                        if checkpoint:
+                            SavePermDone(key=checkpoint_key, out_files=perm_files)
+                            RemovePermCheckpoint(checkpoint_dir)
                     
         elif not within_session:
             
@@ -675,6 +875,9 @@ def main(base_path,
                 # Classify betas (includes leave-one-out)
                 result_cond, acc, acc_across, counts = RawClassification(base_path=base_path,
                                                                          raw_mat=raw_mat,
+                                                                         gram=gram,
+                                                                         logreg_solver=logreg_solver,
+                                                                         split_jobs=split_jobs,
                                                                          cond=cond,
                                                                          train_mask=train_mask,
                                                                          classifier=classifier,
@@ -718,257 +921,369 @@ def main(base_path,
                              accuracy_across=acc_across,
                              session_label=session_label,
                              perm=perm,
-                             reorganize=reorganize)
+                             reorganize=reorganize,
+                             output_format=output_format)
                 
             elif perm:
-                # Create chained permutation data frames
-                permutation_cond = pd.DataFrame()
-                permutation_acc = pd.DataFrame()
-                permutation_acc_across = pd.DataFrame()
-                permutation_counts = pd.DataFrame()
-                # Loop over permutations, each run shuffeling labels in a different manner
-                for i_perm in np.arange(n_perm):
-                    
-                    # Give message to user:
-                    print('Permutation count: ' + str(i_perm))
-                    
-                    # Classification with permuted labels
-                    result_cond, acc_perm, acc_across_perm, counts_perm = (
-                        RawClassification(base_path=base_path,
-                                          raw_mat=raw_mat,
-                                          cond=cond,
-                                          train_mask=train_mask,
-                                          classifier=classifier,
-                                          n_bins=n_bins,
-                                          x_val_split=x_val_split,
-                                          balancing_option=balancing_option,
-                                          balance_strategy=balance_strategy,
-                                          buffering=buffering,
-                                          testset_buffer=testset_buffer,
-                                          perm=perm)
-                        )
-                    # Add variable of permutation
-                    result_cond['i_perm'] = i_perm
-                    counts_perm['i_perm'] = i_perm
-                    # Chain permutation results to one data frame
-                    permutation_cond = permutation_cond.append(result_cond, ignore_index = True)
-                    permutation_acc = np.append(permutation_acc, acc_perm)
-                    permutation_acc_across = np.append(permutation_acc_across, acc_across_perm)
-                    permutation_counts = permutation_counts.append(counts_perm, ignore_index = True)
-                    
-                # ===
-                # Create output
-                # ===
-                
-                # Give message to user
-                print('Saving output...')
-                
-                CreateOutput(base_path=base_path,
-                             train_test_modality='train-raw_test-raw',
-                             conditions=permutation_cond,
-                             n_bins=n_bins,
-                             sub_id=sub_id,
-                             mask_seg=mask_seg,
-                             mask_index=mask_index,
-                             classifier=classifier,
-                             smoothing_fwhm=smoothing_fwhm,
-                             essential_confounds=essential_confounds,
-                             detrend=detrend,
-                             high_pass=high_pass,
-                             ext_std_thres=ext_std_thres,
-                             standardize=standardize,
-                             event_file=event_file,
-                             balancing_option=balancing_option,
-                             balance_strategy=balance_strategy,
-                             x_val_split=x_val_split,
-                             testset_buffer=testset_buffer,
-                             proba_cols=proba_cols,
-                             cor_cols=cor_cols,
-                             event_counts=permutation_counts,
-                             accuracy=permutation_acc,
-                             accuracy_across=permutation_acc_across,
-                             session_label=session_label,
-                             perm=perm,
-                             reorganize=reorganize)
+                # Output files (in case of checkpoint, a restarted job skips calls
+                # whose outputs were written with the same parameters)
+                perm_files = GetOutputFiles(
+                    GetOutputFilePattern(base_path=base_path,
+                                         train_test_modality='train-raw_test-raw',
+                                         sub_id=sub_id,
+                                         event_file=event_file,
+                                         mask_index=mask_index,
+                                         x_val_split=x_val_split,
+                                         classifier=classifier,
+                                         balancing_option=balancing_option,
+                                         buffer=None,
+                                         perm=perm,
+                                         within_session=None,
+                                         reorganize=reorganize),
+                    perm=perm,
+                    output_format=output_format,
+                    perm_output=perm_output)
+                # Classification with permuted labels (chained over all permutations)
+                perm_result = RawPermutation(base_path=base_path,
+                                             sub_id=sub_id,
+                                             mask_index=mask_index,
+                                             raw_mat=raw_mat,
+                                             gram=gram,
+                                             logreg_solver=logreg_solver,
+                                             cond=cond,
+                                             train_mask=train_mask,
+                                             classifier=classifier,
+                                             n_bins=n_bins,
+                                             x_val_split=x_val_split,
+                                             balancing_option=balancing_option,
+                                             balance_strategy=balance_strategy,
+                                             n_perm=n_perm,
+                                             buffering=buffering,
+                                             testset_buffer=testset_buffer,
+                                             perm_mode=perm_mode,
+                                             perm_batch_size=perm_batch_size,
+                                             n_jobs=n_jobs,
+                                             warm_start=warm_start,
+                                             split_jobs=split_jobs,
+                                             n_threads=n_threads,
+                                             checkpoint=checkpoint,
+                                             out_files=perm_files)
+                if perm_result is not None:
+                    (permutation_cond, permutation_acc, permutation_acc_across,
+                     permutation_counts, checkpoint_dir,
+                     checkpoint_key) = perm_result
+
+                    # ===
+                    # Create output
+                    # ===
+
+                    # Give message to user
+                    print('Saving output...')
+
+                    CreateOutput(base_path=base_path,
+                                 train_test_modality='train-raw_test-raw',
+                                 conditions=permutation_cond,
+                                 n_bins=n_bins,
+                                 sub_id=sub_id,
+                                 mask_seg=mask_seg,
+                                 mask_index=mask_index,
+                                 classifier=classifier,
+                                 smoothing_fwhm=smoothing_fwhm,
+                                 essential_confounds=essential_confounds,
+                                 detrend=detrend,
+                                 high_pass=high_pass,
+                                 ext_std_thres=ext_std_thres,
+                                 standardize=standardize,
+                                 event_file=event_file,
+                                 balancing_option=balancing_option,
+                                 balance_strategy=balance_strategy,
+                                 x_val_split=x_val_split,
+                                 testset_buffer=testset_buffer,
+                                 proba_cols=proba_cols,
+                                 cor_cols=cor_cols,
+                                 event_counts=permutation_counts,
+                                 accuracy=permutation_acc,
+                                 accuracy_across=permutation_acc_across,
+                                 session_label=session_label,
+                                 perm=perm,
+                                 reorganize=reorganize,
+                                 output_format=output_format,
+                                 perm_output=perm_output)
+                    # Outputs are marked as complete (key of run) before checkpoint is
+                    # removed
+                    if checkpoint:
+                        SavePermDone(key=checkpoint_key, out_files=perm_files)
+                        RemovePermCheckpoint(checkpoint_dir)
     
         print('...done!')
 
 
 
-# # Enable command line parsing of arguments
-parser = argparse.ArgumentParser(description='DAMSON decoding script')
-parser.add_argument('--base_path',
-                    default=None,
-                    type=str,
-                    required=True,
-                    help='path to DAMSON repository',
-                    metavar='BASE_PATH')
-parser.add_argument('--sub_id',
-                    default=None,
-                    type=str,
-                    required=True,
-                    help='participant to be processed (e.g. sub-younger001)',
-                    metavar='SUB_ID')
-parser.add_argument('--mask_seg',
-                    default=None,
-                    type=str,
-                    required=True,
-                    choices=['aseg', 'aparcaseg'],
-                    help='FreeSurfer segmentation type to use (influences mask indices)',
-                    metavar='MASK_SEG')
-parser.add_argument('--mask_index',
-                    nargs='+',
-                    default=None,
-                    type=int,
-                    required=True,
-                    help='Codes of segmentations to use as masks (based on segmentation type, if multiple then masks are combined)',
-                    metavar='MASK_INDEX')
-parser.add_argument('--event_file',
-                    default=None,
-                    type=str,
-                    required=True,
-                    help='(standard) events to be used (e.g. walk-fwd)',
-                    metavar='EVENT_FILE')
-parser.add_argument('--classifier',
-                    default=None,
-                    type=str,
-                    required=True,
-                    choices=['svm', 'logreg'],
-                    help='classifier to use for prediction',
-                    metavar='CLASSIFIER')
-parser.add_argument('--smoothing_fwhm',
-                    default=None,
-                    type=int,
-                    required=True,
-                    help='FWHM of smoothing kernel applied before masking (in mm)',
-                    metavar='FWHM')
-parser.add_argument('--essential_confounds',
-                    default=None,
-                    type=bool,
-                    required=True,
-                    help='Bool if confounds should be narrowed down to motion, noise, and FD',
-                    metavar='ESSENTIAL_CONFOUNDS')
-parser.add_argument('--detrend',
-                    default=None,
-                    type=bool,
-                    required=True,
-                    help='boolean to use "detrend" option for nilearns signal.clean',
-                    metavar='DETREND')
-parser.add_argument('--high_pass',
-                    default=None,
-                    type=float,
-                    required=True,
-                    help='high pass filter value for nilearns signal.clean',
-                    metavar='HIGH_PASS')
-parser.add_argument('--pull_extremes',
-                    default=False,
-                    type=bool,
-                    required=True,
-                    help='boolean to include pulling extreme data towards the mean',
-                    metavar='PULL_EXTREMES')
-parser.add_argument('--ext_std_thres',
-                    default=None,
-                    type=int,
-                    required=True,
-                    help='max std allowed of a value before being pulled towards the mean',
-                    metavar='STD_THRES')
-parser.add_argument('--standardize',
-                    default=None,
-                    type=str,
-                    required=True,
-                    help='standardize argument to nilearns signal.clean (e.g. "zscore")',
-                    metavar='STANDARDIZE')
-parser.add_argument('--n_bins',
-                    default=None,
-                    type=int,
-                    required=True,
-                    help='number of directional bins',
-                    metavar='N_BINS')
-parser.add_argument('--balancing_option',
-                    default=None,
-                    type=str,
-                    required=True,
-                    choices=['downsample', 'upsample', 'SMOTE', 'none'],
-                    help='Type of sampling to balance events',
-                    metavar='BALANCING_OPTION')
-parser.add_argument('--balance_strategy',
-                    default=None,
-                    type=str,
-                    required=True,
-                    choices=['longest', 'random'],
-                    help='way to chose events to up- or downsample during balancing',
-                    metavar='BALANCE_STRATEGY')
-parser.add_argument('--x_val_split',
-                    default=None,
-                    type=str,
-                    required=True,
-                    choices=['fold', 'session', 'sub_fold'],
-                    help='way to chose folds for cross-validation',
-                    metavar='X_VAL_SPLIT')
-parser.add_argument('--buffering',
-                    dest='buffering',
-                    action='store_true',
-                    default=False,
-                    help='If flag is used buffering will be applied to training set (separate odd and even events)')
-parser.add_argument('--testset_buffer',
-                    dest='testset_buffer',
-                    action='store_true',
-                    default=False,
-                    help='If flag is used not only the training set will be buffered, but also the testing set')
-parser.add_argument('--perm',
-                    dest='perm',
-                    action='store_true',
-                    default=False,
-                    help='boolean to permute labels to assess random distribution of predicitons')
-parser.add_argument('--n_perm',
-                    default=0,
-                    type=int,
-                    required=False,
-                    help='number of permutations to perform',
-                    metavar='N_PERM')
-parser.add_argument('--within_session',
-                    dest='within_session',
-                    action='store_true',
-                    default=False,
-                    help='boolean to perform corss validation only within the same session')
-parser.add_argument('--n_folds_within',
-                    default=4,
-                    choices=[2,3,4],
-                    type=int,
-                    required=False,
-                    help='Number of folds within a session (2, 3, or 4) if within session decoding is performed',
-                    metavar='N_FOLDS_WITHIN')
-parser.add_argument('--reorganize',
-                    dest='reorganize',
-                    action='store_true',
-                    default=False,
-                    help='boolean to abandon classic split of session at half of all events and instead put half of all events of one event type into each fold')
-args = parser.parse_args()
+# Only parse command line arguments when run as a script (DecodeMask is also
+# imported by batch_classifier.py)
+if __name__ == '__main__':
+    # # Enable command line parsing of arguments
+    parser = argparse.ArgumentParser(description='DAMSON decoding script')
+    parser.add_argument('--base_path',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='path to DAMSON repository',
+                        metavar='BASE_PATH')
+    parser.add_argument('--sub_id',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='participant to be processed (e.g. sub-younger001)',
+                        metavar='SUB_ID')
+    parser.add_argument('--mask_seg',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['aseg', 'aparcaseg'],
+                        help='FreeSurfer segmentation type to use (influences mask indices)',
+                        metavar='MASK_SEG')
+    mask_group = parser.add_mutually_exclusive_group(required=True)
+    mask_group.add_argument('--mask_index',
+                            nargs='+',
+                            default=None,
+                            type=int,
+                            help='Codes of segmentations to use as masks (based on segmentation type, if multiple then masks are combined)',
+                            metavar='MASK_INDEX')
+    mask_group.add_argument('--mask_list',
+                            nargs='+',
+                            default=None,
+                            type=lambda x: [int(i) for i in x.split()],
+                            help='Multiple masks decoded one after another while loading functional data only once, each given as quoted codes of segmentations (e.g. "17 53" "1006 2006")',
+                            metavar='MASK_LIST')
+    parser.add_argument('--event_file',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='(standard) events to be used (e.g. walk-fwd)',
+                        metavar='EVENT_FILE')
+    parser.add_argument('--classifier',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['svm', 'svm-precomputed', 'logreg'],
+                        help='classifier to use for prediction',
+                        metavar='CLASSIFIER')
+    parser.add_argument('--smoothing_fwhm',
+                        default=None,
+                        type=int,
+                        required=True,
+                        help='FWHM of smoothing kernel applied before masking (in mm)',
+                        metavar='FWHM')
+    parser.add_argument('--essential_confounds',
+                        default=None,
+                        type=bool,
+                        required=True,
+                        help='Bool if confounds should be narrowed down to motion, noise, and FD',
+                        metavar='ESSENTIAL_CONFOUNDS')
+    parser.add_argument('--detrend',
+                        default=None,
+                        type=bool,
+                        required=True,
+                        help='boolean to use "detrend" option for nilearns signal.clean',
+                        metavar='DETREND')
+    parser.add_argument('--high_pass',
+                        default=None,
+                        type=float,
+                        required=True,
+                        help='high pass filter value for nilearns signal.clean',
+                        metavar='HIGH_PASS')
+    parser.add_argument('--pull_extremes',
+                        default=False,
+                        type=lambda x: x == 'True',
+                        required=True,
+                        help='True to include pulling extreme data towards the mean',
+                        metavar='PULL_EXTREMES')
+    parser.add_argument('--ext_std_thres',
+                        default=None,
+                        type=int,
+                        required=True,
+                        help='max std allowed of a value before being pulled towards the mean',
+                        metavar='STD_THRES')
+    parser.add_argument('--standardize',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='standardize argument to nilearns signal.clean (e.g. "zscore")',
+                        metavar='STANDARDIZE')
+    parser.add_argument('--n_bins',
+                        default=None,
+                        type=int,
+                        required=True,
+                        help='number of directional bins',
+                        metavar='N_BINS')
+    parser.add_argument('--balancing_option',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['downsample', 'upsample', 'SMOTE', 'none'],
+                        help='Type of sampling to balance events',
+                        metavar='BALANCING_OPTION')
+    parser.add_argument('--balance_strategy',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['longest', 'random'],
+                        help='way to chose events to up- or downsample during balancing',
+                        metavar='BALANCE_STRATEGY')
+    parser.add_argument('--x_val_split',
+                        default=None,
+                        type=str,
+                        required=True,
+                        choices=['fold', 'session', 'sub_fold'],
+                        help='way to chose folds for cross-validation',
+                        metavar='X_VAL_SPLIT')
+    parser.add_argument('--buffering',
+                        dest='buffering',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used buffering will be applied to training set (separate odd and even events)')
+    parser.add_argument('--testset_buffer',
+                        dest='testset_buffer',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used not only the training set will be buffered, but also the testing set')
+    parser.add_argument('--perm',
+                        dest='perm',
+                        action='store_true',
+                        default=False,
+                        help='boolean to permute labels to assess random distribution of predicitons')
+    parser.add_argument('--n_perm',
+                        default=0,
+                        type=int,
+                        required=False,
+                        help='number of permutations to perform',
+                        metavar='N_PERM')
+    parser.add_argument('--within_session',
+                        dest='within_session',
+                        action='store_true',
+                        default=False,
+                        help='boolean to perform corss validation only within the same session')
+    parser.add_argument('--n_folds_within',
+                        default=4,
+                        choices=[2,3,4],
+                        type=int,
+                        required=False,
+                        help='Number of folds within a session (2, 3, or 4) if within session decoding is performed',
+                        metavar='N_FOLDS_WITHIN')
+    parser.add_argument('--reorganize',
+                        dest='reorganize',
+                        action='store_true',
+                        default=False,
+                        help='boolean to abandon classic split of session at half of all events and instead put half of all events of one event type into each fold')
+    parser.add_argument('--perm_mode',
+                        default='loop',
+                        type=str,
+                        required=False,
+                        choices=['loop', 'batch'],
+                        help='way to run permutations ("loop": one classification per permutation, "batch": chunks of permutations share splits and balancing, logistic regressions of all permutations of a chunk are fitted at once)',
+                        metavar='PERM_MODE')
+    parser.add_argument('--perm_batch_size',
+                        default=100,
+                        type=int,
+                        required=False,
+                        help='number of permutations of a chunk (fitted together if --perm_mode batch, sharing the cache of --warm_start if --perm_mode loop)',
+                        metavar='PERM_BATCH_SIZE')
+    parser.add_argument('--n_jobs',
+                        default=1,
+                        type=int,
+                        required=False,
+                        help='number of processes permutations are distributed over (results do not depend on it)',
+                        metavar='N_JOBS')
+    parser.add_argument('--use_cache',
+                        dest='use_cache',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used preprocessed raw data is stored in (and loaded from) .../derivatives/decoding/cache')
+    parser.add_argument('--logreg_solver',
+                        default='full',
+                        type=str,
+                        required=False,
+                        choices=['full', 'sample'],
+                        help='space logistic regression is fitted in ("full": all voxels, "sample": basis spanned by training examples of each split, same solution for L2 penalty but faster if there are more voxels than examples)',
+                        metavar='LOGREG_SOLVER')
+    parser.add_argument('--warm_start',
+                        default='off',
+                        type=str,
+                        required=False,
+                        choices=['off', 'on', 'check'],
+                        help='start logistic regression of each permutation from the solution of the previous permutation of the same hold-out split ("on": a warm fit is refined until the largest entry of the gradient of the penalized loss is below the tolerance of LogisticRegression and fitted again from zero if that fails (fits from zero usually stop before reaching that criterion). Predictions are not guaranteed to be identical to a fit from zero: for events within solver tolerance of a tie between classes they can differ, since a fit from zero only stops within its own tolerance. "check" additionally fits from zero, counts fits with different predictions, and keeps the fit from zero, so it saves no time and is only meant to measure agreement)',
+                        metavar='WARM_START')
+    parser.add_argument('--split_jobs',
+                        default=1,
+                        type=int,
+                        required=False,
+                        help='number of threads hold-out splits are classified in (results do not depend on it, cannot be combined with --warm_start)',
+                        metavar='SPLIT_JOBS')
+    parser.add_argument('--n_cpus',
+                        default=None,
+                        type=int,
+                        required=False,
+                        help='number of CPUs of the job, BLAS/OpenMP threads of each worker are limited to N_CPUS / (N_JOBS * SPLIT_JOBS) (default: all CPUs available to the process)',
+                        metavar='N_CPUS')
+    parser.add_argument('--output_format',
+                        default='tsv',
+                        type=str,
+                        required=False,
+                        choices=['tsv', 'parquet'],
+                        help='file format of outputs ("parquet": typed columns with dictionary-encoded parameters, smaller and faster to write and load, requires pyarrow; load with OutputTable.ReadOutputTable)',
+                        metavar='OUTPUT_FORMAT')
+    parser.add_argument('--perm_output',
+                        default='full',
+                        type=str,
+                        required=False,
+                        choices=['full', 'summary'],
+                        help='outputs of permutations ("full": _pred file with every testing event of every permutation incl. probabilities and correlations, "summary": _events file describing testing events once and _predmat.npy holding predictions as permutation x event matrix (int8), accuracies and confusion functions as in "full")',
+                        metavar='PERM_OUTPUT')
+    parser.add_argument('--checkpoint',
+                        dest='checkpoint',
+                        action='store_true',
+                        default=False,
+                        help='If flag is used results of permutations are written to .../derivatives/decoding/checkpoint as soon as a chunk is finished, a restarted job with the same parameters resumes from the last finished chunk and skips calls whose outputs were written with the same parameters and data (marked by <output pattern>_checkpoint.json next to the outputs; checkpoint is removed once outputs are written)')
+    args = parser.parse_args()
 
-# Call main function
-main(base_path=args.base_path,
-     sub_id=args.sub_id,
-     mask_seg=args.mask_seg,
-     mask_index=args.mask_index,
-     event_file=args.event_file,
-     classifier=args.classifier,
-     smoothing_fwhm=args.smoothing_fwhm,
-     essential_confounds=args.essential_confounds,
-     detrend=args.detrend,
-     high_pass=args.high_pass,
-     ext_std_thres=args.ext_std_thres,
-     standardize=args.standardize,
-     n_bins=args.n_bins,
-     balancing_option=args.balancing_option,
-     balance_strategy=args.balance_strategy,
-     x_val_split=args.x_val_split,
-     buffering=args.buffering,
-     testset_buffer=args.testset_buffer,
-     perm=args.perm,
-     n_perm=args.n_perm,
-     within_session=args.within_session,
-     n_folds_within=args.n_folds_within,
-     reorganize=args.reorganize)
+    # Call main function
+    main(base_path=args.base_path,
+         sub_id=args.sub_id,
+         mask_seg=args.mask_seg,
+         mask_index=args.mask_index,
+         event_file=args.event_file,
+         classifier=args.classifier,
+         smoothing_fwhm=args.smoothing_fwhm,
+         essential_confounds=args.essential_confounds,
+         detrend=args.detrend,
+         high_pass=args.high_pass,
+         pull_extremes=args.pull_extremes,
+         ext_std_thres=args.ext_std_thres,
+         standardize=args.standardize,
+         n_bins=args.n_bins,
+         balancing_option=args.balancing_option,
+         balance_strategy=args.balance_strategy,
+         x_val_split=args.x_val_split,
+         buffering=args.buffering,
+         testset_buffer=args.testset_buffer,
+         perm=args.perm,
+         n_perm=args.n_perm,
+         within_session=args.within_session,
+         n_folds_within=args.n_folds_within,
+         reorganize=args.reorganize,
+         perm_mode=args.perm_mode,
+         perm_batch_size=args.perm_batch_size,
+         n_jobs=args.n_jobs,
+         use_cache=args.use_cache,
+         mask_list=args.mask_list,
+         logreg_solver=args.logreg_solver,
+         warm_start=args.warm_start,
+         split_jobs=args.split_jobs,
+         n_cpus=args.n_cpus,
+         output_format=args.output_format,
+         checkpoint=args.checkpoint,
+         perm_output=args.perm_output)
 
 
 # python3 classifier.py --base_path /home/mpib/koch/damson --sub_id sub-younger002 --mask brain_mask --event_file walk-fwd --smoothing_fwhm 3 --detrend True --high_pass 0.0078125 --ext_std_thres 8 --standardize zscore --n_bins 6 --downsample True --downsample_type longest --x_val_split fold
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 13:18:30 2026
+
+@author: koch
+"""
+
+import os
+import sys
+import glob
+import argparse
+
+
+# Function to stage uncompressed copies of all fmriprep outputs used for 
+# decoding (functional images and segmentations) of a participant
+def main(base_path,
+         sub_id,
+         seg_types=['aparcaseg', 'aseg']):
+
+    # Import own functions
+    sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
+    from StageNifti import StageNifti
+
+    # Get files to stage (both sessions)
+    func_dir = os.path.join(base_path,
+                            'derivatives',
+                            'preprocessing',
+                            'fmriprep',
+                            sub_id,
+                            '*',
+                            'func')
+    files = glob.glob(os.path.join(func_dir,
+                                   '*task-nav_space-T1w_desc-preproc_bold.nii.gz'))
+    for seg_type in seg_types:
+        files = files + glob.glob(os.path.join(func_dir,
+                                               '*task-nav*space-T1w_desc-' +
+                                               seg_type + '*.nii.gz'))
+    files.sort()
+
+    # Give message to user
+    print('Staging uncompressed images...')
+    for file in files:
+        print('\t' + os.path.basename(file))
+        StageNifti(base_path, file)
+    print('...done!')
+
+
+# Enable command line parsing of arguments
+parser = argparse.ArgumentParser(description='Stage uncompressed copies of fmriprep images for decoding')
+parser.add_argument('--base_path',
+                    default=None,
+                    type=str,
+                    required=True,
+                    help='path to DAMSON repository',
+                    metavar='BASE_PATH')
+parser.add_argument('--sub_id',
+                    default=None,
+                    type=str,
+                    required=True,
+                    help='participant to be processed (e.g. sub-younger001)',
+                    metavar='SUB_ID')
+parser.add_argument('--seg_types',
+                    nargs='+',
+                    default=['aparcaseg', 'aseg'],
+                    type=str,
+                    required=False,
+                    help='segmentations to stage',
+                    metavar='SEG_TYPES')
+args = parser.parse_args()
+
+# Call main function
+main(base_path=args.base_path,
+     sub_id=args.sub_id,
+     seg_types=args.seg_types)
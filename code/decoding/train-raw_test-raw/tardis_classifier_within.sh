@@ -105,34 +105,44 @@ for SUB in ${SUB_LIST}; do
 	echo "source /etc/bash_completion.d/virtualenvwrapper" >> job.slurm
 	echo "workon damson" >> job.slurm
 
-	# Loop over given mask combinations
+	# Stage uncompressed copies of functional images and segmentations (only
+	# done once, later jobs memory-map them)
+	echo "python3 ${PATH_CODE}/stage_bold.py \
+	--base_path ${PATH_REP} \
+	--sub_id ${SUB}" >> job.slurm
+
+	# Pass all mask combinations at once (functional data is loaded only once)
+	MASK_ARGS=""
 	for ((i = 0; i < ${#MASK_LIST[@]}; i++)); do
-
-		# Within session x-val, unbuffered
-		echo "python3 ${PATH_CODE}/classifier.py \
-		--base_path ${PATH_REP} \
-		--sub_id ${SUB} \
-		--mask_seg ${MASK_SEG} \
-		--mask_index ${MASK_LIST[$i]} \
-		--event_file ${EVENT_FILE} \
-		--classifier ${CLASSIFIER} \
-		--smoothing_fwhm ${SMOOTHING_FWHM} \
-		--essential_confounds ${ESSENTIAL_CONFOUNDS} \
-		--detrend ${DETREND} \
-		--high_pass ${HIGH_PASS} \
-		--pull_extremes ${PULL_EXTREMES} \
-		--ext_std_thres ${EXT_STD_THRES} \
-		--standardize ${STANDARDIZE} \
-		--n_bins ${N_BINS} \
-		--balancing_option ${BALANCING_OPTION} \
-		--balance_strategy ${BALANCE_STRATEGY} \
-		--x_val_split 'sub_fold' \
-		--within_session \
-		--n_folds_within ${N_FOLDS_WITHIN} \
-		--reorganize" >> job.slurm
-
+		MASK_ARGS="${MASK_ARGS} '${MASK_LIST[$i]}'"
 	done
 
+	# Within session x-val, unbuffered
+	echo "python3 ${PATH_CODE}/classifier.py \
+	--base_path ${PATH_REP} \
+	--sub_id ${SUB} \
+	--mask_seg ${MASK_SEG} \
+	--mask_list ${MASK_ARGS} \
+	--event_file ${EVENT_FILE} \
+	--classifier ${CLASSIFIER} \
+	--smoothing_fwhm ${SMOOTHING_FWHM} \
+	--essential_confounds ${ESSENTIAL_CONFOUNDS} \
+	--detrend ${DETREND} \
+	--high_pass ${HIGH_PASS} \
+	--pull_extremes ${PULL_EXTREMES} \
+	--ext_std_thres ${EXT_STD_THRES} \
+	--standardize ${STANDARDIZE} \
+	--n_bins ${N_BINS} \
+	--balancing_option ${BALANCING_OPTION} \
+	--balance_strategy ${BALANCE_STRATEGY} \
+	--x_val_split 'sub_fold' \
+	--within_session \
+	--n_folds_within ${N_FOLDS_WITHIN} \
+	--reorganize \
+	--use_cache \
+	--split_jobs ${N_CPUS} \
+	--n_cpus ${N_CPUS}" >> job.slurm
+
 
 	# submit job to cluster queue and remove it to avoid confusion:
 	sbatch job.slurm
@@ -10,62 +10,63 @@ import sys
 import pandas as pd
 import numpy as np
 import os
-import copy
 
 
 # Average all TRs in which the same event happened and adjust conditions file
-# accodingly
+# accodingly (raw_mat of caller is not changed)
 def AverageMultiTrEvents(cond,
                          raw_mat):
 
     # Rest index of data frame
     cond = cond.reset_index(drop=True)
 
-    # Create adjusted conditions file to return
-    cond_adj = copy.deepcopy(cond)
-    # Add end_tr column marking the last TR this event happened in
-    cond_adj['tr_end'] = 0
-    cond_adj['tr_adj_end'] = 0
-    # Add column stating inclusion (will be false for multiple entries)
-    cond_adj['inclusion'] = True
-
-    # Go through events and find events which happened in multiple TRs
-    for event_count, event_id in enumerate(np.unique(cond['event'])):
-
-        # in case there are multiple entries for the same event
-        if len(cond.loc[cond['event'] == event_id, 'event']) > 1:
-            # Get location of all multiple event entries
-            multi_loc = np.where(cond['event'] == event_id)[0]
-
-            # Add last TR of same event to new columns
-            cond_adj.loc[multi_loc[0], 'tr_end'] = (
-                cond.loc[multi_loc[len(multi_loc)-1], 'tr'])
-            cond_adj.loc[multi_loc[0], 'tr_adj_end'] = (
-                cond.loc[multi_loc[len(multi_loc)-1], 'tr_adj'])
-
-            # Mark entries for exclusion
-            cond_adj.loc[multi_loc[1:], 'inclusion'] = False
-
-            # Average patterns for multi entry events and store in first entry
-            raw_mat[multi_loc[0]] = np.mean(raw_mat[multi_loc], axis=0)
+    # Sort TRs by event (stable, so TRs of the same event stay in temporal
+    # order). TRs without event are never averaged
+    event = np.array(cond['event'], dtype=float)
+    event_loc = np.where(~np.isnan(event))[0]
+    event_loc = event_loc[np.argsort(event[event_loc], kind='stable')]
+
+    # Find segments of sorted TRs belonging to the same event
+    seg_start = np.where(np.diff(event[event_loc], prepend=np.nan) != 0)[0]
+    seg_len = np.diff(np.append(seg_start, len(event_loc)))
+    # First and last TR of each event
+    first_loc = event_loc[seg_start]
+    last_loc = event_loc[seg_start + seg_len - 1]
+    # Only events which happened in multiple TRs are averaged
+    multi = seg_len > 1
+
+    # Add end_tr column marking the last TR this event happened in (TR itself
+    # for all events which happened during a single TR)
+    tr_end = np.array(cond['tr'])
+    tr_adj_end = np.array(cond['tr_adj'])
+    tr_end[first_loc[multi]] = tr_end[last_loc[multi]]
+    tr_adj_end[first_loc[multi]] = tr_adj_end[last_loc[multi]]
 
     # Exclude all multiple event condition entries and TR vectors which are not
     # the first
-    inclusion_mask = np.array(cond_adj['inclusion'])
+    inclusion_mask = np.ones(len(cond), dtype=bool)
+    is_first = np.zeros(len(event_loc), dtype=bool)
+    is_first[seg_start] = True
+    inclusion_mask[event_loc[~is_first]] = False
+    cond_adj = cond.assign(tr_end=tr_end, tr_adj_end=tr_adj_end)
     cond_adj = cond_adj.loc[inclusion_mask,:]
-    raw_mat = raw_mat[inclusion_mask]
-
-    # Add end_tr for all events which happened during a single TR
-    single_mask = np.array(cond_adj['tr_end'] == 0)
-    cond_adj.loc[single_mask, 'tr_end'] = cond_adj.loc[single_mask, 'tr']
-    cond_adj.loc[single_mask, 'tr_adj_end'] = (
-        cond_adj.loc[single_mask, 'tr_adj'])
-
-    # Drop inclusion column
-    cond_adj = cond_adj.drop('inclusion', axis=1)
-
-    # Reset index
-    cond_adj.reset_index(drop=True)
-
-
-    return(cond_adj, raw_mat)
+    raw_mat_adj = raw_mat[inclusion_mask]
+
+    # Average patterns for multi entry events and store in first entry. TRs
+    # are summed position by position within each event (vectorized over
+    # events, same order of summation as np.mean)
+    if np.any(multi):
+        multi_start = seg_start[multi]
+        multi_len = seg_len[multi]
+        seg_sum = raw_mat[event_loc[multi_start]]
+        for i_pos in np.arange(1, np.max(multi_len)):
+            pos_mask = multi_len > i_pos
+            seg_sum[pos_mask] += raw_mat[event_loc[multi_start[pos_mask] +
+                                                   i_pos]]
+        # Location of first entries after exclusion
+        adj_loc = np.cumsum(inclusion_mask)[first_loc[multi]] - 1
+        raw_mat_adj[adj_loc] = (
+            seg_sum / multi_len[:, np.newaxis].astype(seg_sum.dtype)
+            )
+
+    return(cond_adj, raw_mat_adj)
@@ -10,7 +10,6 @@ import sys
 import pandas as pd
 import numpy as np
 import os
-import copy
 
 
 # Get condition file to train/test classifier
@@ -67,66 +66,31 @@ def CreateConditions(base_path,
     beh['tr'] = beh['tr'] - 1
     beh['tr_adj'] = beh['tr_adj'] - 1
     
-    # Find which events happened during which TR
-    events = np.array([np.unique(beh.event[beh.tr == x])
-                    for x in np.arange(raw_mat.shape[0])])
-    # Find how many logs of an event are inside one TR
-    events_counts = np.array(
-        [np.unique(beh.event[beh.tr == x],return_counts=True)[1]
-         for x in np.arange(raw_mat.shape[0])]
-        )
-    # Find all TRs with multiple events
-    multi_event_index = np.array(
-        [len(events[x]) for x in np.arange(raw_mat.shape[0])]
-        )
-    multi_event_index = np.where(multi_event_index > 1)[0]
-    
-    # Find which TR is in which fold
-    folds = np.array([np.unique(beh.fold[beh.tr == x])
-                    for x in np.arange(raw_mat.shape[0])])
-    multi_fold_index = np.array(
-        [len(folds[x]) for x in np.arange(raw_mat.shape[0])]
-        )
-    multi_fold_index = np.where(multi_fold_index > 1)[0]
-    
-    # Find which buffer happened during which TR
-    buffer = np.array(
-        [np.unique(beh.buffer[beh.tr == x])
-         for x in np.arange(raw_mat.shape[0])]
-        )
-    # Find how many logs of a buffer are inside one TR
-    buffer_counts = np.array(
-        [np.unique(beh.buffer[beh.tr == x], return_counts=True)[1]
-         for x in np.arange(raw_mat.shape[0])]
-        )
-    multi_buffer_index = np.array(
-        [len(buffer_counts[x]) for x in np.arange(raw_mat.shape[0])]
-        )
-    multi_buffer_index = np.where(multi_buffer_index > 1)[0]
+    # Only logs inside the functional data can be assigned to a TR
+    n_tr = raw_mat.shape[0]
+    beh_tr = beh.loc[(beh['tr'] >= 0) & (beh['tr'] < n_tr)]
     
+    # Find all TRs with multiple events
+    multi_event_index = beh_tr.groupby('tr')['event'].nunique()
+    multi_event_index = multi_event_index.index[multi_event_index > 1].values
+    
+    # Assign each TR to the event/buffer that takes up most time in the TR 
+    # (most logs inside the TR). In case multiple events happened equally 
+    # often take the event that appears first. TRs without logs get 0
+    events_tr = np.zeros(n_tr, dtype=int)
+    buffer_tr = np.zeros(n_tr, dtype=int)
+    for column, column_tr in zip(['event', 'buffer'], [events_tr, buffer_tr]):
+        # Count logs of each event/buffer inside each TR
+        counts = beh_tr.groupby(['tr', column]).size().reset_index(name='n')
+        # Keep event/buffer with most logs (lowest number for ties)
+        counts = counts.sort_values(['tr', 'n', column],
+                                    ascending=[True, False, True])
+        counts = counts.drop_duplicates('tr')
+        column_tr[counts['tr'].values.astype(int)] = counts[column].values
     
     # Create column marking multi_events in one TR
     cond.insert(0, 'multi_event', False, allow_duplicates=True)
     cond.loc[multi_event_index, 'multi_event'] = True
-    
-    # Assign TRs with multiple events/buffers to event/buffer that takes
-    # up most time in the TR
-    for i in multi_event_index:
-        max_ind = np.where(events_counts[i] == np.max(events_counts[i]))[0]
-        events[i] = events[i][max_ind]
-        #print(i, events[i])
-        # In case multiple events happened equally often take the event that 
-        # appears first
-        if len(events[i]) > 1:
-            events[i] = events[i][0]
-    
-    for i in multi_buffer_index:
-        max_ind = np.where(buffer_counts[i] == np.max(buffer_counts[i]))[0]
-        buffer[i] = buffer[i][max_ind]
-        # In case multiple events happened equally often take the event that 
-        # appears first
-        if len(buffer[i]) > 1:
-            buffer[i] = buffer[i][0]
         
     # Add event_info column with relevant type of event (e.g. direction in 
     # case of walking forward)
@@ -141,36 +105,13 @@ def CreateConditions(base_path,
         beh.loc[beh['event_info'].isnull(), 'event_info'] = (
             beh.loc[beh['event_info'].isnull(), 'turn_dir_by_loc']
             )
-    # Map event number to event type that happened
-    event_number = np.unique(beh['event'])
-    event_type = np.array(
-        [np.unique(beh.loc[beh['event'] == x, 'event_info'])[0]
-         for x in event_number]
-        )
-    event_dict = dict(zip(event_number, event_type))
-    
-    # Map event number to fold it was in
-    event_fold = np.array(
-        [np.unique(beh.loc[beh['event'] == x, 'fold'])[0]
-         for x in event_number]
-        )
-    fold_dict = dict(zip(event_number, event_fold))
-    
-    # Map event number to duration
-    duration_dict = dict(zip(event_number,
-                             [len(beh.loc[beh['event'] == x,'event'])
-                              for x in event_number]
-                             ))
-    
-    # Add event, buffer, and fold to each TR
-    # Post to int data type
-    events_tr = copy.deepcopy(events)
-    buffer_tr = copy.deepcopy(buffer)
-    for x in np.arange(len(events)):
-        events_tr[x] = np.sum(events[x])
-        buffer_tr[x] = np.sum(buffer[x])
-    events_tr = events_tr.astype(int)
-    buffer_tr = buffer_tr.astype(int)
+    # Map event number to event type that happened, the fold it was in, and
+    # its duration (number of logs)
+    event_group = beh.groupby('event')
+    event_type = event_group['event_info'].min()
+    event_fold = event_group['fold'].min()
+    event_duration = event_group.size()
+    
     # Add conditions column
     cond.insert(0, 'event', events_tr, allow_duplicates=True)
     cond.insert(0, 'buffer', buffer_tr, allow_duplicates=True)
@@ -179,18 +120,12 @@ def CreateConditions(base_path,
     cond.loc[cond.buffer == 0, 'buffer'] = np.nan
     
     # Add event type to each tr
-    cond.insert(0, 'event_type', np.nan, allow_duplicates=True)
-    for event_count in event_dict:
-        cond.loc[cond.event == event_count, 'event_type'] = (
-            event_dict[event_count]
-            )
+    cond.insert(0, 'event_type', cond['event'].map(event_type),
+                allow_duplicates=True)
         
     # Add fold to each TR
-    cond.insert(0, 'fold', np.nan, allow_duplicates=True)
-    for event_count in fold_dict:
-        cond.loc[cond.event == event_count, 'fold'] = (
-            fold_dict[event_count]
-            )
+    cond.insert(0, 'fold', cond['event'].map(event_fold),
+                allow_duplicates=True)
     
     # Adjust events for hemodynamic lag (event in TR x is decodable at TR x+2)
     # (separately for each session because shifting events by to could push a
@@ -219,8 +154,7 @@ def CreateConditions(base_path,
     cond.loc[cond['fold'] == 4, 'session'] = 2
     
     # Add duration for each event
-    for x in event_number:
-        cond.loc[cond['event'] == x, 'duration'] = duration_dict[x]
+    cond['duration'] = cond['event'].map(event_duration)
     
     # Return conditions file
     return(cond)
\ No newline at end of file
@@ -9,6 +9,7 @@ Created on Mon Aug  3 11:05:17 2020
 import os
 import sys
 import json
+import glob
 import nilearn
 from nilearn.masking import apply_mask
 import pandas as pd
@@ -28,7 +29,8 @@ def CreateRawMatrix(base_path,
                     high_pass=1/128,
                     pull_extremes=False,
                     ext_std_thres=8,
-                    standardize='zscore'):
+                    standardize='zscore',
+                    use_cache=False):
     
     # ===    
     # Import own functions
@@ -37,8 +39,13 @@ def CreateRawMatrix(base_path,
                                  'code',
                                  'decoding',
                                  'utils'))
-    from GetFsMask import GetFsMask
+    from GetFsMask import GetFsMaskList
     from PullExtremes import PullExtremes
+    from ApplyMaskCropped import ApplyMaskCropped
+    from StageNifti import GetStagedFile
+    from RawMatrixCache import GetRawMatrixCacheFile
+    from RawMatrixCache import LoadRawMatrixCache
+    from RawMatrixCache import SaveRawMatrixCache
     
     # Get TR from sequence info file
     seq_info = os.path.join(base_path, 'bids', 'task-nav_bold.json')
@@ -47,13 +54,117 @@ def CreateRawMatrix(base_path,
     in_file.close()
     tr = json_data["RepetitionTime"]
     
-    # Get intersection of masks for both sessions
-    mask_intersect = GetFsMask(base_path=base_path,
-                               train_test_modality='train-raw_test-raw',
-                               sub_id=sub_id,
-                               seg_type=mask_seg,
-                               mask_index=mask_index,
-                               save_mask=True)
+    # Get input files of both sessions (functional images and confounds)
+    func_files = list()
+    conf_files = list()
+    for ses_id in ['ses-1', 'ses-2']:
+        func_dir = os.path.join(base_path,
+                                'derivatives',
+                                'preprocessing',
+                                'fmriprep',
+                                sub_id,
+                                ses_id,
+                                'func')
+        func_files.append(os.path.join(
+            func_dir,
+            sub_id + '_' + ses_id + '_task-nav_space-T1w_desc-preproc_bold.nii.gz'))
+        conf_files.append(os.path.join(
+            func_dir,
+            sub_id + '_' + ses_id + '_task-nav_desc-confounds_regressors.tsv'))
+    
+    # Get masks to extract (in case of multiple masks (list of lists of mask 
+    # indices) functional images are loaded and preprocessed only once for all
+    # masks)
+    multi_mask = (isinstance(mask_index, list) and
+                  any([isinstance(x, list) for x in mask_index]))
+    if multi_mask:
+        mask_list = [sorted(np.atleast_1d(x).tolist()) for x in mask_index]
+    else:
+        mask_list = [sorted(np.atleast_1d(mask_index).tolist())]
+    # Preprocessed matrices for each mask and session
+    mask_mat = [[None, None] for x in mask_list]
+    # Masks which still need to be extracted
+    mask_todo = np.arange(len(mask_list))
+    
+    # If requested, load preprocessed matrices from cache in case they were
+    # created with the same parameters and input files before
+    if use_cache:
+        # Segmentation images and table the mask is based on
+        seg_files = glob.glob(os.path.join(base_path,
+                                           'derivatives',
+                                           'preprocessing',
+                                           'fmriprep',
+                                           sub_id,
+                                           '*',
+                                           'func',
+                                           '*task-nav*space-T1w_desc-' + 
+                                           mask_seg + '*'))
+        seg_files.append(os.path.join(base_path,
+                                      'derivatives',
+                                      'preprocessing',
+                                      'fmriprep',
+                                      'desc-' + mask_seg + '_dseg.tsv'))
+        cache_files = list()
+        cache_keys = list()
+        for mask_count, mask_value in enumerate(mask_list):
+            # Parameters influencing preprocessed matrix
+            cache_parameters = {'mask_seg': mask_seg,
+                                'mask_index': mask_value,
+                                'smoothing_fwhm': smoothing_fwhm,
+                                'essential_confounds': essential_confounds,
+                                'detrend': detrend,
+                                'high_pass': high_pass,
+                                'pull_extremes': pull_extremes,
+                                'ext_std_thres': ext_std_thres,
+                                'standardize': standardize}
+            cache_files.append(list())
+            cache_keys.append(list())
+            for ses_count, ses_id in enumerate(['ses-1', 'ses-2']):
+                cache_file, cache_key = GetRawMatrixCacheFile(
+                    base_path=base_path,
+                    sub_id=sub_id,
+                    ses_id=ses_id,
+                    parameters=cache_parameters,
+                    input_files=([func_files[ses_count],
+                                  conf_files[ses_count],
+                                  seq_info] + seg_files))
+                cache_files[mask_count].append(cache_file)
+                cache_keys[mask_count].append(cache_key)
+        
+        # Load cached data of masks with files for both sessions
+        cached = np.array([all([os.path.exists(x) for x in files])
+                           for files in cache_files])
+        if any(cached):
+            print('Loading preprocessed raw data from cache...')
+        for mask_count in np.where(cached)[0]:
+            mask_mat[mask_count] = [LoadRawMatrixCache(x)
+                                    for x in cache_files[mask_count]]
+        mask_todo = np.where(~cached)[0]
+    
+    # Return in case all masks were cached
+    if len(mask_todo) == 0:
+        if multi_mask:
+            return(mask_mat)
+        else:
+            return(mask_mat[0])
+    
+    # Get intersection of masks for both sessions (all masks at once)
+    mask_imgs = GetFsMaskList(base_path=base_path,
+                              train_test_modality='train-raw_test-raw',
+                              sub_id=sub_id,
+                              seg_type=mask_seg,
+                              mask_list=[mask_list[x] for x in mask_todo],
+                              save_mask=True)
+    mask_data = [nilearn.image.get_data(x) != 0 for x in mask_imgs]
+    
+    # Combine masks (smoothing happens before masking and all preprocessing 
+    # steps work on each voxel independently, so each mask is a subset of 
+    # voxels of the combined mask)
+    union_data = np.any(mask_data, axis=0)
+    mask_union = nilearn.image.new_img_like(mask_imgs[0],
+                                            union_data.astype(int))
+    # Get voxels (columns) of each mask within the combined mask
+    mask_cols = [x[union_data] for x in mask_data]
 
     # Allocate lists holding loaded raw images, preprocessed raw matrices, 
     # and confound variables for both sessions
@@ -84,23 +195,16 @@ def CreateRawMatrix(base_path,
     # Get preprocessed raw matrices for both sessions
     for ses_count, ses_id in enumerate(['ses-1', 'ses-2']):
         
-        # Load raw images
-        file_pattern = sub_id + '_' + ses_id + '_task-nav_space-T1w_desc-'
-        file = os.path.join(base_path,
-                            'derivatives',
-                            'preprocessing',
-                            'fmriprep',
-                            sub_id,
-                            ses_id,
-                            'func',
-                            file_pattern + 'preproc_bold.nii.gz')
-        nii_raw.append(nilearn.image.load_img(file))
+        # Load raw images (uncompressed staged copy if available, data stays
+        # on disk until masking)
+        nii_raw.append(nilearn.image.load_img(
+            GetStagedFile(base_path, func_files[ses_count])))
         
-        # Mask loaded data with intersected mask
+        # Mask loaded data with intersected mask (only reads data around mask)
         nii_mat.append(
-            apply_mask(imgs=nii_raw[ses_count],
-                       mask_img=mask_intersect,
-                       smoothing_fwhm=smoothing_fwhm)
+            ApplyMaskCropped(imgs=nii_raw[ses_count],
+                             mask_img=mask_union,
+                             smoothing_fwhm=smoothing_fwhm)
             )
         
         
@@ -117,16 +221,7 @@ def CreateRawMatrix(base_path,
         
         
         # Load motion confounds
-        file_pattern = sub_id + '_' + ses_id + '_task-nav_desc-'
-        file = os.path.join(base_path,
-                            'derivatives',
-                            'preprocessing',
-                            'fmriprep',
-                            sub_id,
-                            ses_id,
-                            'func',
-                            file_pattern + 'confounds_regressors.tsv')
-        conf = pd.read_csv(file, sep='\t')
+        conf = pd.read_csv(conf_files[ses_count], sep='\t')
         # Replace possible NaN in first line with mean of column
         nan_cols = conf.loc[0,].isnull()
         conf.loc[0,nan_cols] = conf.loc[:,nan_cols].mean(axis=0)
@@ -176,9 +271,11 @@ def CreateRawMatrix(base_path,
             # save data before pull back of extremes
             before_pb.append(copy.deepcopy(nii_mat[ses_count]))
             
-            # Pull extreme values towards mean
+            # Pull extreme values towards mean (in place, data before pull
+            # back is already saved)
             nii_mat[ses_count] = PullExtremes(nii_mat[ses_count],
-                                              threshold_std=ext_std_thres)
+                                              threshold_std=ext_std_thres,
+                                              in_place=True)
             # Save data before zscore
             before_zs.append(copy.deepcopy(nii_mat[ses_count]))
             
@@ -241,6 +338,19 @@ def CreateRawMatrix(base_path,
     
     # plt.tight_layout()
     
+    # Split preprocessed data into masks
+    for todo_count, mask_count in enumerate(mask_todo):
+        mask_mat[mask_count] = [x[:, mask_cols[todo_count]] for x in nii_mat]
+        
+        # If requested, save preprocessed matrices to cache
+        if use_cache:
+            for ses_count in np.arange(len(nii_mat)):
+                SaveRawMatrixCache(cache_file=cache_files[mask_count][ses_count],
+                                   data=mask_mat[mask_count][ses_count],
+                                   key=cache_keys[mask_count][ses_count])
         
-    # Return results
-    return(nii_mat)
\ No newline at end of file
+    # Return results (list of sessions, for multiple masks list of masks)
+    if multi_mask:
+        return(mask_mat)
+    else:
+        return(mask_mat[0])
\ No newline at end of file
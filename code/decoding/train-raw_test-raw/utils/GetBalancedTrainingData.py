@@ -16,30 +16,45 @@ import random
 
 
 # Function to (down- or up-) sample conditions to equal amount of all event 
-# types in a fold
+# types in a fold (random events are drawn from random_state, numpy's global
+# random state if not specified)
 def GetBalancedTrainingData(conditions,
                             raw_mat,
                             hold_out_split,
                             split_level,
                             balancing_option,
                             balance_strategy,
-                            n_bins=6):
+                            n_bins=6,
+                            return_index=False,
+                            smote_index=None,
+                            random_state=None):
+    
+    from SmoteIndex import CreateSmoteIndex, SmoteResample
 
     # Restrict data to split
     split_mask = conditions[split_level] != hold_out_split
     split_data = conditions.loc[split_mask]
-    split_trs = raw_mat[split_mask]
     
     # Pre-allocate return variables
-    sample = pd.DataFrame()
     sampled_cond = pd.DataFrame()
     sampled_trs = np.empty(shape=(0,raw_mat.shape[1]))
+    # Balanced data is gathered by position from conditions/raw_mat (no
+    # copies of the voxel data in between)
+    sample_index = None
     
     # Get counts of each event type in fold
     bins = np.arange(n_bins) + 1
     counts = [np.count_nonzero(split_data['event_type'] == x)
               for x in bins]
     
+    # Positions of events of each bin in the split, and duration of events
+    # indexed by position
+    split_index = np.where(split_mask)[0]
+    event_type = np.array(conditions['event_type'])[split_index]
+    bin_index = [split_index[event_type == x] for x in bins]
+    if balance_strategy == 'longest':
+        duration = pd.Series(np.array(conditions['duration']))
+    
     
     # - - -
     # Downsampling
@@ -48,32 +63,24 @@ def GetBalancedTrainingData(conditions,
         # Get event with lowest count
         min_count = np.min(counts)
         
+        sample_index = []
         # Get x events based on sampling type
         for bin_count, bin_id in enumerate(np.arange(1, n_bins+1)):
-            bin_data = split_data.loc[split_data['event_type'] == bin_id, :]
-            
             # If desired, take x longest events
             if balance_strategy == 'longest':
-                bin_data = bin_data.nlargest(min_count, columns=['duration'])
+                bin_sample = duration[bin_index[bin_count]].nlargest(
+                    min_count).index.values
             # if desired, take x random events
             if balance_strategy == 'random':
-                bin_data = bin_data.sample(n=min_count, replace=False)
+                bin_sample = pd.Series(bin_index[bin_count]).sample(
+                    n=min_count, replace=False,
+                    random_state=random_state).values
                 
             # Append remaining events for each split and event type
-            sample = sample.append(bin_data)
+            sample_index.append(bin_sample)
         
         # Sort resampled data into correct order
-        sample = sample.sort_index()
-        
-        # Get mask of which events stayed and which events were eliminated
-        sample_mask = np.array(
-            [conditions.index.values[index] in sample.index.values
-             for index in np.arange(len(conditions.index.values))]
-            )
-        
-        # Restrict data to downsampled subset
-        sampled_cond = conditions[sample_mask]
-        sampled_trs = raw_mat[sample_mask]
+        sample_index = np.sort(np.concatenate(sample_index)).astype(int)
     
     
     # - - -
@@ -83,15 +90,13 @@ def GetBalancedTrainingData(conditions,
         # Get event with highest count
         max_count = np.max(counts)
         
+        # Start with all events of split
+        sample_index = [split_index]
+        
         # Get x events based on sampling type
         for bin_count, bin_id in enumerate(np.arange(1, n_bins+1)):
-            bin_mask = split_data['event_type'] == bin_id
-            bin_data = split_data.loc[bin_mask , :]
-            bin_trs = split_trs[bin_mask,:]
-            
             # Get number of events to sample
             n_curr_examples = counts[bin_count]
-            #print(n_curr_examples)
             n_sample_examples = max_count - n_curr_examples
             # If number of examples to sample is at least double of current 
             # examples only sample remaining difference once all examples have 
@@ -101,32 +106,31 @@ def GetBalancedTrainingData(conditions,
             
             # If desired, take x longest events
             if balance_strategy == 'longest':
-                sample_index = bin_data.nlargest(n_sample_examples,
-                                                 columns=['duration']).index
+                bin_sample = duration[bin_index[bin_count]].nlargest(
+                    n_sample_examples).index.values
             # if desired, take x random events
             if balance_strategy == 'random':
-                sample_index = bin_data.sample(n=n_sample_examples,
-                                               replace=False).index
-            # create mask from indexed subdata
-            sample_mask = [True if index in sample_index else False
-                           for index in bin_data.index]
-            # Restrict conditions and raw data with mask
-            sample_data = bin_data.loc[sample_mask, :]
-            sample_trs = bin_trs[sample_mask, :]
-                
+                bin_sample = pd.Series(bin_index[bin_count]).sample(
+                    n=n_sample_examples, replace=False,
+                    random_state=random_state).values
+            # Keep sampled events in order of the split
+            bin_sample = np.sort(bin_sample)
+            
             # In case of n_sample_examples >= n * n_curr_examples add all
             # events as additional samples n times
-            for i in np.arange(multiples):
-                sample_data = sample_data.append(bin_data)
-                sample_trs = np.append(sample_trs, bin_trs, axis=0)
-                
-            # Append remaining events for each split and event type
-            sampled_cond = sampled_cond.append(sample_data)
-            sampled_trs = np.append(sampled_trs, sample_trs, axis=0)
+            sample_index.append(bin_sample)
+            sample_index.extend([bin_index[bin_count]] * multiples)
         
         # Add resampled data to full conditions and raw data
-        sampled_cond = split_data.append(sampled_cond)
-        sampled_trs = np.append(split_trs, sampled_trs, axis=0)
+        sample_index = np.concatenate(sample_index).astype(int)
+    
+    # Gather (up- or down-) sampled conditions and raw data
+    if sample_index is not None:
+        sampled_cond = conditions.iloc[sample_index]
+        sampled_trs = raw_mat[sample_index]
+        # Upsampled data was always returned in double precision
+        if balancing_option == 'upsample':
+            sampled_trs = sampled_trs.astype(np.float64, copy=False)
         
     # - - -
     # SMOTE
@@ -146,9 +150,11 @@ def GetBalancedTrainingData(conditions,
         # how can I get only the data created by SMOTE resmapling?
             # Easier to append to old data!
         # split_data
+        split_trs = raw_mat[split_mask]
         X_data = split_trs
         y_labels = split_data['event_type']
-        # Create SMOTE sampling object to create new synthetic data points
+        # SMOTE sampling object (only used for default parameters, synthetic
+        # data points are created from distance index)
         oversample = SMOTE()
         
         # ---
@@ -171,17 +177,24 @@ def GetBalancedTrainingData(conditions,
             k_neighbors = k_neighbors_default
         else:
             k_neighbors = k_neighbors_max 
-        oversample  = oversample.set_params(k_neighbors = k_neighbors)
         print('\t' + 'Hold-out split: ' + str(hold_out_split) + '\t' + 'SMOTE k_neighbors = ' + str(k_neighbors))
-        # Set seed so synthetic data is always the same
-        np.random.seed(666)
-        # Create balanced set adding synthetic data
-        X2_data, y2_labels = oversample.fit_resample(X_data,y_labels)
-        # Reset seed
-        np.random.seed()
-        # Find synthetic data points (appended to end of original data)
-        new_labels = y2_labels[len(y_labels):]
-        new_trs = X2_data[len(X_data):]
+        # Get distance index of split (computed once for each split, only
+        # labels change between calls with the same data)
+        if smote_index is None:
+            split_smote_index = CreateSmoteIndex(split_trs)
+        else:
+            if ((hold_out_split not in smote_index) or
+                (smote_index[hold_out_split]['n_examples'] != 
+                 split_trs.shape[0])):
+                smote_index[hold_out_split] = CreateSmoteIndex(split_trs)
+            split_smote_index = smote_index[hold_out_split]
+        # Create synthetic data to balance set (fixed seed so synthetic data
+        # is always the same, global random state is not touched)
+        new_trs, new_labels = SmoteResample(smote_index=split_smote_index,
+                                            raw_mat=split_trs,
+                                            labels=y_labels,
+                                            k_neighbors=k_neighbors,
+                                            random_state=666)
         
         # Create label output (synthetic data will have NaN on every column
         # except label)
@@ -192,5 +205,10 @@ def GetBalancedTrainingData(conditions,
         sampled_trs = np.append(split_trs, new_trs, axis=0)
         
 
-    # Return (up- or down-) sampled conditions and raw data
-    return(sampled_cond, sampled_trs)
\ No newline at end of file
+    # Return (up- or down-) sampled conditions and raw data (and position of
+    # sampled events in conditions if requested, None for SMOTE since 
+    # synthetic data has no position)
+    if return_index:
+        return(sampled_cond, sampled_trs, sample_index)
+    else:
+        return(sampled_cond, sampled_trs)
\ No newline at end of file
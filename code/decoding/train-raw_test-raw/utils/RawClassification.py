@@ -8,10 +8,10 @@ Created on Wed Sep 23 18:11:49 2020
 
 import os
 import sys
-import copy
 import numpy as np
 import pandas as pd
 from sklearn import metrics
+from concurrent.futures import ThreadPoolExecutor
 
 
 def RawClassification(base_path,
@@ -25,38 +25,87 @@ def RawClassification(base_path,
                       balance_strategy,
                       buffering=False,
                       testset_buffer=False,
-                      perm=False):
+                      perm=False,
+                      perm_index=None,
+                      perm_seed=None,
+                      smote_index=None,
+                      gram=None,
+                      logreg_solver='full',
+                      logreg_basis=None,
+                      warm_start=None,
+                      split_jobs=1,
+                      split_plan=None):
     
     sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
-    from Classify import Classify
+    from Classify import Classify, ShuffleLabels
+    from ClassifyBatch import ClassifyBatch
+    from PermuteLabels import PermuteLabels
+    from CorrelatePatterns import CorrelatePatterns
+    from ConfusionCounts import GetConfusionCounts, GetBalancedAccuracy
+    from GetSampleBasis import GetSampleBasis
     from GetBalancedTrainingData import GetBalancedTrainingData
+    from SplitPlan import CreateSplitPlan
     
+    # Detect batched permutations (all permutations in perm_index are fitted
+    # together, reusing train/test split and balancing of each hold-out split)
+    perm_batch = perm and (perm_index is not None)
     
-    # Detect within-session decoding
-    within_session = len(np.unique(cond.loc[train_mask, 'session'])) == 1
+    # Random number generator for shuffling labels (one for each permutation
+    # in case of batch, global numpy state if no seed given) and for random
+    # balancing (seeded by all seeds of a batch, a separate stream of the
+    # seed of a single permutation)
+    perm_rng = None
+    balance_rng = None
+    if perm_seed is not None:
+        if perm_batch:
+            perm_rng = [np.random.RandomState(x) for x in perm_seed]
+        else:
+            perm_rng = np.random.RandomState(perm_seed)
+        balance_rng = np.random.RandomState(np.atleast_1d(perm_seed))
     
-    if within_session :
-        # Get session
-        i_session = np.unique(cond.loc[train_mask, 'session'])[0]
-        # Restrict decoding data to session
-        session_mask = cond.loc[:,'session'] == i_session
-        cond = cond.loc[session_mask]
-        raw_mat = raw_mat[session_mask, :]
-        # Restrict taining mask to current session
-        train_mask = train_mask.loc[session_mask]
     
-    # Create conditions and folds to train on (will always keep buffer if 
-    # specified, while buffer is dropable in testing set)
-    train_cond = copy.deepcopy(cond.loc[train_mask,:])
-    train_raw_mat = copy.deepcopy(raw_mat[train_mask,:])
-    session_label = train_cond[x_val_split]
+    # Position of examples in raw_mat (rows/columns of linear kernel for SVM
+    # with precomputed kernel, kernel is computed here if not given)
+    raw_index = np.arange(raw_mat.shape[0])
+    if classifier == 'svm-precomputed' and gram is None:
+        gram = np.array(raw_mat, dtype=np.float64)
+        gram = np.dot(gram, gram.T)
+    
+    # Basis of training examples of each hold-out split for logistic 
+    # regression in sample space (reused in case the same dict is given to
+    # all permutations, batched logistic regression always fits in sample
+    # space)
+    sample_space = (classifier == 'logreg' and
+                    (logreg_solver == 'sample' or perm_batch))
+    if sample_space and logreg_basis is None:
+        logreg_basis = dict()
     
+    # Warm start depends on order of fits, so it is only used if hold-out
+    # splits are classified one after another
+    if split_jobs > 1:
+        warm_start = None
     
-    # If buffer should be included set the training and testing conditions
-    # file to be equal (so both include a buffer)
-    if testset_buffer :
-        cond = copy.deepcopy(train_cond)
-        raw_mat = copy.deepcopy(train_raw_mat)
+    # Get cross-validation plan (positions of training and testing events of
+    # each hold-out split), created here if not given
+    if split_plan is None:
+        split_plan = CreateSplitPlan(conditions=cond,
+                                     train_mask=train_mask,
+                                     x_val_split=x_val_split,
+                                     n_bins=n_bins,
+                                     testset_buffer=testset_buffer,
+                                     balancing_option=balancing_option,
+                                     balance_strategy=balance_strategy)
+    
+    # Create conditions to train on (will always keep buffer if specified, 
+    # while buffer is dropable in testing set) and conditions of events 
+    # results are returned for (session in case of within-session decoding,
+    # equal to training conditions in case buffer should be included in
+    # testing set). Voxel data is only gathered for each hold-out split
+    train_cond = cond.iloc[split_plan['train_index']]
+    train_raw_index = raw_index[split_plan['train_index']]
+    cond = cond.iloc[split_plan['cond_index']]
+    raw_index = raw_index[split_plan['cond_index']]
+    session_label = train_cond[x_val_split]
     
     # Create df to hold number of events for each event_type in split of the 
     # training set & testing set
@@ -82,23 +131,35 @@ def RawClassification(base_path,
         )
     cond.loc[:,cor_cols] = 0
     
+    # Allocate predictions, probabilities, correlations, and accuracy for
+    # each permutation
+    if perm_batch:
+        perm_index = np.array(perm_index)
+        n_perm = len(perm_index)
+        pred_perm = np.zeros([n_perm, cond.shape[0]])
+        proba_perm = np.zeros([n_perm, cond.shape[0], n_bins])
+        cor_perm = np.zeros([n_perm, cond.shape[0], n_bins])
+        acc_perm = np.zeros([n_perm, len(np.unique(session_label))])
     
-    # Loop over hold out sets for cross validation
-    for hold_out_count, hold_out_split in enumerate(np.unique(session_label)):
-        
-        # Get unbalanced training set
-        train_set_mask = np.array(session_label != hold_out_split)
+    
+    # Prepare training and testing set of each hold-out split (balancing and
+    # shuffling of labels use random numbers, so they always run in order of
+    # splits)
+    splits = []
+    train_raw_mat = None
+    for hold_out_count, split_entry in enumerate(split_plan['splits']):
         
-        # mask conditions and data
-        train_set_cond = train_cond.loc[train_set_mask, :]
-        train_set_raw = train_raw_mat[train_set_mask, :]
+        hold_out_split = split_entry['hold_out_split']
+        sample_index = split_entry['sample_index']
         
         # Get balance of events
-        # Training
         counts_mask_train = np.where(counts.loc[:, 'set'] == 'train')[0]
-        counts.iloc[counts_mask_train,hold_out_count] = np.array(
-            [sum(train_set_cond.loc[:,'event_type'] == x) 
-             for x in np.arange(1,n_bins+1)]
+        counts.iloc[counts_mask_train,hold_out_count] = (
+            split_entry['train_counts']
+            )
+        counts_mask_test = np.where(counts.loc[:, 'set'] == 'test')[0]
+        counts.iloc[counts_mask_test,hold_out_count] = (
+            split_entry['test_counts']
             )
         
         # In case requested, balance events within training set
@@ -106,33 +167,49 @@ def RawClassification(base_path,
         
             # Give message to user
             print('Balancing events within training set...')
-            
-            # Get balanced training data according to strategy
-            train_set_cond, train_set_raw = (
+        
+        if sample_index is None:
+            # Get balanced training data according to strategy (random or
+            # synthetic examples differ between calls)
+            if train_raw_mat is None:
+                train_raw_mat = raw_mat[split_plan['train_index']]
+            train_set_cond, train_set_raw, sample_index = (
                 GetBalancedTrainingData(conditions=train_cond,
                                         raw_mat=train_raw_mat,
                                         hold_out_split=hold_out_split,
                                         split_level=x_val_split,
                                         balancing_option=balancing_option,
                                         balance_strategy=balance_strategy,
-                                        n_bins=n_bins)
+                                        n_bins=n_bins,
+                                        return_index=True,
+                                        smote_index=smote_index,
+                                        random_state=balance_rng)
                 )
+            # Get mask for folds of training set (for permutation)
+            train_set_fold_mask = np.array(train_set_cond[x_val_split])
+            train_set_cond = train_set_cond.loc[:,'event_type']
+        else:
+            # Balanced training set of plan
+            train_set_cond = train_cond['event_type'].iloc[sample_index]
+            train_set_raw = raw_mat[train_raw_index[sample_index]]
+            # Upsampled data was always used in double precision
+            if balancing_option == 'upsample':
+                train_set_raw = train_set_raw.astype(np.float64, copy=False)
+            train_set_fold_mask = split_entry['fold_groups']
+        
+        # Position of balanced examples in raw_mat (None for synthetic SMOTE
+        # examples)
+        train_set_index = None
+        if sample_index is not None:
+            train_set_index = train_raw_index[sample_index]
         
         # Get test set (in case of testset_buffer == False this will use 
         # events form both buffers)
-        test_mask = np.array(cond[x_val_split] == hold_out_split)
-        test_cond = np.array(cond.loc[test_mask, 'event_type'])
-        test_raw = raw_mat[test_mask]
-        
-        # Get balance of events
-        # Testing
-        counts_mask_test = np.where(counts.loc[:, 'set'] == 'test')[0]
-        counts.iloc[counts_mask_test,hold_out_count] = np.array(
-            [sum(test_cond == x) for x in np.arange(1,n_bins+1)]
-            )
-        
-        # Get mask for folds of training set (for permutation)
-        train_set_fold_mask = train_set_cond[x_val_split]
+        test_mask = np.zeros(cond.shape[0], dtype=bool)
+        test_mask[split_entry['test_index']] = True
+        test_cond = np.array(cond['event_type'])[test_mask]
+        test_index = raw_index[test_mask]
+        test_raw = raw_mat[test_index]
         
         # Print balance of events without considering balancing (in case not
         # permutation, otherwise too much 
@@ -140,12 +217,10 @@ def RawClassification(base_path,
         if not perm:
             print('\tBalance of events:')
             print('\t\thold_out_split', int(hold_out_split), ':')
-            mask = np.where(counts.loc[:, 'set'] == 'train')[0]
             print('\t\t\ttrain:', '\t',
-                  np.array(counts.iloc[mask,hold_out_count]))
-            mask = np.where(counts.loc[:, 'set'] == 'test')[0]
+                  np.array(counts.iloc[counts_mask_train,hold_out_count]))
             print('\t\t\ttest:', '\t', 
-                  np.array(counts.iloc[mask,hold_out_count]))
+                  np.array(counts.iloc[counts_mask_test,hold_out_count]))
         
         # Throw error in case there are 0 cases of at least one direction of training
         if 0 in np.array(counts.iloc[counts_mask_train,hold_out_count]):
@@ -156,10 +231,6 @@ def RawClassification(base_path,
             #sys.exit('At least one direction in testing data without example.')
             print('\n', 'WARNING:', '\n',
                   'At least one direction in testing data without example', '\n')
-                  
-
-        # Convert training conditions to single column of events
-        train_set_cond = train_set_cond.loc[:,'event_type']
         
         # Print balance of events considering balancing (in case not
         # permutation, otherwise too much text output for log)
@@ -171,26 +242,124 @@ def RawClassification(base_path,
                       [sum(train_set_cond == x) for x in np.arange(1,n_bins+1)])
                   )
         
-        # predict classes with selected classifier
-        pred, pred_proba = Classify(train_func=train_set_raw,
+        # Shuffle training labels within folds (all permutations of batch at
+        # once)
+        train_set_perm = None
+        if perm_batch:
+            train_set_perm = PermuteLabels(labels=train_set_cond,
+                                           groups=train_set_fold_mask,
+                                           n_perm=n_perm,
+                                           random_state=perm_rng)
+        elif perm:
+            ShuffleLabels(train_cond=train_set_cond,
+                          train_fold_mask=train_set_fold_mask,
+                          random_state=perm_rng)
+        
+        splits.append({'hold_out_split': hold_out_split,
+                       'train_set_cond': train_set_cond,
+                       'train_set_raw': train_set_raw,
+                       'train_set_index': train_set_index,
+                       'train_set_fold_mask': train_set_fold_mask,
+                       'train_set_perm': train_set_perm,
+                       'test_mask': test_mask,
+                       'test_cond': test_cond,
+                       'test_raw': test_raw,
+                       'test_index': test_index})
+    
+    
+    # Function to classify held-out events of one split (labels are already
+    # shuffled, no random numbers involved)
+    def ClassifySplit(split):
+        
+        hold_out_split = split['hold_out_split']
+        train_set_cond = split['train_set_cond']
+        train_set_raw = split['train_set_raw']
+        train_set_index = split['train_set_index']
+        test_cond = split['test_cond']
+        test_raw = split['test_raw']
+        test_index = split['test_index']
+        
+        # Get basis of training examples (only recomputed if training 
+        # examples changed, e.g. random balancing)
+        split_basis = None
+        if sample_space:
+            split_cache = logreg_basis.get(hold_out_split)
+            if ((split_cache is None) or
+                (split_cache['n_examples'] != train_set_raw.shape[0]) or
+                (train_set_index is None) or
+                (not np.array_equal(split_cache['train_set_index'],
+                                    train_set_index))):
+                split_cache = {'n_examples': train_set_raw.shape[0],
+                               'train_set_index': train_set_index,
+                               'basis': GetSampleBasis(train_set_raw)}
+                logreg_basis[hold_out_split] = split_cache
+            split_basis = split_cache['basis']
+        
+        # Data given to classifier (blocks of kernel in case of precomputed
+        # kernel, upsampled examples are repeated rows/columns)
+        train_set_func = train_set_raw
+        test_func = test_raw
+        if classifier == 'svm-precomputed':
+            if train_set_index is None:
+                # Synthetic examples are not part of kernel
+                train_set_func = np.array(train_set_raw, dtype=np.float64)
+                test_func = np.dot(np.array(test_raw, dtype=np.float64),
+                                   train_set_func.T)
+                train_set_func = np.dot(train_set_func, train_set_func.T)
+            else:
+                train_set_func = gram[np.ix_(train_set_index, train_set_index)]
+                test_func = gram[np.ix_(test_index, train_set_index)]
+        
+        # Fit all permutations of this hold-out split at once
+        if perm_batch:
+            train_set_perm = split['train_set_perm']
+            # predict classes with selected classifier
+            pred, pred_proba = ClassifyBatch(train_func=train_set_func,
+                                             train_cond=train_set_perm,
+                                             test_func=test_func,
+                                             classifier=classifier,
+                                             n_bins=n_bins,
+                                             logreg_basis=split_basis)
+            
+            # Mean pattern for each bin and permutation (based on permuted
+            # labels, permutations x bins x voxels)
+            bin_onehot = (train_set_perm[:, np.newaxis, :] ==
+                          (np.arange(n_bins) + 1)[:, np.newaxis])
+            mean_pattern = (
+                np.matmul(bin_onehot.astype(np.float64), train_set_raw) /
+                np.sum(bin_onehot, axis=2)[:, :, np.newaxis]
+                )
+            # Correlate each mean pattern with each event in held-out set
+            cor = CorrelatePatterns(test_raw, mean_pattern)
+            
+            # Save classification accuracy (adjusted for tets set imbalance)
+            clf_acc = np.array(
+                [metrics.balanced_accuracy_score(y_true=test_cond,
+                                                 y_pred=pred[i_perm],
+                                                 sample_weight=None,
+                                                 adjusted=False)
+                 for i_perm in np.arange(n_perm)]
+                )
+            return(pred, pred_proba, clf_acc, cor)
+        
+        # predict classes with selected classifier (labels of permutation
+        # were shuffled before)
+        pred, pred_proba = Classify(train_func=train_set_func,
                                     train_cond=train_set_cond,
-                                    test_func=test_raw,
-                                    train_fold_mask=train_set_fold_mask,
+                                    test_func=test_func,
+                                    train_fold_mask=split['train_set_fold_mask'],
                                     classifier=classifier,
                                     n_bins=n_bins,
-                                    perm=perm)
-        
-        # Add prediction to conditions file
-        cond.loc[test_mask, 'prediction'] = pred
-        # Add prediction probability
-        cond.loc[test_mask, proba_cols] = np.array(pred_proba)
+                                    perm=False,
+                                    logreg_basis=split_basis,
+                                    warm_start=warm_start,
+                                    warm_key=hold_out_split)
         
         # Save classification accuracy (adjusted for tets set imbalance)
         clf_acc = metrics.balanced_accuracy_score(y_true=test_cond,
                                                   y_pred=pred, 
                                                   sample_weight=None,
                                                   adjusted=False)
-        acc[hold_out_count] = clf_acc
         # not adjusted for test set imbalance
         # clf_acc = np.equal(pred, test_cond)
         # acc[hold_out_count] = np.sum(clf_acc) / len(clf_acc)
@@ -203,24 +372,40 @@ def RawClassification(base_path,
             [np.mean(train_set_raw[train_set_cond == x], axis=0)
              for x in np.arange(n_bins)+ 1]
             )
-        for bin_count, bin_id in enumerate(np.arange(n_bins)+ 1):
-            # Correlate each mean pattern with each direction representation in 
-            # held-out set
-            bin_mask = test_cond == bin_id
-            # If there are events of this specific bin correlate it with mean 
-            # patterns
-            if any(bin_mask == True):
-                cor[bin_mask] = [np.corrcoef(x, mean_pattern)[0][1:(n_bins+1)] 
-                                 for x in test_raw[bin_mask]]
-                
-        # Add event type and prediction
-        cor = pd.DataFrame(cor)
-        cor.loc[:, 'event_type'] = test_cond
-        
-        # Add correlations for hold out set to full results
-        cond.loc[test_mask, cor_cols] = np.array(
-            cor[np.arange(n_bins)]
-            )
+        # Correlate each mean pattern with each direction representation in 
+        # held-out set (events of other bins keep a correlation of 0)
+        bin_mask = np.isin(test_cond, np.arange(n_bins) + 1)
+        cor[bin_mask] = CorrelatePatterns(test_raw[bin_mask], mean_pattern)
+        
+        return(pred, pred_proba, clf_acc, cor)
+    
+    
+    # Classify hold-out splits (in case requested in parallel threads, results
+    # are collected in order of splits)
+    if split_jobs > 1:
+        with ThreadPoolExecutor(max_workers=split_jobs) as pool:
+            split_results = list(pool.map(ClassifySplit, splits))
+    else:
+        split_results = [ClassifySplit(split) for split in splits]
+    
+    # Add results of each hold-out split
+    for hold_out_count, (split, split_result) in enumerate(
+            zip(splits, split_results)):
+        pred, pred_proba, clf_acc, cor = split_result
+        test_mask = split['test_mask']
+        if perm_batch:
+            pred_perm[:, test_mask] = pred
+            proba_perm[:, test_mask] = pred_proba
+            cor_perm[:, test_mask] = cor
+            acc_perm[:, hold_out_count] = clf_acc
+        else:
+            # Add prediction to conditions file
+            cond.loc[test_mask, 'prediction'] = pred
+            # Add prediction probability
+            cond.loc[test_mask, proba_cols] = np.array(pred_proba)
+            acc[hold_out_count] = clf_acc
+            # Add correlations for hold out set to full results
+            cond.loc[test_mask, cor_cols] = cor
     
     # Get adjusted accuracy over all examples rather than within folds
     acc_across = metrics.balanced_accuracy_score(y_true=cond.event_type,
@@ -228,4 +413,26 @@ def RawClassification(base_path,
                                                  sample_weight=None,
                                                  adjusted=False)
     
+    # Stack results of all permutations (same format as chaining single
+    # permutations)
+    if perm_batch:
+        # (from counts of predictions of all permutations at once)
+        counts_across, _ = GetConfusionCounts(
+            event_type=np.tile(np.array(cond.event_type), n_perm),
+            prediction=pred_perm.reshape(-1),
+            n_bins=n_bins,
+            i_perm=np.repeat(np.arange(n_perm), cond.shape[0]))
+        acc_across = GetBalancedAccuracy(counts_across)
+        n_cond = cond.shape[0]
+        cond = cond.iloc[np.tile(np.arange(n_cond), n_perm)]
+        cond = cond.reset_index(drop=True)
+        cond.loc[:, 'prediction'] = pred_perm.reshape(-1)
+        cond.loc[:, proba_cols] = proba_perm.reshape(-1, n_bins)
+        cond.loc[:, cor_cols] = cor_perm.reshape(-1, n_bins)
+        cond.loc[:, 'i_perm'] = np.repeat(perm_index, n_cond)
+        n_counts = counts.shape[0]
+        counts = pd.concat([counts] * n_perm, ignore_index=True)
+        counts.loc[:, 'i_perm'] = np.repeat(perm_index, n_counts)
+        return(cond, acc_perm.reshape(-1), acc_across, counts)
+    
     return(cond, acc, acc_across, counts)
\ No newline at end of file
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 11:20:54 2026
+
+@author: koch
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from threadpoolctl import threadpool_limits
+
+
+# Arguments to RawClassification inside worker processes (raw_mat is a view
+# on shared memory, set by InitPermutationWorker)
+worker_args = dict()
+
+
+# Function to classify one chunk of permutations
+def RunPermutationChunk(perm_index,
+                        perm_seed,
+                        perm_mode,
+                        clf_args):
+
+    sys.path.append(os.path.join(clf_args['base_path'], 'code', 'decoding',
+                                 'train-raw_test-raw', 'utils'))
+    from RawClassification import RawClassification
+    sys.path.append(os.path.join(clf_args['base_path'], 'code', 'decoding',
+                                 'utils'))
+    from WarmStart import CreateWarmStart
+
+    # Cache of warm start of this chunk (new for each chunk, so starting
+    # points do not depend on workers, order of chunks, or resumed
+    # checkpoints)
+    warm_start = None
+    if clf_args.get('warm_start') is not None:
+        warm_start = CreateWarmStart(check=clf_args['warm_start'] == 'check')
+    clf_args = dict(clf_args, warm_start=warm_start)
+
+    if perm_mode == 'loop':
+        # Classification with permuted labels, one permutation after another
+        results = list()
+        for i_perm, seed in zip(perm_index, perm_seed):
+            # Give message to user:
+            print('Permutation count: ' + str(i_perm))
+            result_cond, acc_perm, acc_across_perm, counts_perm = (
+                RawClassification(perm=True,
+                                  perm_seed=seed,
+                                  **clf_args)
+                )
+            # Add variable of permutation
+            result_cond['i_perm'] = i_perm
+            counts_perm['i_perm'] = i_perm
+            results.append((result_cond, np.atleast_1d(acc_perm),
+                            np.atleast_1d(acc_across_perm), counts_perm))
+        result_cond = pd.concat([x[0] for x in results], ignore_index=True)
+        acc_perm = np.concatenate([x[1] for x in results])
+        acc_across_perm = np.concatenate([x[2] for x in results])
+        counts_perm = pd.concat([x[3] for x in results], ignore_index=True)
+    elif perm_mode == 'batch':
+        # Give message to user:
+        print('Permutation count: ' + str(perm_index[0]) + '-' +
+              str(perm_index[-1]))
+        # Batches already carry variable of permutation
+        result_cond, acc_perm, acc_across_perm, counts_perm = (
+            RawClassification(perm=True,
+                              perm_index=perm_index,
+                              perm_seed=perm_seed,
+                              **clf_args)
+            )
+
+    # Counters of warm start of this chunk
+    warm_counts = None
+    if warm_start is not None:
+        warm_counts = {key: val for key, val in warm_start.items()
+                       if key.startswith('n_')}
+
+    return(result_cond, np.atleast_1d(acc_perm),
+           np.atleast_1d(acc_across_perm), counts_perm, warm_counts)
+
+
+# Attach worker process to shared raw data (and limit BLAS/OpenMP threads of
+# worker if requested)
+def InitPermutationWorker(shm_name, shape, dtype, clf_args, n_threads=None):
+    if n_threads is not None:
+        threadpool_limits(limits=n_threads)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    worker_args['shm'] = shm
+    worker_args['clf_args'] = dict(clf_args,
+                                   raw_mat=np.ndarray(shape,
+                                                      dtype=dtype,
+                                                      buffer=shm.buf))
+
+
+# Classify one chunk of permutations inside a worker process
+def RunPermutationChunkWorker(perm_index, perm_seed, perm_mode):
+    return(RunPermutationChunk(perm_index=perm_index,
+                               perm_seed=perm_seed,
+                               perm_mode=perm_mode,
+                               clf_args=worker_args['clf_args']))
+
+
+# Function to run classification with permuted training labels n_perm times
+# and chain the results of all permutations. In case of checkpoint, returns
+# None if all out_files exist and were written by a run with the same
+# parameters and data
+def RawPermutation(base_path,
+                   sub_id,
+                   mask_index,
+                   raw_mat,
+                   cond,
+                   train_mask,
+                   classifier,
+                   n_bins,
+                   x_val_split,
+                   balancing_option,
+                   balance_strategy,
+                   n_perm,
+                   buffering=False,
+                   testset_buffer=False,
+                   perm_mode='loop',
+                   perm_batch_size=100,
+                   n_jobs=1,
+                   gram=None,
+                   logreg_solver='full',
+                   warm_start='off',
+                   split_jobs=1,
+                   n_threads=None,
+                   checkpoint=False,
+                   out_files=None):
+
+    sys.path.append(os.path.join(base_path, 'code', 'decoding', 'utils'))
+    from GetPermSeed import GetPermSeed
+    from WarmStart import CreateWarmStart, PrintWarmStart
+    from PermCheckpoint import (GetPermCheckpointDir, LoadPermCheckpoint,
+                                SavePermChunk, CheckPermDone,
+                                RemovePermCheckpoint)
+    sys.path.append(os.path.join(base_path, 'code', 'decoding',
+                                 'train-raw_test-raw', 'utils'))
+    from SplitPlan import CreateSplitPlan
+
+    # Get permutations run in each chunk
+    if perm_mode == 'loop' and warm_start == 'off':
+        # One permutation at a time
+        perm_chunks = [[i_perm] for i_perm in np.arange(n_perm)]
+    elif perm_mode == 'loop':
+        # Chunks of permutations sharing the cache of warm start (run one
+        # after another)
+        n_chunks = int(np.ceil(n_perm / perm_batch_size))
+        perm_chunks = np.array_split(np.arange(n_perm), n_chunks)
+    elif perm_mode == 'batch':
+        # Chunks of permutations fitted together (limits memory of solver)
+        n_chunks = int(np.ceil(n_perm / perm_batch_size))
+        perm_chunks = np.array_split(np.arange(n_perm), n_chunks)
+    else:
+        sys.exit('Permutation mode not specified!')
+
+    # Seed of each permutation only depends on participant, mask, training
+    # set (sessions, buffer), and permutation (results do not depend on
+    # number of workers, but differ between calls for different training sets)
+    train_cond = cond.loc[np.array(train_mask, dtype=bool), :]
+    train_session = [int(x) for x in
+                     np.unique(train_cond['session'].dropna())]
+    train_buffer = None
+    if buffering:
+        train_buffer = [int(x) for x in
+                        np.unique(train_cond['buffer'].dropna())]
+    seed_chunks = [[GetPermSeed(sub_id, mask_index, i_perm,
+                                session=train_session,
+                                buffer=train_buffer,
+                                testset_buffer=testset_buffer)
+                    for i_perm in perm_index]
+                   for perm_index in perm_chunks]
+
+    # Checkpoint of this call (directory named by hash of parameters and
+    # data)
+    checkpoint_dir = None
+    checkpoint_key = None
+    if checkpoint:
+        parameters = {'classifier': classifier,
+                      'n_bins': n_bins,
+                      'x_val_split': x_val_split,
+                      'balancing_option': balancing_option,
+                      'balance_strategy': balance_strategy,
+                      'buffering': buffering,
+                      'testset_buffer': testset_buffer,
+                      'n_perm': n_perm,
+                      'perm_mode': perm_mode,
+                      'perm_batch_size': perm_batch_size,
+                      'logreg_solver': logreg_solver,
+                      'warm_start': warm_start}
+        checkpoint_dir, checkpoint_key = GetPermCheckpointDir(
+            base_path=base_path,
+            sub_id=sub_id,
+            mask_index=mask_index,
+            parameters=parameters,
+            raw_mat=raw_mat,
+            cond=cond,
+            train_mask=train_mask)
+        # Call is skipped in case its output files were written completely
+        # by a run with the same key before (e.g. by a killed job, outputs
+        # are marked as complete once written), outputs of other parameters
+        # are computed again
+        if ((out_files is not None) and
+            CheckPermDone(checkpoint_key, out_files)):
+            # Checkpoint left by job killed after marking outputs
+            RemovePermCheckpoint(checkpoint_dir)
+            # Give message to user
+            print('Output of permutations exists, skipping...')
+            return(None)
+
+    # Cross-validation plan is the same for all permutations (only labels
+    # are shuffled), so it is created once
+    split_plan = CreateSplitPlan(conditions=cond,
+                                 train_mask=train_mask,
+                                 x_val_split=x_val_split,
+                                 n_bins=n_bins,
+                                 testset_buffer=testset_buffer,
+                                 balancing_option=balancing_option,
+                                 balance_strategy=balance_strategy)
+
+    # Arguments shared by all chunks
+    clf_args = {'base_path': base_path,
+                'raw_mat': raw_mat,
+                'cond': cond,
+                'train_mask': train_mask,
+                'classifier': classifier,
+                'n_bins': n_bins,
+                'x_val_split': x_val_split,
+                'balancing_option': balancing_option,
+                'balance_strategy': balance_strategy,
+                'buffering': buffering,
+                'testset_buffer': testset_buffer,
+                'gram': gram,
+                'logreg_solver': logreg_solver,
+                'split_jobs': split_jobs,
+                'split_plan': split_plan}
+    # Distance index of each hold-out split for SMOTE (balancing uses the 
+    # same data in each permutation, so distances are only computed once, in
+    # case of multiple workers once in each worker)
+    if balancing_option == 'SMOTE':
+        clf_args['smote_index'] = dict()
+    # Basis of training examples of each hold-out split for logistic 
+    # regression in sample space (also computed once, batched logistic
+    # regression always fits in sample space)
+    if logreg_solver == 'sample' or perm_mode == 'batch':
+        clf_args['logreg_basis'] = dict()
+    # Solutions of last fit of each hold-out split as starting point of the
+    # next permutation (one cache for each chunk)
+    if warm_start in ['on', 'check']:
+        clf_args['warm_start'] = warm_start
+
+    # Results of each chunk (in case of checkpoint, chunks finished by a
+    # killed job with the same parameters are loaded instead of classified
+    # again)
+    results = dict()
+    if checkpoint:
+        results = LoadPermCheckpoint(checkpoint_dir, checkpoint_key)
+        # Give message to user
+        if len(results) > 0:
+            print('Resuming permutations from checkpoint (' +
+                  str(len(results)) + ' of ' + str(len(perm_chunks)) +
+                  ' chunks finished)...')
+    open_chunks = [i_chunk for i_chunk in range(len(perm_chunks))
+                   if i_chunk not in results]
+
+    # Function to keep results of a finished chunk (and append them to
+    # checkpoint on disk)
+    def FinishChunk(i_chunk, result):
+        results[i_chunk] = result
+        if checkpoint:
+            SavePermChunk(checkpoint_dir=checkpoint_dir,
+                          key=checkpoint_key,
+                          i_chunk=i_chunk,
+                          result=result,
+                          finished=list(results.keys()),
+                          perm_chunks=perm_chunks,
+                          seed_chunks=seed_chunks)
+
+    if n_jobs == 1:
+        for i_chunk in open_chunks:
+            FinishChunk(i_chunk,
+                        RunPermutationChunk(perm_index=perm_chunks[i_chunk],
+                                            perm_seed=seed_chunks[i_chunk],
+                                            perm_mode=perm_mode,
+                                            clf_args=clf_args))
+    elif len(open_chunks) > 0:
+        # Give raw data to workers via shared memory instead of pickling a
+        # copy for each chunk
+        shm = shared_memory.SharedMemory(create=True, size=raw_mat.nbytes)
+        try:
+            shared_mat = np.ndarray(raw_mat.shape, dtype=raw_mat.dtype,
+                                    buffer=shm.buf)
+            shared_mat[:] = raw_mat
+            clf_args['raw_mat'] = None
+            with ProcessPoolExecutor(max_workers=n_jobs,
+                                     initializer=InitPermutationWorker,
+                                     initargs=(shm.name,
+                                               raw_mat.shape,
+                                               raw_mat.dtype,
+                                               clf_args,
+                                               n_threads)) as pool:
+                # Results are kept as soon as a chunk is finished (chained
+                # in order of chunks below)
+                futures = {pool.submit(RunPermutationChunkWorker,
+                                       perm_chunks[i_chunk],
+                                       seed_chunks[i_chunk],
+                                       perm_mode): i_chunk
+                           for i_chunk in open_chunks}
+                for future in as_completed(futures):
+                    FinishChunk(futures[future], future.result())
+            del shared_mat
+        finally:
+            shm.close()
+            shm.unlink()
+    results = [results[i_chunk] for i_chunk in range(len(perm_chunks))]
+
+    # Chain permutation results
+    permutation_cond = pd.concat([x[0] for x in results], ignore_index=True)
+    permutation_acc = np.concatenate([x[1] for x in results])
+    permutation_acc_across = np.concatenate([x[2] for x in results])
+    permutation_counts = pd.concat([x[3] for x in results], ignore_index=True)
+
+    # Give counters of warm start to user (summed over chunks)
+    if warm_start in ['on', 'check']:
+        warm_total = CreateWarmStart()
+        for x in results:
+            if x[4] is not None:
+                for key in warm_total:
+                    if key.startswith('n_'):
+                        warm_total[key] += x[4][key]
+        PrintWarmStart(warm_total)
+
+    # (outputs are marked as complete and checkpoint is removed by caller
+    # once outputs are written)
+    return(permutation_cond, permutation_acc, permutation_acc_across,
+           permutation_counts, checkpoint_dir, checkpoint_key)
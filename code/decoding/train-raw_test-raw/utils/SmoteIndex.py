@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:24:52 2026
+
+@author: koch
+"""
+
+import numpy as np
+from sklearn.utils import check_random_state
+
+
+# Function to create a distance index of all examples of a training set 
+# (squared euclidean distances between all examples). Distances do not depend
+# on labels, so the index can be reused for any label vector (e.g. in each
+# permutation)
+def CreateSmoteIndex(raw_mat):
+
+    # Distances in double precision (like nearest neighbor search of SMOTE)
+    data = np.array(raw_mat, dtype=np.float64)
+    sq_norm = np.sum(data * data, axis=1)
+    sq_dist = (sq_norm[:, np.newaxis] + sq_norm[np.newaxis, :] -
+               2 * np.dot(data, data.T))
+    np.maximum(sq_dist, 0, out=sq_dist)
+    # Each example is its own nearest neighbor
+    np.fill_diagonal(sq_dist, -1)
+
+    smote_index = {'n_examples': raw_mat.shape[0],
+                   'sq_dist': sq_dist}
+
+    return(smote_index)
+
+
+# Function to get the k nearest neighbors of each example of a class (only 
+# considering examples of the same class, position within the class)
+def GetSmoteNeighbors(smote_index,
+                      labels,
+                      class_id,
+                      k_neighbors):
+
+    class_index = np.flatnonzero(np.asarray(labels) == class_id)
+    class_dist = smote_index['sq_dist'][np.ix_(class_index, class_index)]
+    # Sort neighbors by distance and drop example itself (first neighbor)
+    nns = np.argsort(class_dist, axis=1, kind='stable')[:, 1:k_neighbors+1]
+
+    return(nns)
+
+
+# Function to create synthetic examples so that all classes have as many 
+# examples as the majority class (same as imblearn's SMOTE with 
+# sampling_strategy='auto', drawing from random_state, numpy's global random
+# state if not specified)
+def SmoteResample(smote_index,
+                  raw_mat,
+                  labels,
+                  k_neighbors,
+                  random_state=None):
+
+    random_state = check_random_state(random_state)
+    labels = np.asarray(labels)
+
+    # Number of examples to create for each class (classes in sorted order)
+    class_ids, class_counts = np.unique(labels, return_counts=True)
+    n_samples = np.max(class_counts) - class_counts
+    # Majority class (first in case of ties) gets no samples
+    n_samples[np.argmax(class_counts)] = 0
+
+    # Draw base example, neighbor, and step for each synthetic example
+    base_index = []
+    neighbor_index = []
+    steps = []
+    new_labels = []
+    for class_id, n_class_samples in zip(class_ids, n_samples):
+        if n_class_samples == 0:
+            continue
+        class_index = np.flatnonzero(labels == class_id)
+        nns = GetSmoteNeighbors(smote_index=smote_index,
+                                labels=labels,
+                                class_id=class_id,
+                                k_neighbors=k_neighbors)
+        # Random draws in the same order as SMOTE
+        samples_indices = random_state.randint(low=0,
+                                               high=nns.size,
+                                               size=n_class_samples)
+        steps.append(random_state.uniform(size=n_class_samples))
+        rows = np.floor_divide(samples_indices, nns.shape[1])
+        cols = np.mod(samples_indices, nns.shape[1])
+        base_index.append(class_index[rows])
+        neighbor_index.append(class_index[nns[rows, cols]])
+        new_labels.append(np.full(n_class_samples, class_id,
+                                  dtype=labels.dtype))
+
+    # No class to balance
+    if len(steps) == 0:
+        return(np.empty((0, raw_mat.shape[1]), dtype=raw_mat.dtype),
+               np.empty(0, dtype=labels.dtype))
+
+    # Create all synthetic examples on the line between base example and 
+    # neighbor
+    base_index = np.concatenate(base_index)
+    neighbor_index = np.concatenate(neighbor_index)
+    steps = np.concatenate(steps)[:, np.newaxis]
+    base_trs = raw_mat[base_index]
+    new_trs = base_trs + steps * (raw_mat[neighbor_index] - base_trs)
+    new_trs = new_trs.astype(raw_mat.dtype)
+
+    return(new_trs, np.concatenate(new_labels))
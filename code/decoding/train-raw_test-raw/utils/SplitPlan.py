@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:17 2026
+
+@author: koch
+"""
+
+import numpy as np
+
+
+# Function to assign folds for within-session decoding (sub_fold) and, if
+# requested, reorganize folds within session to be as balanced as possible.
+# Events of each group are assigned in order of conditions file: the first
+# events get the lowest fold, folds differ in size by at most one event
+def AssignFolds(cond,
+                n_bins,
+                n_folds_within,
+                reorganize=False,
+                buffering=False):
+
+    # Only events of directional bins are assigned
+    bin_mask = np.array(cond['event_type'].isin(np.arange(1, n_bins+1)))
+
+    # Position of each event within its session and direction, and number of
+    # events in session and direction
+    group = cond.loc[bin_mask].groupby(['session', 'event_type'], sort=False)
+    position = np.array(group.cumcount())
+    n_group = np.array(group['session'].transform('size'))
+
+    # First (n_group mod n_folds) folds hold one event more than the others
+    n_small = n_group // n_folds_within
+    n_large_folds = n_group % n_folds_within
+    n_in_large = n_large_folds * (n_small + 1)
+    sub_fold = np.where(position < n_in_large,
+                        position // (n_small + 1),
+                        n_large_folds +
+                        (position - n_in_large) // np.maximum(n_small, 1))
+    cond.loc[:, 'sub_fold'] = 0
+    cond.loc[bin_mask, 'sub_fold'] = sub_fold + 1
+
+    # If requested, split events of each session and direction into the two
+    # folds of the session (first half to the first fold)
+    if reorganize:
+        reorg_mask = bin_mask
+        group_cols = ['session', 'event_type']
+        # Reorganize each buffer separately
+        if buffering:
+            reorg_mask = np.logical_and(
+                reorg_mask, np.array(cond['buffer'].isin([1, 2])))
+            group_cols = ['session', 'event_type', 'buffer']
+        group = cond.loc[reorg_mask].groupby(group_cols, sort=False)
+        position = np.array(group.cumcount())
+        n_group = np.array(group['session'].transform('size'))
+        session = np.array(cond.loc[reorg_mask, 'session'])
+        new_fold = 2*session - 1 + (position >= (n_group + 1) // 2)
+        cond.loc[reorg_mask, 'fold'] = new_fold
+
+    return(cond)
+
+
+# Function to create the cross-validation plan of one classification (train
+# mask). Holds positions (in conditions/raw data) of training and testing
+# events of each hold-out split, event counts, and folds training labels are
+# shuffled within. Built once and reused by every permutation, which only
+# changes labels. In case balancing is deterministic (up-/downsampling of
+# longest events, no balancing) the balanced training set is part of the plan
+def CreateSplitPlan(conditions,
+                    train_mask,
+                    x_val_split,
+                    n_bins,
+                    testset_buffer=False,
+                    balancing_option='none',
+                    balance_strategy='longest'):
+
+    from GetBalancedTrainingData import GetBalancedTrainingData
+
+    train_mask = np.array(train_mask)
+
+    # Detect within-session decoding and restrict classification to session
+    cond_mask = np.ones(len(conditions), dtype=bool)
+    session = np.array(conditions['session'])
+    if len(np.unique(session[train_mask])) == 1:
+        cond_mask = session == np.unique(session[train_mask])[0]
+
+    # Position of training events (always keep buffer if specified) and of
+    # events classification results are returned for (testing set, in case
+    # buffer should be included the same as the training set)
+    train_index = np.where(np.logical_and(cond_mask, train_mask))[0]
+    if testset_buffer:
+        cond_index = train_index
+    else:
+        cond_index = np.where(cond_mask)[0]
+
+    train_cond = conditions.iloc[train_index]
+    train_split = np.array(train_cond[x_val_split])
+    train_event = np.array(train_cond['event_type'])
+    test_split = np.array(conditions[x_val_split])[cond_index]
+    test_event = np.array(conditions['event_type'])[cond_index]
+    bins = np.arange(1, n_bins+1)
+
+    # Balanced training sets only depend on data in case of longest events
+    fixed_balancing = (
+        (balancing_option == 'none') or
+        ((balancing_option in ['downsample', 'upsample']) and
+         (balance_strategy == 'longest'))
+        )
+
+    splits = []
+    for hold_out_split in np.unique(train_split):
+
+        # Unbalanced training set and testing set (positions in training
+        # and result events)
+        train_set_index = np.where(train_split != hold_out_split)[0]
+        test_index = np.where(test_split == hold_out_split)[0]
+
+        # Count events of each bin
+        train_counts = np.array(
+            [np.count_nonzero(train_event[train_set_index] == x)
+             for x in bins])
+        test_counts = np.array(
+            [np.count_nonzero(test_event[test_index] == x) for x in bins])
+
+        # Balanced training set (positions in training events, None if
+        # balancing needs to be repeated for each classification)
+        sample_index = None
+        if balancing_option == 'none':
+            sample_index = train_set_index
+        elif fixed_balancing and (0 not in train_counts):
+            # (only positions are needed, no voxel data)
+            _, _, sample_index = GetBalancedTrainingData(
+                conditions=train_cond,
+                raw_mat=np.empty((len(train_cond), 0)),
+                hold_out_split=hold_out_split,
+                split_level=x_val_split,
+                balancing_option=balancing_option,
+                balance_strategy=balance_strategy,
+                n_bins=n_bins,
+                return_index=True)
+
+        # Folds training labels are shuffled within (of balanced training set)
+        fold_groups = None
+        if sample_index is not None:
+            fold_groups = train_split[sample_index]
+
+        splits.append({'hold_out_split': hold_out_split,
+                       'train_set_index': train_set_index,
+                       'sample_index': sample_index,
+                       'fold_groups': fold_groups,
+                       'test_index': test_index,
+                       'train_counts': train_counts,
+                       'test_counts': test_counts})
+
+    split_plan = {'cond_index': cond_index,
+                  'train_index': train_index,
+                  'fixed_balancing': fixed_balancing,
+                  'splits': splits}
+
+    return(split_plan)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 11:02:57 2026
+
+@author: koch
+"""
+
+import sys
+import numpy as np
+import nibabel
+import nilearn
+from nilearn import image
+
+
+# Function to mask (and smooth) 4D data like nilearn's apply_mask, but only
+# reading the bounding box of the mask (plus smoothing kernel) from the image.
+# For uncompressed (memory-mapped) images this only touches the data around
+# the mask instead of loading the full 4D volume
+def ApplyMaskCropped(imgs,
+                     mask_img,
+                     smoothing_fwhm=None):
+
+    # Load image header (data stays on disk)
+    imgs = image.load_img(imgs)
+    mask_data = image.get_data(mask_img) != 0
+    if mask_data.shape != imgs.shape[:3]:
+        sys.exit('Mask and functional image differ in shape')
+
+    # Get margin around mask needed for smoothing (scipy's gaussian filter is
+    # truncated at 4 sigma, nilearn derives sigma from voxel size)
+    margin = np.zeros(3, dtype=int)
+    if smoothing_fwhm is not None:
+        vox_size = np.sqrt(np.sum(imgs.affine[:3, :3] ** 2, axis=0))
+        sigma = smoothing_fwhm / (np.sqrt(8 * np.log(2)) * vox_size)
+        margin = (4.0 * sigma + 0.5).astype(int)
+
+    # Bounding box of mask including margin
+    mask_vox = np.array(np.where(mask_data))
+    box_start = np.maximum(mask_vox.min(axis=1) - margin, 0)
+    box_end = np.minimum(mask_vox.max(axis=1) + 1 + margin, mask_data.shape)
+    box = tuple([slice(x, y) for x, y in zip(box_start, box_end)])
+
+    # Read data inside bounding box (float32 like apply_mask)
+    data = np.asarray(imgs.dataobj[box], dtype=np.float32)
+
+    # Smooth cropped data (voxels inside the mask only see real data since
+    # the margin covers the kernel)
+    if smoothing_fwhm is not None:
+        box_affine = imgs.affine.copy()
+        box_affine[:3, 3] = imgs.affine[:3, :3] @ box_start + imgs.affine[:3, 3]
+        data = image.get_data(
+            image.smooth_img(nibabel.Nifti1Image(data, box_affine),
+                             fwhm=smoothing_fwhm)
+            )
+
+    # Return TR x voxel matrix (same voxel order as apply_mask)
+    return(data[mask_data[box]].T)
@@ -18,10 +18,25 @@ from sklearn.linear_model import LogisticRegression
 import sys
 import argparse
 from sklearn.utils import shuffle
+from WarmStart import GetWarmStartInit, UpdateWarmStart
+from LogregBatch import RefineLogreg
 
 
 
 
+# Function to shuffle training labels within each fold (in place)
+def ShuffleLabels(train_cond,
+                  train_fold_mask,
+                  random_state=None):
+    
+    # Shuffle labels within each fold
+    for i_fold in np.unique(train_fold_mask):
+        train_cond[train_fold_mask == i_fold] = shuffle(train_cond[train_fold_mask == i_fold],
+                                                            random_state=random_state).to_numpy()
+    
+    return(train_cond)
+
+
 # Main function for decoding and saving results
 def Classify(train_func,
              train_cond,
@@ -29,7 +44,11 @@ def Classify(train_func,
              train_fold_mask,
              classifier,
              n_bins,
-             perm=False):
+             perm=False,
+             random_state=None,
+             logreg_basis=None,
+             warm_start=None,
+             warm_key=None):
 
     # Initialize classifier objects
     svc = SVC(C=1.0,
@@ -61,9 +80,9 @@ def Classify(train_func,
 
     # If requested, shuffle training labels for permutation
     if perm:
-        # Shuffle labels within each fold
-        for i_fold in np.unique(train_fold_mask):
-            train_cond[train_fold_mask == i_fold] = shuffle(train_cond[train_fold_mask == i_fold]).to_numpy()
+        ShuffleLabels(train_cond=train_cond,
+                      train_fold_mask=train_fold_mask,
+                      random_state=random_state)
         
     # use requested classifier to predict classes of testing set
     if classifier == 'svm':
@@ -72,9 +91,83 @@ def Classify(train_func,
         pred = svc.predict(X=test_func)
         # Don't predict probability for SVM
         pred_proba = np.zeros([test_func.shape[0], n_bins])
+    elif classifier == 'svm-precomputed':
+        # Training and testing data are blocks of a linear kernel (train x 
+        # train and test x train)
+        svc.set_params(kernel='precomputed')
+        svc.fit(X=train_func,
+                y=train_cond)
+        pred = svc.predict(X=test_func)
+        # Don't predict probability for SVM
+        pred_proba = np.zeros([test_func.shape[0], n_bins])
     elif classifier == 'logreg':
+        # In case basis of training examples is given, fit in sample space 
+        # (projected data, exact for L2 penalty)
+        if logreg_basis is not None:
+            train_func = np.dot(train_func, logreg_basis)
+            test_func = np.dot(test_func, logreg_basis)
+        
+        # In case cache of solutions is given, start from previous solution
+        # (e.g. of the last permutation of this hold-out split)
+        warm_init = None
+        if warm_start is not None:
+            n_classes = len(np.unique(train_cond))
+            warm_init = GetWarmStartInit(
+                warm_start=warm_start,
+                key=warm_key,
+                coef_shape=(n_classes if n_classes > 2 else 1,
+                            train_func.shape[1]),
+                intercept_shape=(n_classes if n_classes > 2 else 1,))
+        if warm_init is not None:
+            logreg.set_params(warm_start=True)
+            logreg.coef_, logreg.intercept_ = warm_init
+        
         logreg.fit(X=train_func,
                    y=train_cond)
+        
+        n_iter = int(np.max(logreg.n_iter_))
+        
+        # Warm fit is only kept once the largest entry of the gradient of the
+        # penalized loss is below tol (lbfgs usually stops on the relative
+        # change of the loss before, so the warm solution is refined until
+        # the gradient criterion holds). Solution does not depend on starting
+        # point once converged, so in case refining fails fit again from zero
+        cold_refit = False
+        if warm_init is not None:
+            n_refine = RefineLogreg(logreg=logreg,
+                                    train_func=train_func,
+                                    train_cond=train_cond,
+                                    tol=logreg.tol,
+                                    max_iter=logreg.max_iter)
+            if n_refine is not None:
+                n_iter = n_iter + n_refine
+            else:
+                logreg.set_params(warm_start=False)
+                logreg.fit(X=train_func,
+                           y=train_cond)
+                n_iter = int(np.max(logreg.n_iter_))
+                warm_init = None
+                cold_refit = True
+        # In case requested, compare to fit from zero and keep it
+        mismatch = None
+        if warm_init is not None and warm_start['check']:
+            logreg_cold = copy.deepcopy(logreg)
+            logreg_cold.set_params(warm_start=False)
+            logreg_cold.fit(X=train_func,
+                            y=train_cond)
+            mismatch = np.any(logreg_cold.predict(X=test_func) !=
+                              logreg.predict(X=test_func))
+            logreg = logreg_cold
+        if warm_start is not None:
+            UpdateWarmStart(warm_start=warm_start,
+                            key=warm_key,
+                            coef=logreg.coef_,
+                            intercept=logreg.intercept_,
+                            n_iter=n_iter,
+                            warm=warm_init is not None,
+                            cold_refit=cold_refit,
+                            mismatch=mismatch)
+        
         pred = logreg.predict(X=test_func)
         pred_proba = logreg.predict_proba(X=test_func)
     else:
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 10:31:07 2026
+
+@author: koch
+"""
+
+import numpy as np
+import sys
+from scipy.special import logsumexp
+from Classify import Classify
+from GetSampleBasis import GetSampleBasis
+from LogregBatch import FitLogregBatch
+
+
+# Predict classes for multiple label vectors (e.g. permutations) sharing the
+# same training and testing data
+def ClassifyBatch(train_func,
+                  train_cond,
+                  test_func,
+                  classifier,
+                  n_bins,
+                  logreg_basis=None):
+
+    # Labels are permutation x training example
+    train_cond = np.atleast_2d(train_cond)
+    n_perm = train_cond.shape[0]
+
+    if classifier in ['svm', 'svm-precomputed']:
+        # libsvm cannot share fits, so fit each label vector separately with
+        # the classifier of Classify (in case of precomputed kernel
+        # functional data are kernel blocks)
+        pred = list()
+        pred_proba = list()
+        for i_perm in np.arange(n_perm):
+            pred_perm, pred_proba_perm = Classify(
+                train_func=train_func,
+                train_cond=train_cond[i_perm],
+                test_func=test_func,
+                train_fold_mask=None,
+                classifier=classifier,
+                n_bins=n_bins,
+                perm=False)
+            pred.append(pred_perm)
+            pred_proba.append(pred_proba_perm)
+        pred = np.stack(pred)
+        pred_proba = np.stack(pred_proba)
+    elif classifier == 'logreg':
+        # Fit in basis of training examples (exact for L2 penalty, problems
+        # of all label vectors are small and share one matrix product)
+        if logreg_basis is None:
+            logreg_basis = GetSampleBasis(train_func)
+        if logreg_basis is not None:
+            train_func = np.dot(train_func, logreg_basis)
+            test_func = np.dot(test_func, logreg_basis)
+        train_func = np.array(train_func, dtype=np.float64)
+        test_func = np.array(test_func, dtype=np.float64)
+        # All label vectors are shuffles of the same labels (same classes)
+        classes = np.unique(train_cond[0])
+        # Solved to 1/100 of tolerance of LogisticRegression in Classify, so
+        # solutions are closer to the minimum than the ones of
+        # LogisticRegression
+        coef, intercept, n_iter, converged = FitLogregBatch(
+            train_func=train_func,
+            train_cond=train_cond,
+            classes=classes,
+            tol=1e-6)
+        logits = (np.einsum('tf,pfc->ptc', test_func, coef) +
+                  intercept[:, np.newaxis, :])
+        pred_proba = np.exp(logits - logsumexp(logits, axis=2,
+                                               keepdims=True))
+        pred = classes[np.argmax(logits, axis=2)]
+        # Label vectors not converged are fitted again with
+        # LogisticRegression
+        for i_perm in np.where(~converged)[0]:
+            pred[i_perm], pred_proba[i_perm] = Classify(
+                train_func=train_func,
+                train_cond=train_cond[i_perm],
+                test_func=test_func,
+                train_fold_mask=None,
+                classifier=classifier,
+                n_bins=n_bins,
+                perm=False)
+    else:
+        sys.exit('Classifier object not specified!')
+
+    # Return predictions (permutation x test example (x class))
+    return(pred, pred_proba)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:26:52 2026
+
+@author: koch
+"""
+
+import numpy as np
+
+
+# Function to count predictions of each class for events of each class in
+# each permutation (tensor: permutation x event type x predicted bin, one
+# permutation in case i_perm is None). Returns counts and permutation of each
+# slice (sorted)
+def GetConfusionCounts(event_type,
+                       prediction,
+                       n_bins,
+                       i_perm=None):
+
+    event_type = np.asarray(event_type)
+    prediction = np.asarray(prediction)
+    if i_perm is None:
+        i_perm = np.zeros(len(event_type), dtype=int)
+    perm_list, perm_pos = np.unique(np.asarray(i_perm), return_inverse=True)
+
+    # Only events and predictions of directional bins are counted
+    valid = np.logical_and(np.isin(event_type, np.arange(1, n_bins+1)),
+                           np.isin(prediction, np.arange(1, n_bins+1)))
+    flat_index = ((perm_pos[valid] * n_bins +
+                   event_type[valid].astype(int) - 1) * n_bins +
+                  prediction[valid].astype(int) - 1)
+    counts = np.bincount(flat_index,
+                         minlength=len(perm_list) * n_bins * n_bins)
+    counts = counts.reshape(len(perm_list), n_bins, n_bins)
+
+    return(counts, perm_list)
+
+
+# Function to align counts (permutation x event type x predicted bin) so the
+# correct bin of each event type is at the 3rd position
+def AlignConfusion(counts):
+
+    n_bins = counts.shape[-1]
+    # Position in unaligned row of each aligned position (event type x bin)
+    gather = (np.arange(n_bins)[np.newaxis, :] +
+              np.arange(n_bins)[:, np.newaxis] - 2) % n_bins
+    aligned = np.take_along_axis(
+        counts, np.broadcast_to(gather, counts.shape), axis=-1)
+
+    return(aligned)
+
+
+# Function to get balanced accuracy (average recall of event types occurring
+# in testing set, like sklearn.metrics.balanced_accuracy_score) of each
+# permutation from counts (permutation x event type x predicted bin)
+def GetBalancedAccuracy(counts):
+
+    n_events = counts.sum(axis=-1)
+    correct = np.diagonal(counts, axis1=-2, axis2=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        recall = correct / n_events
+    # Event types without events are not part of average
+    present = n_events > 0
+    recall = np.where(present, recall, 0)
+    balanced_acc = recall.sum(axis=-1) / present.sum(axis=-1)
+
+    return(balanced_acc)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 09:41:07 2026
+
+@author: koch
+"""
+
+import numpy as np
+
+
+# Function to correlate each pattern (e.g. held-out event) with each mean 
+# pattern of the bins (same values as np.corrcoef(x, mean_pattern)[0][1:]
+# for each x, but one matrix product for all patterns)
+def CorrelatePatterns(data,
+                      mean_pattern):
+    # Data is patterns x voxels, mean_pattern is bins x voxels (or 
+    # permutations x bins x voxels to correlate with the mean patterns of 
+    # multiple permutations at once)
+    
+    # Normalize each pattern to zero mean and unit length (in double 
+    # precision like np.corrcoef)
+    data = np.array(data, dtype=np.float64)
+    mean_pattern = np.array(mean_pattern, dtype=np.float64)
+    for x in [data, mean_pattern]:
+        x -= np.mean(x, axis=-1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x /= np.sqrt(np.sum(x * x, axis=-1, keepdims=True))
+    
+    # Correlation is dot product of normalized patterns (patterns x bins, or
+    # permutations x patterns x bins)
+    cor = np.matmul(data, np.swapaxes(mean_pattern, -1, -2))
+    # Clip to valid range of correlation (like np.corrcoef)
+    np.clip(cor, -1, 1, out=cor)
+    
+    return(cor)
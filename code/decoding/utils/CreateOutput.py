@@ -7,12 +7,96 @@ Created on Wed Jul 29 16:24:50 2020
 """
 
 import os
+import sys
 import numpy as np
 import pandas as pd
 import numpy
-import copy
 
  
+# Function to get pattern of output files of CreateOutput (path without name
+# of output table and extension)
+def GetOutputFilePattern(base_path,
+                         train_test_modality,
+                         sub_id,
+                         event_file,
+                         mask_index,
+                         x_val_split,
+                         classifier,
+                         balancing_option,
+                         buffer=None,
+                         perm=False,
+                         within_session=None,
+                         reorganize=False):
+    
+    # In case of single input, parse to list for compatibillity
+    if not isinstance(mask_index, list) : 
+        mask_index = [mask_index]
+    # Combine arguzments > 1 to string
+    mask_index = '-'.join(map(str, mask_index))
+    # SVM with precomputed kernel gives the same results as 'svm', so files
+    # keep classifier tag 'svm' and name kernel mode as separate key
+    if classifier == 'svm-precomputed':
+        classifier = 'svm_kernel-precomputed'
+    
+    # Directory to save data to
+    if buffer != None:
+        out_dir = os.path.join(base_path, 'derivatives', 'decoding',
+                               train_test_modality, sub_id, 'buffer')
+    elif buffer == None:
+        out_dir = os.path.join(base_path, 'derivatives', 'decoding',
+                                   train_test_modality, sub_id, 'no_buffer')
+        
+    # Get pattern of save-file
+    if buffer != None:
+        out_file_pattern = os.path.join(out_dir,
+                                (sub_id + '_' + train_test_modality + '_events-' + 
+                                 event_file + 
+                                 '_mask-' + mask_index + 
+                                 '_xval-' + x_val_split +
+                                 '_clf-' + classifier +
+                                 '_buffer-' + str(int(buffer))))
+    elif buffer == None:
+        out_file_pattern = os.path.join(out_dir,
+                                (sub_id + '_' + train_test_modality + '_events-' + 
+                                 event_file + 
+                                 '_mask-' + mask_index + 
+                                 '_xval-' + x_val_split +
+                                 '_clf-' + classifier))
+    # Add within session count
+    if within_session != None:
+        out_file_pattern = out_file_pattern + '_within-' + str(int(within_session))
+    # Add reorganize option(organizing folds for best event distribution)
+    if reorganize:
+        out_file_pattern = out_file_pattern + '_reorg'
+    # Add if balancing was done with SMOTE
+    if balancing_option == 'SMOTE':
+        out_file_pattern = out_file_pattern + '_SMOTE'
+    # Add is data is permuted
+    if perm:
+        out_file_pattern = out_file_pattern + '_perm'
+    
+    return(out_file_pattern)
+
+
+# Function to get all files written by CreateOutput for a pattern of output
+# files
+def GetOutputFiles(out_file_pattern,
+                   perm=False,
+                   output_format='tsv',
+                   perm_output='full'):
+    
+    if perm and (perm_output == 'summary'):
+        table_names = ['events', 'eventstats', 'acc', 'conf']
+        out_files = [out_file_pattern + '_predmat.npy']
+    else:
+        table_names = ['pred', 'eventstats', 'acc', 'conf']
+        out_files = []
+    out_files = out_files + [out_file_pattern + '_' + x + '.' + output_format
+                             for x in table_names]
+    
+    return(out_files)
+
+
 def CreateOutput(base_path,
                  train_test_modality,
                  conditions,
@@ -41,7 +125,12 @@ def CreateOutput(base_path,
                  buffer=None,
                  perm=False,
                  within_session=None,
-                 reorganize=False):
+                 reorganize=False,
+                 output_format='tsv',
+                 perm_output='full'):
+    
+    from OutputTable import WriteOutputTable
+    from ConfusionCounts import GetConfusionCounts, AlignConfusion
     
     # In case of single input, parse to list for compatibillity
     if not isinstance(mask_index, list) : 
@@ -57,12 +146,35 @@ def CreateOutput(base_path,
     # Output: Prediction (incl correlation)
     # ===
     
-    # Get predictions for each event type
-    pred = [np.array(conditions.loc[conditions.event_type == x, 'prediction'])
-            for x in (np.arange(n_bins)+1)]
-    if perm:
-        perm_mask = [np.array(conditions.loc[conditions.event_type == x, 'i_perm'])
-            for x in (np.arange(n_bins)+1)]
+    # Count predictions of each event type (in each permutation)
+    counts, i_perm_list = GetConfusionCounts(
+        event_type=conditions['event_type'],
+        prediction=conditions['prediction'],
+        n_bins=n_bins,
+        i_perm=conditions['i_perm'] if perm else None)
+    
+    # In case only a summary of permutations is saved, predictions of all
+    # permutations are kept as a matrix (permutation x event) and events (the
+    # same in each permutation) are only described once
+    summary = perm and (perm_output == 'summary')
+    if summary:
+        conditions = conditions.sort_values(by='i_perm', kind='stable')
+        n_events = int(len(conditions) / len(i_perm_list))
+        event_id = np.array(conditions[['session', 'event_type', 'tr']],
+                            dtype=float)
+        event_id = event_id.reshape(len(i_perm_list), n_events, 3)
+        # (NaN-safe comparison, equal_nan of np.array_equal needs numpy
+        # 1.19)
+        same_event = np.logical_or(event_id == event_id[0],
+                                   np.logical_and(np.isnan(event_id),
+                                                  np.isnan(event_id[0])))
+        if not same_event.all():
+            sys.exit('Testing events differ between permutations!')
+        # (predicted bins fit into 8 bit)
+        pred_dtype = np.int8 if n_bins < 128 else np.int16
+        pred_mat = np.array(conditions['prediction']).reshape(
+            len(i_perm_list), n_events).astype(pred_dtype)
+        conditions = conditions.iloc[:n_events]
     
     # Form output file
     conditions.loc[: ,'participant_id'] = sub_id
@@ -131,60 +243,53 @@ def CreateOutput(base_path,
     col_order = col_order + cor_cols.tolist()
     if perm:
         col_order = col_order + ['i_perm']
+    # Summary of permutations only describes events
+    if summary:
+        col_order = col_order[:col_order.index('prediction')]
     # In case columns do not exist replace them with NA
     for col in col_order :
         if not col in conditions.columns.tolist():
             conditions.loc[:,col] = None
     conditions = conditions[col_order]
     
-    # Create directory to save data to
-    if buffer != None:
-        out_dir = os.path.join(base_path, 'derivatives', 'decoding',
-                               train_test_modality, sub_id, 'buffer')
-    elif buffer == None:
-        out_dir = os.path.join(base_path, 'derivatives', 'decoding',
-                                   train_test_modality, sub_id, 'no_buffer')
+    # Get pattern of save-file
+    out_file_pattern = GetOutputFilePattern(
+        base_path=base_path,
+        train_test_modality=train_test_modality,
+        sub_id=sub_id,
+        event_file=event_file,
+        mask_index=mask_index,
+        x_val_split=x_val_split,
+        classifier=classifier,
+        balancing_option=balancing_option,
+        buffer=buffer,
+        perm=perm,
+        within_session=within_session,
+        reorganize=reorganize)
         
     # Create directory in case it does not exist
+    out_dir = os.path.dirname(out_file_pattern)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
-        
-    # Get pattern of save-file
-    if buffer != None:
-        out_file_pattern = os.path.join(out_dir,
-                                (sub_id + '_' + train_test_modality + '_events-' + 
-                                 event_file + 
-                                 '_mask-' + mask_index + 
-                                 '_xval-' + x_val_split +
-                                 '_clf-' + classifier +
-                                 '_buffer-' + str(int(buffer))))
-    elif buffer == None:
-        out_file_pattern = os.path.join(out_dir,
-                                (sub_id + '_' + train_test_modality + '_events-' + 
-                                 event_file + 
-                                 '_mask-' + mask_index + 
-                                 '_xval-' + x_val_split +
-                                 '_clf-' + classifier))
-    # Add within session count
-    if within_session != None:
-        out_file_pattern = out_file_pattern + '_within-' + str(int(within_session))
-    # Add reorganize option(organizing folds for best event distribution)
-    if reorganize:
-        out_file_pattern = out_file_pattern + '_reorg'
-    # Add if balancing was done with SMOTE
-    if balancing_option == 'SMOTE':
-        out_file_pattern = out_file_pattern + '_SMOTE'
-    # Add is data is permuted
-    if perm:
-        out_file_pattern = out_file_pattern + '_perm'
     
     
-    out_file = out_file_pattern + '_pred.tsv'
-    conditions.to_csv(out_file,
-                      sep='\t',
-                      na_rep='n/a',
-                      header=True,
-                      index=False)
+    if not summary:
+        WriteOutputTable(data=conditions,
+                         out_file_pattern=out_file_pattern,
+                         table_name='pred',
+                         output_format=output_format)
+    else:
+        # Events (in order of columns of prediction matrix)
+        WriteOutputTable(data=conditions,
+                         out_file_pattern=out_file_pattern,
+                         table_name='events',
+                         output_format=output_format)
+        # Predictions (row: permutation, column: event, renamed once complete
+        # like output tables)
+        tmp_file = (out_file_pattern + '_predmat.' + str(os.getpid()) +
+                    '.tmp.npy')
+        np.save(tmp_file, pred_mat)
+        os.replace(tmp_file, out_file_pattern + '_predmat.npy')
 
     
     
@@ -216,11 +321,10 @@ def CreateOutput(base_path,
     event_stats.loc[:, 'testset_buffer'] = testset_buffer
     
     # Save output
-    out_file = out_file_pattern + '_eventstats.tsv'
-    event_stats.to_csv(out_file,
-                       sep='\t',
-                       na_rep='n/a',
-                       index=False)
+    WriteOutputTable(data=event_stats,
+                     out_file_pattern=out_file_pattern,
+                     table_name='eventstats',
+                     output_format=output_format)
     
     
     # ===
@@ -279,93 +383,42 @@ def CreateOutput(base_path,
     accuracy.loc[: ,'testset_buffer'] = testset_buffer
     
     # Save output
-    out_file = out_file = out_file_pattern + '_acc.tsv'
-    accuracy.to_csv(out_file,
-                    sep='\t',
-                    na_rep='n/a',
-                    header=True,
-                    index=False)
+    WriteOutputTable(data=accuracy,
+                     out_file_pattern=out_file_pattern,
+                     table_name='acc',
+                     output_format=output_format)
     
     
     # ===
     # Output: Confusion matrix
     # ===
     
-    # Function to extract aligned predictions and confusion function from raw 
-    # prediction
-    def GetConfFunc(predictions, n_bins):
-    
-        # Get counts each class got predicted
-        conf_mat = np.zeros([n_bins, n_bins])
-        pred_event = np.arange(n_bins) + 1
-        # For each class
-        for x in np.arange(n_bins):
-            # Get number of predictions of all classes
-            pred_counts = np.array(
-                [np.count_nonzero(predictions[x] == i) for i in pred_event]
-                )
-            conf_mat[x,:] = pred_counts
-        
-        # Shift correct direction to 3rd position for each class
-        conf_mat = [np.roll(conf_mat[x], -x) for x in np.arange(n_bins)]
-        conf_mat = [np.roll(conf_mat[x], 2) for x in np.arange(n_bins)]
-        conf_mat = np.array(conf_mat)
-        
-        # Collapse predictions across directions
-        aligned_pred = np.sum(conf_mat, axis=0)
-        # Standardize based on total predictions
-        conf_fun = aligned_pred / np.sum(aligned_pred)
-        
-        return conf_mat, aligned_pred, conf_fun
+    # Shift correct direction to 3rd position for each class (permutation x
+    # event type x predicted bin)
+    conf_mat = AlignConfusion(counts).astype(float)
+    # Collapse predictions across directions
+    aligned_pred = np.sum(conf_mat, axis=1)
+    # Standardize based on total predictions
+    conf_fun = aligned_pred / np.sum(aligned_pred, axis=1, keepdims=True)
     
-    # Get confusion function for unpermuted data
-    if not perm:
-        conf_mat, aligned_pred, conf_fun = GetConfFunc(pred, n_bins)
-        # Form output file
-        conf = pd.DataFrame(conf_mat)
-        deg_steps = 360 / n_bins
-        conf.columns=np.roll(np.arange(n_bins) * deg_steps, 2).astype(str)
-        conf.loc[:, 'prediction'] = np.core.defchararray.add(
-            np.array('raw_prediction_bin_'), np.arange(1,n_bins+1).astype(str)
-            )
-        # Add confusion function to conf
-        conf_add = copy.deepcopy(conf)
-        conf_add.iloc[0, 0:n_bins] = aligned_pred
-        conf_add.iloc[0, n_bins] = 'aligned_prediction'
-        conf_add.iloc[1, 0:n_bins] = conf_fun
-        conf_add.iloc[1,n_bins] = 'confusion_function'
-        conf_add = conf_add.iloc[0:2,:]
-        conf = conf.append(conf_add)
-        start_cols = np.array(conf.columns.tolist())
-        start_cols = start_cols[np.arange(-1, len(start_cols)-1, 1)]
-    # For permuted data get confusion function for each permutation and append
-    elif perm:
-        conf = pd.DataFrame()
-        for i_perm in np.unique(conditions.i_perm):
-            pred_perm = [pred[x][perm_mask[x] == i_perm] 
-                         for x in np.arange(n_bins)]
-            conf_mat_perm, aligned_pred_perm, conf_fun_perm = (
-                GetConfFunc(pred_perm, n_bins))
-            # Form output file
-            conf_perm = pd.DataFrame(conf_mat_perm)
-            deg_steps = 360 / n_bins
-            conf_perm.columns=np.roll(np.arange(n_bins) * deg_steps, 2).astype(str)
-            conf_perm.loc[:, 'prediction'] = np.core.defchararray.add(
-                np.array('raw_prediction_bin_'), np.arange(1,n_bins+1).astype(str)
-                )
-            # Add confusion function to conf
-            conf_add = copy.deepcopy(conf_perm)
-            conf_add.iloc[0, 0:n_bins] = aligned_pred_perm
-            conf_add.iloc[0, n_bins] = 'aligned_prediction'
-            conf_add.iloc[1, 0:n_bins] = conf_fun_perm
-            conf_add.iloc[1,n_bins] = 'confusion_function'
-            conf_add = conf_add.iloc[0:2,:]
-            conf_perm = conf_perm.append(conf_add)
-            conf_perm.loc[:, 'i_perm'] = i_perm
-            start_cols = np.array(conf_perm.columns.tolist())
-            start_cols = start_cols[np.arange(-1, len(start_cols)-1, 1)]
-            # Append data frame for each permutation
-            conf = conf.append(conf_perm)
+    # Form output file (for each permutation rows of confusion matrix,
+    # aligned predictions, and confusion function)
+    n_perm = len(i_perm_list)
+    deg_steps = 360 / n_bins
+    conf = pd.DataFrame(
+        np.concatenate([conf_mat,
+                        aligned_pred[:, np.newaxis, :],
+                        conf_fun[:, np.newaxis, :]], axis=1).reshape(-1, n_bins),
+        columns=np.roll(np.arange(n_bins) * deg_steps, 2).astype(str))
+    conf.loc[:, 'prediction'] = np.tile(
+        np.append(np.core.defchararray.add(
+            np.array('raw_prediction_bin_'), np.arange(1,n_bins+1).astype(str)),
+            ['aligned_prediction', 'confusion_function']),
+        n_perm)
+    if perm:
+        conf.loc[:, 'i_perm'] = np.repeat(i_perm_list, n_bins + 2)
+    start_cols = np.array(conf.columns.tolist())
+    start_cols = start_cols[np.arange(-1, len(start_cols)-1, 1)]
     
     
     # Add extra columns
@@ -420,9 +473,7 @@ def CreateOutput(base_path,
     conf = conf[col_order]
     
     # Save output
-    out_file = out_file_pattern + '_conf.tsv'
-    conf.to_csv(out_file,
-                sep='\t',
-                na_rep='n/a',
-                header=True,
-                index=False)
\ No newline at end of file
+    WriteOutputTable(data=conf,
+                     out_file_pattern=out_file_pattern,
+                     table_name='conf',
+                     output_format=output_format)
\ No newline at end of file
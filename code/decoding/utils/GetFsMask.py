@@ -7,21 +7,107 @@ Created on Fri Aug 28 13:15:43 2020
 """
 
 import os
+import sys
 import numpy as np
 import pandas as pd
-import numpy
-import copy
 import glob
 import nilearn
 from nilearn.masking import intersect_masks
+from StageNifti import GetStagedFile
 
-# Function to create masks from fmriprep segmentation
-def GetFsMask(base_path,
-              train_test_modality,
-              sub_id,
-              seg_type,
-              mask_index,
-              save_mask) :
+
+# Label volumes of both sessions of each participant and segmentation (loaded
+# once per process) and masks resolved from them (flat voxel indices)
+label_cache = dict()
+
+
+# Function to get label volumes (integer arrays) of both sessions of a
+# participant's fmriprep segmentation. Volumes are cached until the images
+# change
+def LoadLabelVolumes(base_path,
+                     sub_id,
+                     seg_type):
+
+    # Segmentation images of both sessions
+    img_path = os.path.join(base_path,
+                            'derivatives',
+                            'preprocessing',
+                            'fmriprep',
+                            sub_id,
+                            '*',
+                            'func',
+                            '*task-nav*space-T1w_desc-' + seg_type + '*')
+    img_path = sorted(glob.glob(img_path))
+    # Use uncompressed staged copies if available
+    img_path = [GetStagedFile(base_path, x) for x in img_path]
+
+    key = (sub_id, seg_type,
+           tuple((x, os.stat(x).st_mtime_ns) for x in img_path))
+    if key not in label_cache:
+        img = [nilearn.image.load_img(x) for x in img_path[:2]]
+        labels = list()
+        for x in img:
+            # Keep labels in integer type of file (no float copy)
+            data = np.asanyarray(x.dataobj)
+            if not np.issubdtype(data.dtype, np.integer):
+                data = np.rint(data).astype(np.int32)
+            labels.append(data)
+        # Drop cached volumes of older versions of images
+        for old_key in [x for x in label_cache if x[:2] == key[:2]]:
+            del label_cache[old_key]
+        label_cache[key] = {'ref_img': img[0],
+                            'labels': labels,
+                            'masks': dict()}
+
+    return(label_cache[key])
+
+
+# Function to drop cached label volumes and masks of a participant (of all
+# participants in case sub_id is None), e.g. once a participant is done
+def ClearLabelCache(sub_id=None):
+    for key in [x for x in label_cache if sub_id is None or x[0] == sub_id]:
+        del label_cache[key]
+
+
+# Function to get flat voxel indices of masks of any number of groups of
+# labels (intersection of both sessions). All groups are resolved in one pass
+# over the volumes, resolved masks are cached
+def GetFsMaskIndex(base_path,
+                   sub_id,
+                   seg_type,
+                   mask_list):
+
+    volumes = LoadLabelVolumes(base_path, sub_id, seg_type)
+    mask_list = [tuple(sorted(np.atleast_1d(x).tolist())) for x in mask_list]
+
+    todo = [x for x in set(mask_list) if x not in volumes['masks']]
+    if len(todo) > 0:
+        # Voxels labelled with any requested label in both sessions
+        all_labels = np.unique(np.concatenate(todo))
+        labels_ses1 = volumes['labels'][0].reshape(-1)
+        labels_ses2 = volumes['labels'][1].reshape(-1)
+        candidates = np.where(
+            np.logical_and(np.isin(labels_ses1, all_labels),
+                           np.isin(labels_ses2, all_labels)))[0]
+        cand_ses1 = labels_ses1[candidates]
+        cand_ses2 = labels_ses2[candidates]
+        # Voxels of each group (label of group in both sessions)
+        for mask_value in todo:
+            in_mask = np.logical_and(np.isin(cand_ses1, mask_value),
+                                     np.isin(cand_ses2, mask_value))
+            volumes['masks'][mask_value] = candidates[in_mask]
+
+    return([volumes['masks'][x] for x in mask_list], volumes['ref_img'])
+
+
+# Function to create masks from fmriprep segmentation (one mask image for
+# each group of labels in mask_list)
+def GetFsMaskList(base_path,
+                  train_test_modality,
+                  sub_id,
+                  seg_type,
+                  mask_list,
+                  save_mask):
 
     # Load segmentation table
     seg_path = os.path.join(base_path,
@@ -31,64 +117,69 @@ def GetFsMask(base_path,
                             'desc-' + seg_type + '_dseg.tsv')
     seg = pd.read_csv(seg_path, sep='\t')
 
+    # Sort mask indices and check that they are part of segmentation
+    mask_list = [sorted(np.atleast_1d(x).tolist()) for x in mask_list]
+    for mask_value in mask_list:
+        for x in mask_value:
+            if not any(seg['index'] == x):
+                sys.exit('Mask index ' + str(x) + ' not part of ' + seg_path)
+
+    # Get voxels of each mask (intersection of both sessions)
+    mask_voxels, ref_img = GetFsMaskIndex(base_path=base_path,
+                                          sub_id=sub_id,
+                                          seg_type=seg_type,
+                                          mask_list=mask_list)
+
+    mask_imgs = list()
+    for mask_value, voxels in zip(mask_list, mask_voxels):
+
+        # Parse binarized values back to img
+        data_intersect = np.zeros(ref_img.shape, dtype=int)
+        data_intersect.reshape(-1)[voxels] = 1
+        mask_intersect = nilearn.image.new_img_like(ref_img, data_intersect)
+        mask_imgs.append(mask_intersect)
+
+        # If requested, save mask to nii.gz
+        if save_mask:
+            out_dir = os.path.join(base_path, 'derivatives', 'decoding',
+                                   train_test_modality, sub_id)
+            # Create directory in case it does not exist
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            out_file = os.path.join(out_dir,
+                                    (sub_id + '_seg-' + seg_type +
+                                     '_mask-' + '-'.join(map(str, mask_value)) +
+                                     '.nii.gz'))
+            # Save img (unless identical mask was saved before)
+            if os.path.exists(out_file):
+                saved = nilearn.image.load_img(out_file)
+                if (np.array_equal(saved.affine, mask_intersect.affine) and
+                    np.array_equal(np.asanyarray(saved.dataobj),
+                                   data_intersect)):
+                    continue
+            mask_intersect.to_filename(out_file)
+
+    return(mask_imgs)
+
+
+# Function to create mask from fmriprep segmentation
+def GetFsMask(base_path,
+              train_test_modality,
+              sub_id,
+              seg_type,
+              mask_index,
+              save_mask) :
 
     # Sort mask index
-    if isinstance(mask_index, list) : 
+    if isinstance(mask_index, list) :
         mask_index.sort()
 
-    # Get mask name and value based on what is provided
-    if not isinstance(mask_index, list) :
-        mask_value = [copy.deepcopy(mask_index)]
-    else :
-        mask_value = copy.deepcopy(mask_index)
-    mask_name = [seg.loc[seg['index'] == x, 'name'].values[0] for x in mask_value]
-
-    # load segmentation image of both sessions
-    img_path = os.path.join(base_path,
-                            'derivatives',
-                            'preprocessing',
-                            'fmriprep',
-                            sub_id,
-                            '*',
-                            'func',
-                            '*task-nav*space-T1w_desc-' + seg_type + '*')
-    img_path = glob.glob(img_path)
-    img_ses1 = nilearn.image.load_img(img_path[0])
-    img_ses2 = nilearn.image.load_img(img_path[1])
-
-    # Convert images to matrices
-    data_ses1 = img_ses1.get_data()
-    #np.where(data_ses1 == 2011)
-    data_ses2 = img_ses2.get_data()
-    #np.where(data_ses2 == 2011)
-
-    # Mask requested values to 1
-    data_ses1 = [np.array(data_ses1 == x, dtype=int) for x in mask_value]
-    data_ses1 = sum(data_ses1)
-    data_ses2 = [np.array(data_ses2 == x, dtype=int) for x in mask_value]
-    data_ses2 = sum(data_ses2)
-
-    # Intersect masks
-    data_intersect = sum([data_ses1, data_ses2])
-    data_intersect[data_intersect != 2] = 0
-    data_intersect[data_intersect != 0] = 1
-
-    # Parse binarized values back to img
-    mask_intersect = nilearn.image.new_img_like(img_ses1, data_intersect)
-
-    # If requested, save mask to nii.gz
-    if save_mask :
-        out_dir = os.path.join(base_path, 'derivatives', 'decoding',
-                               train_test_modality, sub_id)
-        # Create directory in case it does not exist
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-        # Save img
-        out_file = os.path.join(out_dir,
-                                (sub_id + '_seg-' + seg_type +
-                                 '_mask-' + '-'.join(map(str, mask_value)) +
-                                 '.nii.gz'))
-        mask_intersect.to_filename(out_file)
+    mask_intersect = GetFsMaskList(base_path=base_path,
+                                   train_test_modality=train_test_modality,
+                                   sub_id=sub_id,
+                                   seg_type=seg_type,
+                                   mask_list=[mask_index],
+                                   save_mask=save_mask)[0]
 
     return(mask_intersect)
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 13 09:12:36 2026
+
+@author: koch
+"""
+
+import hashlib
+import numpy as np
+
+
+# Function to get a reproducible seed for one permutation (independent of the
+# order or process permutations are run in). Sessions and buffer of the
+# training set and testset_buffer are part of the seed, so permutations of
+# different calls (e.g. session 1 and 2 of within-session decoding) are
+# independent
+def GetPermSeed(sub_id,
+                mask_index,
+                i_perm,
+                session=None,
+                buffer=None,
+                testset_buffer=False):
+
+    # In case of single input, parse to list for compatibillity
+    if not isinstance(mask_index, list) :
+        mask_index = [mask_index]
+
+    # Hash participant, mask, training set, and permutation (python's hash()
+    # is salted for each process, so use sha256 instead)
+    key = sub_id + '_mask-' + '-'.join(map(str, mask_index))
+    if session is not None:
+        key = key + '_ses-' + '-'.join(map(str, np.atleast_1d(session)))
+    if buffer is not None:
+        key = key + '_buffer-' + '-'.join(map(str, np.atleast_1d(buffer)))
+    if testset_buffer:
+        key = key + '_testbuffer'
+    key = key + '_perm-' + str(int(i_perm))
+    seed = int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:8], 16)
+
+    return(seed)
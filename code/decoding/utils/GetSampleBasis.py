@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:02:19 2026
+
+@author: koch
+"""
+
+import numpy as np
+
+
+# Function to get an orthonormal basis (voxels x examples) spanning all 
+# training examples. With an L2 penalty the coefficients of logistic 
+# regression lie in this span, so fitting on the projected data (examples x 
+# examples) gives the same solution as fitting on all voxels
+def GetSampleBasis(train_func):
+
+    n_examples, n_features = train_func.shape
+    
+    # No reduction possible if there are fewer voxels than examples
+    if n_features <= n_examples:
+        return(None)
+    
+    # Thin QR of transposed training data (spans all examples, also if 
+    # examples are repeated, e.g. by upsampling)
+    basis, _ = np.linalg.qr(np.array(train_func, dtype=np.float64).T)
+    
+    return(basis)
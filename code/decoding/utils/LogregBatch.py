@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:42:05 2026
+
+@author: koch
+"""
+
+import numpy as np
+from scipy.special import logsumexp
+
+
+# Function to get loss and gradient of multinomial logistic regressions (L2,
+# balanced class weights, same objective as LogisticRegression with lbfgs in
+# Classify) for multiple label vectors sharing the training data. All logits
+# come from one matrix product. Coefficients are label vector x feature x
+# class, gradient is label vector x (coefficients, intercepts)
+def LogregBatchLossGrad(train_func,
+                        onehot,
+                        sample_weight,
+                        coef,
+                        intercept,
+                        C=1.0):
+
+    n_samples, n_features = train_func.shape
+    n_perm, _, n_classes = coef.shape
+
+    # Logits of all label vectors (sample x label vector x class)
+    logits = np.dot(train_func,
+                    coef.transpose(1, 0, 2).reshape(n_features, -1))
+    logits = logits.reshape(n_samples, n_perm, n_classes) + intercept
+    lse = logsumexp(logits, axis=2)
+    loss = (np.sum(sample_weight *
+                   (lse - np.sum(logits * onehot, axis=2)), axis=0) +
+            0.5 / C * np.sum(coef ** 2, axis=(1, 2)))
+
+    # Gradient with respect to logits
+    diff = ((np.exp(logits - lse[:, :, np.newaxis]) - onehot) *
+            sample_weight[:, :, np.newaxis])
+    grad_coef = np.dot(train_func.T, diff.reshape(n_samples, -1))
+    grad_coef = (grad_coef.reshape(n_features, n_perm, n_classes)
+                 .transpose(1, 0, 2) + coef / C)
+    grad = np.concatenate([grad_coef.reshape(n_perm, -1), diff.sum(axis=0)],
+                          axis=1)
+
+    return(loss, grad)
+
+
+# Function to fit multinomial logistic regressions for multiple label vectors
+# at once (e.g. permutations). Each label vector is an independent L-BFGS
+# problem with its own history and line search (problems stop once
+# converged), only the loss and gradient of all open problems are computed
+# together. Starts from zero unless coef_init/intercept_init are given.
+# Returns coefficients (label vector x feature x class), intercepts, number of
+# iterations, and convergence of each label vector
+def FitLogregBatch(train_func,
+                   train_cond,
+                   classes,
+                   C=1.0,
+                   tol=1e-4,
+                   max_iter=1000,
+                   n_corrections=10,
+                   coef_init=None,
+                   intercept_init=None):
+
+    n_perm = train_cond.shape[0]
+    n_samples, n_features = train_func.shape
+    n_classes = len(classes)
+    n_coef = n_features * n_classes
+
+    # One-hot labels (sample x label vector x class)
+    label_index = np.searchsorted(classes, train_cond.T)
+    onehot = np.zeros([n_samples, n_perm, n_classes])
+    np.put_along_axis(onehot, label_index[:, :, np.newaxis], 1, axis=2)
+    # Balanced class weights (n_samples / (n_classes * count of class))
+    class_weight = n_samples / (n_classes * onehot.sum(axis=0))
+    sample_weight = np.take_along_axis(class_weight.T, label_index, axis=0)
+
+    # Loss and gradient of a subset of label vectors (parameters are label
+    # vector x (coefficients, intercepts))
+    def LossGrad(w, index):
+        return(LogregBatchLossGrad(
+            train_func=train_func,
+            onehot=onehot[:, index],
+            sample_weight=sample_weight[:, index],
+            coef=w[:, :n_coef].reshape(len(index), n_features, n_classes),
+            intercept=w[:, n_coef:],
+            C=C))
+
+    w = np.zeros([n_perm, n_coef + n_classes])
+    if coef_init is not None:
+        w[:, :n_coef] = np.reshape(coef_init, (n_perm, n_coef))
+    if intercept_init is not None:
+        w[:, n_coef:] = intercept_init
+    loss, grad = LossGrad(w, np.arange(n_perm))
+    # History of steps and gradient changes of each label vector (skipped
+    # updates are stored as zeros and have no effect)
+    s_hist = np.zeros([n_perm, n_corrections, w.shape[1]])
+    y_hist = np.zeros([n_perm, n_corrections, w.shape[1]])
+    rho = np.zeros([n_perm, n_corrections])
+    gamma = np.ones(n_perm)
+    n_iter = np.zeros(n_perm, dtype=int)
+    # Converged like scipy's L-BFGS-B used by LogisticRegression (largest
+    # gradient entry below tol)
+    open_perm = np.max(np.abs(grad), axis=1) > tol
+    failed = np.zeros(n_perm, dtype=bool)
+
+    for i_iter in np.arange(max_iter):
+        index = np.where(open_perm)[0]
+        if len(index) == 0:
+            break
+
+        # Search direction (two-loop recursion, newest correction first)
+        hist = [(i_iter - 1 - x) % n_corrections
+                for x in np.arange(min(i_iter, n_corrections))]
+        direction = -grad[index]
+        alpha = np.zeros([len(index), n_corrections])
+        for j in hist:
+            alpha[:, j] = rho[index, j] * np.einsum(
+                'ij,ij->i', s_hist[index, j], direction)
+            direction -= alpha[:, j, np.newaxis] * y_hist[index, j]
+        direction *= gamma[index, np.newaxis]
+        for j in hist[::-1]:
+            beta = rho[index, j] * np.einsum(
+                'ij,ij->i', y_hist[index, j], direction)
+            direction += ((alpha[:, j] - beta)[:, np.newaxis] *
+                          s_hist[index, j])
+        slope = np.einsum('ij,ij->i', grad[index], direction)
+        # Steepest descent in case direction is not a descent direction
+        uphill = slope >= 0
+        direction[uphill] = -grad[index][uphill]
+        slope[uphill] = -np.sum(grad[index][uphill] ** 2, axis=1)
+
+        # Backtracking line search (Armijo condition, with slack for rounding
+        # of loss close to minimum)
+        step = np.ones(len(index))
+        if i_iter == 0:
+            step = np.minimum(1, 1 / np.sum(np.abs(grad[index]), axis=1))
+        new_loss = loss[index].copy()
+        new_grad = grad[index].copy()
+        todo = np.arange(len(index))
+        for i_search in np.arange(30):
+            trial_loss, trial_grad = LossGrad(
+                w[index[todo]] + step[todo, np.newaxis] * direction[todo],
+                index[todo])
+            accept = trial_loss <= (loss[index[todo]] +
+                                    1e-4 * step[todo] * slope[todo] +
+                                    1e-12 * np.abs(loss[index[todo]]))
+            new_loss[todo[accept]] = trial_loss[accept]
+            new_grad[todo[accept]] = trial_grad[accept]
+            todo = todo[~accept]
+            if len(todo) == 0:
+                break
+            step[todo] = step[todo] / 2
+        # Label vectors without acceptable step stop (fitted again below)
+        step[todo] = 0
+        failed[index[todo]] = True
+
+        # Update history (only if curvature condition holds)
+        s = step[:, np.newaxis] * direction
+        y = new_grad - grad[index]
+        sy = np.einsum('ij,ij->i', s, y)
+        yy = np.einsum('ij,ij->i', y, y)
+        valid = sy > 1e-10 * np.sqrt(np.sum(s ** 2, axis=1) * yy)
+        j = i_iter % n_corrections
+        s_hist[index, j] = s * valid[:, np.newaxis]
+        y_hist[index, j] = y * valid[:, np.newaxis]
+        rho[index, j] = np.where(valid, 1 / np.where(valid, sy, 1), 0)
+        gamma[index] = np.where(valid, sy / np.where(valid, yy, 1),
+                                gamma[index])
+
+        w[index] += s
+        loss[index] = new_loss
+        grad[index] = new_grad
+        n_iter[index] += 1
+        open_perm[index] = np.max(np.abs(new_grad), axis=1) > tol
+        open_perm[failed] = False
+
+    converged = np.max(np.abs(grad), axis=1) <= tol
+    coef = w[:, :n_coef].reshape(n_perm, n_features, n_classes)
+    intercept = w[:, n_coef:]
+
+    return(coef, intercept, n_iter, converged)
+
+
+# Function to refine a fitted multinomial LogisticRegression (balanced class
+# weights) from its solution until the largest entry of the gradient of its
+# penalized loss is below tol. Coefficients of the fitted object are replaced.
+# Returns number of iterations, None if not converged (object unchanged)
+def RefineLogreg(logreg,
+                 train_func,
+                 train_cond,
+                 tol,
+                 max_iter=1000):
+
+    classes = logreg.classes_
+    coef = logreg.coef_
+    intercept = logreg.intercept_
+    # Binary problems are stored as class 1 (class 0 has negated coefficients)
+    if len(classes) == 2:
+        coef = np.concatenate([-coef, coef])
+        intercept = np.concatenate([-intercept, intercept])
+
+    coef, intercept, n_iter, converged = FitLogregBatch(
+        train_func=np.array(train_func, dtype=np.float64),
+        train_cond=np.asarray(train_cond)[np.newaxis],
+        classes=classes,
+        C=logreg.C,
+        tol=tol,
+        max_iter=max_iter,
+        coef_init=coef.T[np.newaxis],
+        intercept_init=intercept[np.newaxis])
+    if not converged[0]:
+        return(None)
+
+    coef = coef[0].T
+    intercept = intercept[0]
+    if len(classes) == 2:
+        coef = (coef[1:] - coef[:1]) / 2
+        intercept = (intercept[1:] - intercept[:1]) / 2
+    logreg.coef_ = coef
+    logreg.intercept_ = intercept
+
+    return(int(n_iter[0]))
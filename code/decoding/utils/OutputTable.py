@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:20:43 2026
+
+@author: koch
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+
+# Columns with few distinct values in an output file, dictionary-encoded in
+# columnar output: parameters of the run (same value in every row) and columns
+# varying between rows but only over a few values ('set', 'held_out_split',
+# 'prediction'). Values of every row are kept (ReadOutputTable returns plain
+# columns)
+meta_cols = ['participant_id',
+             'age',
+             'sex',
+             'group',
+             'intervention',
+             'mask_seg',
+             'mask_index',
+             'classifier',
+             'smoothing_fwhm',
+             'essential_confounds',
+             'detrend',
+             'high_pass',
+             'ext_std_thres',
+             'standardize',
+             'n_bins',
+             'event_file',
+             'balancing_option',
+             'balance_strategy',
+             'x_val_split',
+             'testset_buffer',
+             'set',
+             'held_out_split',
+             'prediction']
+
+
+# Function to import pyarrow (only needed for columnar output)
+def ImportArrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit('Output format "parquet" requires pyarrow (pip install pyarrow).')
+    return(pyarrow, pyarrow.parquet)
+
+
+# Function to save one output table of CreateOutput (e.g. table_name 'pred'),
+# either as .tsv or as .parquet with typed columns and dictionary-encoded
+# parameters of the run
+def WriteOutputTable(data,
+                     out_file_pattern,
+                     table_name,
+                     output_format='tsv'):
+
+    # Tables are written to a temporary file and renamed once complete (an
+    # existing output file is always complete, e.g. after a killed job)
+    if output_format == 'tsv':
+        out_file = out_file_pattern + '_' + table_name + '.tsv'
+        tmp_file = out_file + '.' + str(os.getpid()) + '.tmp'
+        data.to_csv(tmp_file,
+                    sep='\t',
+                    na_rep='n/a',
+                    header=True,
+                    index=False)
+    elif output_format == 'parquet':
+        pa, pq = ImportArrow()
+        out_file = out_file_pattern + '_' + table_name + '.parquet'
+        tmp_file = out_file + '.' + str(os.getpid()) + '.tmp'
+        data = data.copy()
+        for col in data.columns:
+            values = data[col]
+            # Columns mixing strings and numbers (e.g. held-out split and
+            # 'across') are stored as strings (like in .tsv)
+            if values.dtype == object:
+                types = set(type(x) for x in values if not pd.isnull(x))
+                if len(types) > 1:
+                    values = values.map(lambda x: x if pd.isnull(x) else str(x))
+            # Repeated parameters are stored once per file (dictionary)
+            if col in meta_cols and values.notnull().any():
+                values = values.astype('category')
+            data[col] = values
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        pq.write_table(table, tmp_file)
+    else:
+        sys.exit('Output format not specified!')
+    os.replace(tmp_file, out_file)
+
+    return(out_file)
+
+
+# Function to load an output table written by WriteOutputTable (.tsv or
+# .parquet, dictionary-encoded columns are returned as plain columns)
+def ReadOutputTable(out_file):
+
+    if out_file.endswith('.tsv'):
+        data = pd.read_csv(out_file, sep='\t')
+    elif out_file.endswith('.parquet'):
+        pa, pq = ImportArrow()
+        data = pq.read_table(out_file).to_pandas()
+        for col in data.columns:
+            if isinstance(data[col].dtype, pd.CategoricalDtype):
+                data[col] = np.asarray(data[col])
+    else:
+        sys.exit('Unknown output file type: ' + out_file)
+
+    return(data)
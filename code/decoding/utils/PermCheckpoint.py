@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:37:09 2026
+
+@author: koch
+"""
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+# Function to get checkpoint directory of one permutation run. The directory
+# name contains a hash of all parameters results depend on and of the data
+# (raw data, conditions, training mask), so a restarted job with the same
+# parameters finds the checkpoint of the killed job
+def GetPermCheckpointDir(base_path,
+                         sub_id,
+                         mask_index,
+                         parameters,
+                         raw_mat,
+                         cond,
+                         train_mask):
+
+    # Describe data by hashes
+    data_state = {
+        'raw_mat': hashlib.sha256(
+            np.ascontiguousarray(raw_mat).tobytes()).hexdigest(),
+        'cond': hashlib.sha256(
+            pd.util.hash_pandas_object(cond, index=True).values.tobytes()
+            ).hexdigest(),
+        'train_mask': hashlib.sha256(
+            np.array(train_mask, dtype=bool).tobytes()).hexdigest()}
+
+    # Hash parameters and data
+    key = {'sub_id': sub_id,
+           'mask_index': mask_index,
+           'parameters': parameters,
+           'data': data_state}
+    key = json.dumps(key, sort_keys=True, default=str)
+    key_hash = hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    checkpoint_dir = os.path.join(base_path, 'derivatives', 'decoding',
+                                  'checkpoint', sub_id,
+                                  'mask-' + '-'.join(map(str, np.atleast_1d(
+                                      mask_index))) +
+                                  '_perm-' + key_hash[:16])
+
+    return(checkpoint_dir, key)
+
+
+# Function to load checkpoint of a permutation run. Returns results of all
+# finished chunks (dict: chunk index -> results), empty in case there is no
+# (valid) checkpoint
+def LoadPermCheckpoint(checkpoint_dir,
+                       key):
+
+    results = dict()
+    state_file = os.path.join(checkpoint_dir, 'checkpoint.json')
+    if not os.path.exists(state_file):
+        return(results)
+
+    with open(state_file, 'r') as in_file:
+        state = json.load(in_file)
+    # Checkpoint of different run (should not happen, directory is named by
+    # hash of key)
+    if state['key'] != json.loads(key):
+        return(results)
+
+    for i_chunk in state['finished']:
+        chunk_file = os.path.join(checkpoint_dir,
+                                  'chunk-' + str(i_chunk).zfill(5) + '.pkl')
+        # Chunks are written before the state file, so every finished chunk
+        # should exist (otherwise chunk is run again)
+        if os.path.exists(chunk_file):
+            with open(chunk_file, 'rb') as in_file:
+                results[i_chunk] = pickle.load(in_file)
+
+    return(results)
+
+
+# Function to save results of one finished chunk of permutations and update
+# state of run (finished chunks, their permutations, and seeds). Both files
+# are replaced atomically so a job killed while writing leaves a valid
+# checkpoint
+def SavePermChunk(checkpoint_dir,
+                  key,
+                  i_chunk,
+                  result,
+                  finished,
+                  perm_chunks,
+                  seed_chunks):
+
+    # Create directory in case it does not exist
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+
+    chunk_file = os.path.join(checkpoint_dir,
+                              'chunk-' + str(i_chunk).zfill(5) + '.pkl')
+    tmp_file = chunk_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'wb') as out_file:
+        pickle.dump(result, out_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, chunk_file)
+
+    # State of run (random numbers of each permutation only depend on its
+    # seed, so seeds of finished permutations describe random state)
+    finished = sorted(finished)
+    done_perms = [int(x) for i in finished for x in perm_chunks[i]]
+    state = {'key': json.loads(key),
+             'n_chunks': len(perm_chunks),
+             'finished': finished,
+             'n_perm_finished': len(done_perms),
+             'last_i_perm': max(done_perms),
+             'perm_seed': {str(x): int(seed)
+                           for i in finished
+                           for x, seed in zip(perm_chunks[i],
+                                              seed_chunks[i])}}
+    state_file = os.path.join(checkpoint_dir, 'checkpoint.json')
+    tmp_file = state_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'w') as out_file:
+        json.dump(state, out_file, indent=4)
+    os.replace(tmp_file, state_file)
+
+
+# Function to remove checkpoint once results of all permutations are chained
+def RemovePermCheckpoint(checkpoint_dir):
+    if os.path.exists(checkpoint_dir):
+        shutil.rmtree(checkpoint_dir)
+
+
+# Function to get file marking outputs of a permutation run as complete (json
+# sidecar next to the outputs, named by the pattern all output files of a call
+# share)
+def GetPermDoneFile(out_files):
+    return(os.path.commonprefix(list(out_files)) + 'checkpoint.json')
+
+
+# Function to describe an output file by size and time of last modification
+def GetFileState(file):
+    file_stat = os.stat(file)
+    return({'size': file_stat.st_size,
+            'mtime_ns': file_stat.st_mtime_ns})
+
+
+# Function to mark outputs of a permutation run as complete. Stores the key of
+# the run and the state of each output file, so outputs overwritten later
+# (e.g. by a run without checkpoint) are not taken as outputs of this run
+def SavePermDone(key,
+                 out_files):
+
+    state = {'key': json.loads(key),
+             'outputs': {os.path.basename(x): GetFileState(x)
+                         for x in out_files}}
+    done_file = GetPermDoneFile(out_files)
+    tmp_file = done_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'w') as out_file:
+        json.dump(state, out_file, indent=4)
+    os.replace(tmp_file, done_file)
+
+
+# Function to check if outputs of a permutation run exist and were written by
+# a run with the same key (parameters and data)
+def CheckPermDone(key,
+                  out_files):
+
+    done_file = GetPermDoneFile(out_files)
+    if not (os.path.exists(done_file) and
+            all(os.path.exists(x) for x in out_files)):
+        return(False)
+
+    with open(done_file, 'r') as in_file:
+        state = json.load(in_file)
+    outputs = {os.path.basename(x): GetFileState(x) for x in out_files}
+
+    return(state['key'] == json.loads(key) and state['outputs'] == outputs)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 10:02:41 2026
+
+@author: koch
+"""
+
+import numpy as np
+from sklearn.utils import check_random_state
+
+
+# Function to create shuffled training labels for multiple permutations at
+# once (labels are shuffled within each fold, like in Classify)
+def PermuteLabels(labels,
+                  groups,
+                  n_perm,
+                  random_state=None):
+
+    # Get random number generator (global numpy state if not specified, a
+    # list holds one generator per permutation)
+    if not isinstance(random_state, list):
+        random_state = check_random_state(random_state)
+
+    labels = np.asarray(labels)
+    groups = np.asarray(groups)
+
+    # Start with unshuffled labels for each permutation (permutation x label)
+    perm_labels = np.tile(labels, (n_perm, 1))
+
+    # Shuffle labels within each fold (rows without fold, e.g. synthetic SMOTE
+    # data, never match a fold and keep their label)
+    for i_fold in np.unique(groups):
+        fold_index = np.where(groups == i_fold)[0]
+        # Random order of labels for each permutation
+        if isinstance(random_state, list):
+            keys = np.array([rng.random_sample(len(fold_index))
+                             for rng in random_state])
+        else:
+            keys = random_state.random_sample((n_perm, len(fold_index)))
+        order = np.argsort(keys, axis=1)
+        perm_labels[:, fold_index] = labels[fold_index][order]
+
+    # Return permuted labels
+    return(perm_labels)
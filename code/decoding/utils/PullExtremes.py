@@ -7,11 +7,14 @@ Created on Mon Aug  3 10:52:36 2020
 """
 
 import numpy as np
-import copy
+import pandas as pd
 
 
 # Function to pull extreme values
-def PullExtremes(data,threshold_std=5):
+def PullExtremes(data,
+                 threshold_std=5,
+                 in_place=False,
+                 return_summary=False):
     # Data is TR x Voxels
     # Get mean and std of each voxel time course
     timecourse_mean = np.mean(data,axis=0)
@@ -20,37 +23,39 @@ def PullExtremes(data,threshold_std=5):
     thresh_pos = timecourse_mean + threshold_std * timecourse_std
     thresh_neg = timecourse_mean - threshold_std * timecourse_std
     
+    # Find all within-voxel-values above or below extreme thresholds
+    # (thresholds broadcast over TRs)
+    ind_pos = data >= thresh_pos
+    ind_neg = data <= thresh_neg
+    n_before = np.sum(ind_pos | ind_neg, axis=0)
     # Give message to user
-    Data2 = np.zeros(data.shape, dtype=bool)
-    for i in range(data.shape[1]):
-        Data2[:,i] = (data[:,i] >= thresh_pos[i]) | (data[:,i] <= thresh_neg[i]) 
-    print('There are %d extreme data points before correction' % (np.sum(Data2)))
+    print('There are %d extreme data points before correction' % (np.sum(n_before)))
     
-    # Form result
-    data_out = copy.deepcopy(data)
-    # Find index for all within-voxel-values above or below extreme thresholds
-    for i in range(data_out.shape[1]):
-        ind_pos = data_out[:,i] >= thresh_pos[i]
-        ind_neg = data_out[:,i] <= thresh_neg[i]
-        # If within a TR any voxel was above/below threshold half it's 
-        # distance to the mean
-        for j,(P,N) in enumerate(zip(ind_pos, ind_neg)):
-            if P: data_out[j,i] = (
-                    timecourse_mean[i] + 
-                    0.5 * (abs(timecourse_mean[i] - data_out[j,i]))
-                    )
-            if N: data_out[j,i] = (
-                    timecourse_mean[i] - 
-                    0.5 * (abs(timecourse_mean[i] - data_out[j,i]))
-                    )
+    # Form result (overwrite input data if in-place correction is requested)
+    if in_place:
+        data_out = data
+    else:
+        data_out = data.copy()
+    # If within a TR any voxel was above/below threshold half it's 
+    # distance to the mean
+    np.copyto(data_out,
+              timecourse_mean + 0.5 * np.abs(timecourse_mean - data_out),
+              where=ind_pos)
+    np.copyto(data_out,
+              timecourse_mean - 0.5 * np.abs(timecourse_mean - data_out),
+              where=ind_neg)
     
     # Give message to user
-    Data2 = np.zeros(data_out.shape, dtype=bool)
-    for i in range(data_out.shape[1]):
-        Data2[:,i] = (
-            (data_out[:,i] >= thresh_pos[i]) | (data_out[:,i] <= thresh_neg[i])
-            )
-    print('After correction: %d extremes' % (np.sum(Data2)))
+    n_after = np.sum((data_out >= thresh_pos) | (data_out <= thresh_neg),
+                     axis=0)
+    print('After correction: %d extremes' % (np.sum(n_after)))
+    
+    # Return result (and number of extremes of each voxel if requested)
+    if return_summary:
+        summary = pd.DataFrame({'voxel': np.arange(data_out.shape[1]),
+                                'n_extremes_before': n_before,
+                                'n_extremes_after': n_after})
+        return(data_out, summary)
+    else:
+        return(data_out)
     
-    # Return result
-    return(data_out)
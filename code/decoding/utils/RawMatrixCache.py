@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 10:05:48 2026
+
+@author: koch
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+
+# Function to get cache file of a preprocessed raw matrix (TR x voxel) of one
+# session. The file name contains a hash of all preprocessing parameters and
+# of the state (size, modification time) of all input files
+def GetRawMatrixCacheFile(base_path,
+                          sub_id,
+                          ses_id,
+                          parameters,
+                          input_files):
+
+    # Describe state of input files
+    input_state = dict()
+    for file in sorted(input_files):
+        stat = os.stat(file)
+        input_state[os.path.relpath(file, base_path)] = [stat.st_size,
+                                                         stat.st_mtime_ns]
+
+    # Hash parameters and input files
+    key = {'sub_id': sub_id,
+           'ses_id': ses_id,
+           'parameters': parameters,
+           'input_files': input_state}
+    key = json.dumps(key, sort_keys=True, default=str)
+    key_hash = hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    cache_file = os.path.join(base_path, 'derivatives', 'decoding', 'cache',
+                              sub_id,
+                              sub_id + '_' + ses_id + '_raw-' +
+                              key_hash[:16] + '.npy')
+
+    return(cache_file, key)
+
+
+# Function to load cached raw matrix (memory-mapped, read-only)
+def LoadRawMatrixCache(cache_file):
+    return(np.load(cache_file, mmap_mode='r'))
+
+
+# Function to save raw matrix (uncompressed .npy so it can be memory-mapped)
+# together with a .json sidecar describing the key
+def SaveRawMatrixCache(cache_file,
+                       data,
+                       key):
+
+    out_dir = os.path.dirname(cache_file)
+    # Create directory in case it does not exist
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    # Write to temporary file first so parallel jobs never read half-written
+    # files
+    tmp_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'wb') as out_file:
+        np.save(out_file, np.ascontiguousarray(data))
+    os.replace(tmp_file, cache_file)
+
+    sidecar = os.path.splitext(cache_file)[0] + '.json'
+    with open(sidecar, 'w') as out_file:
+        json.dump(json.loads(key), out_file, indent=4)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:05:31 2026
+
+@author: koch
+"""
+
+import os
+import re
+import sys
+import glob
+import fnmatch
+import sqlite3
+import pandas as pd
+
+
+# Outputs written by CreateOutput (one table each in store)
+output_kinds = ['pred', 'events', 'eventstats', 'acc', 'conf']
+
+# Parameters only encoded in names of output files
+file_cols = ['sub_id',
+             'modality',
+             'event_file',
+             'mask_index',
+             'x_val_split',
+             'classifier',
+             'train_buffer',
+             'within_session',
+             'reorganize',
+             'smote',
+             'perm',
+             'kind']
+file_pattern = re.compile(
+    r'^(?P<sub_id>sub-[^_]+)_(?P<modality>train-[^_]+_test-[^_]+)'
+    r'_events-(?P<event_file>.+?)_mask-(?P<mask_index>[0-9-]+)'
+    r'_xval-(?P<x_val_split>fold|session|sub_fold)_clf-(?P<classifier>.+?)'
+    r'(?:_kernel-(?P<kernel>[a-z]+))?'
+    r'(?:_buffer-(?P<train_buffer>[0-9]+))?'
+    r'(?:_within-(?P<within_session>[0-9]+))?'
+    r'(?P<reorganize>_reorg)?(?P<smote>_SMOTE)?(?P<perm>_perm)?'
+    r'_(?P<kind>' + '|'.join(output_kinds) + r')\.(?:tsv|parquet)$')
+
+
+# Function to get parameters of an output file from its name (None if file is
+# not an output of CreateOutput)
+def ParseOutputFile(file):
+
+    match = file_pattern.match(os.path.basename(file))
+    if match is None:
+        return(None)
+
+    params = match.groupdict()
+    # Kernel mode is part of classifier (e.g. 'svm-precomputed')
+    kernel = params.pop('kernel')
+    if kernel is not None:
+        params['classifier'] = params['classifier'] + '-' + kernel
+    for col in ['train_buffer', 'within_session']:
+        if params[col] is not None:
+            params[col] = int(params[col])
+    for col in ['reorganize', 'smote', 'perm']:
+        params[col] = int(params[col] is not None)
+
+    return(params)
+
+
+# Function to open store (SQLite database) and create table of ingested files
+# in case it does not exist
+def OpenStore(store_file):
+
+    out_dir = os.path.dirname(store_file)
+    # Create directory in case it does not exist
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    con = sqlite3.connect(store_file)
+    with con:
+        con.execute('CREATE TABLE IF NOT EXISTS files ('
+                    'file_id INTEGER PRIMARY KEY, '
+                    'path TEXT UNIQUE, '
+                    'size INTEGER, '
+                    'mtime_ns INTEGER, ' +
+                    ', '.join(col + ' ' +
+                              ('INTEGER' if col in ['train_buffer',
+                                                    'within_session',
+                                                    'reorganize', 'smote',
+                                                    'perm'] else 'TEXT')
+                              for col in file_cols) + ')')
+        con.execute('CREATE INDEX IF NOT EXISTS files_params ON files ('
+                    'sub_id, mask_index, classifier, x_val_split, '
+                    'within_session, perm, kind)')
+
+    return(con)
+
+
+# Function to add columns of an output table missing in table of store
+# (create table in case it does not exist)
+def PrepareTable(con, kind, columns):
+
+    existing = [row[1] for row in
+                con.execute('PRAGMA table_info("' + kind + '")')]
+    if len(existing) == 0:
+        con.execute('CREATE TABLE "' + kind + '" (file_id INTEGER)')
+        con.execute('CREATE INDEX "' + kind + '_file_id" ON "' + kind +
+                    '" (file_id)')
+        existing = ['file_id']
+    for col in columns:
+        if col not in existing:
+            con.execute('ALTER TABLE "' + kind + '" ADD COLUMN "' + col + '"')
+
+
+# Function to remove a file and its rows from store
+def RemoveFile(con, file_id, kind):
+    if con.execute('SELECT name FROM sqlite_master WHERE name = ?',
+                   (kind,)).fetchone() is not None:
+        con.execute('DELETE FROM "' + kind + '" WHERE file_id = ?',
+                    (file_id,))
+    con.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+
+
+# Function to ingest one output file (replaces earlier version of file, one
+# transaction so an interrupted ingestion leaves the store unchanged)
+def IngestOutputFile(con, base_path, file, params, file_id=None):
+
+    from OutputTable import ReadOutputTable
+
+    data = ReadOutputTable(file)
+    stat = os.stat(file)
+    kind = params['kind']
+
+    with con:
+        if file_id is not None:
+            RemoveFile(con, file_id, kind)
+        cursor = con.execute(
+            'INSERT INTO files (path, size, mtime_ns, ' +
+            ', '.join(file_cols) + ') VALUES (' +
+            ', '.join(['?'] * (3 + len(file_cols))) + ')',
+            [os.path.relpath(file, base_path), stat.st_size,
+             stat.st_mtime_ns] + [params[col] for col in file_cols])
+        file_id = cursor.lastrowid
+
+        columns = [str(col) for col in data.columns]
+        PrepareTable(con, kind, columns)
+        # (numpy values to python values, missing values to NULL)
+        data = data.astype(object).where(data.notnull(), None)
+        con.executemany(
+            'INSERT INTO "' + kind + '" (file_id, ' +
+            ', '.join('"' + col + '"' for col in columns) + ') VALUES (' +
+            ', '.join(['?'] * (1 + len(columns))) + ')',
+            ([file_id] + row for row in data.values.tolist()))
+
+
+# Function to ingest all new or changed output files of decoding into store
+# and remove files which do not exist anymore. Returns number of added,
+# updated, removed, and unchanged files
+def UpdateStore(base_path,
+                store_file,
+                modalities=None,
+                kinds=output_kinds):
+
+    # Find output files (all participants, buffered and unbuffered)
+    if modalities is None:
+        modalities = ['train-*_test-*']
+    files = []
+    for modality in modalities:
+        for ext in ['tsv', 'parquet']:
+            files = files + glob.glob(os.path.join(base_path, 'derivatives',
+                                                   'decoding', modality,
+                                                   'sub-*', '*buffer',
+                                                   '*.' + ext))
+    files.sort()
+
+    con = OpenStore(store_file)
+    ingested = {row[0]: row[1:] for row in
+                con.execute('SELECT path, file_id, size, mtime_ns, kind '
+                            'FROM files')}
+
+    n_files = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    found = set()
+    for file in files:
+        params = ParseOutputFile(file)
+        if params is None or params['kind'] not in kinds:
+            continue
+        path = os.path.relpath(file, base_path)
+        found.add(path)
+
+        # Skip files which did not change since they were ingested
+        stat = os.stat(file)
+        file_id = None
+        if path in ingested:
+            file_id, size, mtime_ns, _ = ingested[path]
+            if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                n_files['unchanged'] += 1
+                continue
+
+        # Give message to user
+        print('\t' + path)
+        IngestOutputFile(con, base_path, file, params, file_id=file_id)
+        n_files['updated' if file_id is not None else 'added'] += 1
+
+    # Remove files deleted since they were ingested (only of searched
+    # modalities and kinds)
+    for path, (file_id, _, _, kind) in ingested.items():
+        if (path not in found and kind in kinds and
+            any(fnmatch.fnmatch(path.split(os.sep)[2], modality)
+                for modality in modalities)):
+            with con:
+                RemoveFile(con, file_id, kind)
+            n_files['removed'] += 1
+
+    con.close()
+
+    return(n_files)
+
+
+# Function to load one output kind (e.g. 'acc') of all ingested files matching
+# the given parameters of file names (e.g. perm=0, within_session=1,
+# classifier='logreg')
+def LoadResults(store_file,
+                kind,
+                **filters):
+
+    for col in filters:
+        if col not in file_cols:
+            sys.exit('Unknown parameter of output files: ' + col)
+
+    query = ('SELECT files.path, ' +
+             ', '.join('files.' + col for col in
+                       ['train_buffer', 'within_session', 'reorganize',
+                        'smote', 'perm']) +
+             ', t.* FROM "' + kind + '" t JOIN files USING (file_id)')
+    if len(filters) > 0:
+        query = query + ' WHERE ' + ' AND '.join(
+            'files.' + col + ' = ?' for col in filters)
+
+    con = sqlite3.connect(store_file)
+    data = pd.read_sql_query(query, con, params=list(filters.values()))
+    con.close()
+
+    return(data)
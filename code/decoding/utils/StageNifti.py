@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 09:40:12 2026
+
+@author: koch
+"""
+
+import os
+import gzip
+import shutil
+
+
+# Function to get path of uncompressed copy of an fmriprep output (mirrors
+# fmriprep directory at .../derivatives/decoding/staging)
+def GetStagedPath(base_path, file):
+    fmriprep_dir = os.path.join(base_path, 'derivatives', 'preprocessing',
+                                'fmriprep')
+    staged = os.path.join(base_path, 'derivatives', 'decoding', 'staging',
+                          os.path.relpath(file, fmriprep_dir))
+    if staged.endswith('.gz'):
+        staged = staged[:-len('.gz')]
+    return(staged)
+
+
+# Function to get uncompressed copy of a file in case it was staged and is up
+# to date (otherwise returns the original file)
+def GetStagedFile(base_path, file):
+    staged = GetStagedPath(base_path, file)
+    if (os.path.exists(staged) and
+        os.path.getmtime(staged) >= os.path.getmtime(file)):
+        return(staged)
+    return(file)
+
+
+# Function to write uncompressed copy of a .nii.gz file (which can be
+# memory-mapped instead of inflating the whole gzip stream on every access)
+def StageNifti(base_path, file):
+    staged = GetStagedPath(base_path, file)
+
+    # Skip files which are already staged and up to date
+    if GetStagedFile(base_path, file) == staged:
+        return(staged)
+
+    # Create directory in case it does not exist
+    out_dir = os.path.dirname(staged)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    # Decompress as stream (.nii.gz is the gzipped .nii, so no need to load
+    # the image into memory), write to temporary file first so parallel jobs
+    # never read half-written files
+    tmp_file = staged + '.' + str(os.getpid()) + '.tmp'
+    with gzip.open(file, 'rb') as in_file, open(tmp_file, 'wb') as out_file:
+        shutil.copyfileobj(in_file, out_file, length=16 * 1024 * 1024)
+    os.replace(tmp_file, staged)
+
+    return(staged)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:37:14 2026
+
+@author: koch
+"""
+
+import numpy as np
+
+
+# Function to create cache of classifier solutions used as starting point of 
+# the next fit (e.g. next permutation of the same hold-out split) and counters
+# of saved solver iterations. With check=True each warm fit is compared to a
+# fit from zero (predictions of the fit from zero are used)
+def CreateWarmStart(check=False):
+
+    warm_start = {'solutions': dict(),
+                  'last_key': None,
+                  'check': check,
+                  'n_checked': 0,
+                  'n_mismatch': 0,
+                  'n_fits': 0,
+                  'n_warm': 0,
+                  'n_cold_refit': 0,
+                  'n_iter': 0,
+                  'n_iter_saved': 0}
+
+    return(warm_start)
+
+
+# Function to get starting point of a fit (solution of the last fit with the
+# same key, otherwise of the last fit of any key, e.g. adjacent hold-out 
+# split). Returns None if there is no solution of matching shape
+def GetWarmStartInit(warm_start,
+                     key,
+                     coef_shape,
+                     intercept_shape):
+
+    for solution_key in [key, warm_start['last_key']]:
+        solution = warm_start['solutions'].get(solution_key)
+        if ((solution is not None) and
+            (solution['coef'].shape == coef_shape) and
+            (solution['intercept'].shape == intercept_shape)):
+            return(solution['coef'].copy(), solution['intercept'].copy())
+
+    return(None)
+
+
+# Function to store solution of a fit and count iterations (iterations saved
+# are relative to the first fit from zero of the same key)
+def UpdateWarmStart(warm_start,
+                    key,
+                    coef,
+                    intercept,
+                    n_iter,
+                    warm,
+                    cold_refit=False,
+                    mismatch=None):
+
+    solution = warm_start['solutions'].get(key, {'n_iter_cold': None})
+    if not warm and solution['n_iter_cold'] is None:
+        solution['n_iter_cold'] = n_iter
+    solution['coef'] = np.array(coef)
+    solution['intercept'] = np.array(intercept)
+    warm_start['solutions'][key] = solution
+    warm_start['last_key'] = key
+
+    # Update counters
+    warm_start['n_fits'] += 1
+    warm_start['n_iter'] += n_iter
+    warm_start['n_cold_refit'] += int(cold_refit)
+    if mismatch is not None:
+        warm_start['n_checked'] += 1
+        warm_start['n_mismatch'] += int(mismatch)
+    if warm:
+        warm_start['n_warm'] += 1
+        if solution['n_iter_cold'] is not None:
+            warm_start['n_iter_saved'] += solution['n_iter_cold'] - n_iter
+
+
+# Function to give counters of warm start to user
+def PrintWarmStart(warm_start):
+    print('Warm start:')
+    print('\t', 'fits:', warm_start['n_fits'],
+          '(warm:', str(warm_start['n_warm']) + ',',
+          'refit from zero:', str(warm_start['n_cold_refit']) + ')')
+    print('\t', 'solver iterations:', warm_start['n_iter'],
+          '(saved:', str(warm_start['n_iter_saved']) + ')')
+    if warm_start['n_checked'] > 0:
+        print('\t', 'fits checked against fit from zero:',
+              warm_start['n_checked'],
+              '(different predictions:', str(warm_start['n_mismatch']) + ')')
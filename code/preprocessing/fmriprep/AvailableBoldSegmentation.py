@@ -7,105 +7,174 @@ Created on Fri Aug 28 13:15:43 2020
 """
 
 import os
+import sys
 import numpy as np
 import pandas as pd
 import numpy
-import copy
+import json
 import glob
 from nilearn import image
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # base_path = '/Users/koch/Tardis/damson'
 
-# Function to see which segmentations are present in the bold data
-def AvailableSegmentation(base_path) :   
 
-    # Get list of all subjects
-    sub_list = os.path.join(base_path,
+# Function to get all labels present in a segmentation image (read as integer
+# array, no float copy)
+def GetFileLabels(file):
+    seg_img = image.load_img(file)
+    seg_data = np.asanyarray(seg_img.dataobj)
+    if not np.issubdtype(seg_data.dtype, np.integer):
+        seg_data = np.rint(seg_data).astype(np.int64)
+    return(np.unique(seg_data).tolist())
+
+
+# Function to see which segmentations are present in the bold data. Labels of
+# each image are kept in a manifest (.../available_seg_manifest.json), only
+# new or changed images are read again
+def AvailableSegmentation(base_path,
+                          n_jobs=1) :   
+
+    fmriprep_dir = os.path.join(base_path,
                                 'derivatives',
                                 'preprocessing',
                                 'fmriprep')
-    sub_list = next(os.walk(sub_list))[1]
+
+    # Get list of all subjects
+    sub_list = next(os.walk(fmriprep_dir))[1]
     sub_list.sort()
     
-    data = pd.DataFrame()
-    
     # Give message to user
     print('Extracting available segmentation for bold modailty...')
     
-    # For all segmentation approaches
+    # Get all segmentation images (for all segmentation approaches)
+    img_files = list()
+    for seg_type in ['aparcaseg', 'aseg'] :
+        for sub_id in sub_list :
+            files = os.path.join(fmriprep_dir,
+                                 sub_id,
+                                 '*',
+                                 'func',
+                                 '*T1w_desc-' + seg_type + '*')
+            files = sorted(glob.glob(files))
+            img_files = img_files + [(seg_type, sub_id, x) for x in files]
+    
+    # Load manifest of labels of images read before
+    manifest_file = os.path.join(fmriprep_dir,
+                                 'available_seg_manifest.json')
+    manifest = dict()
+    if os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as in_file:
+            manifest = json.load(in_file)
+    
+    # Images which are new or changed since they were read (size, 
+    # modification time)
+    state = dict()
+    todo = list()
+    for _, _, file in img_files:
+        key = os.path.relpath(file, fmriprep_dir)
+        stat = os.stat(file)
+        state[key] = [stat.st_size, stat.st_mtime_ns]
+        if (key not in manifest or
+            [manifest[key]['size'], manifest[key]['mtime_ns']] != state[key]):
+            todo.append(file)
+    
+    # Give message to user
+    print('Reading ' + str(len(todo)) + ' of ' + str(len(img_files)) +
+          ' segmentation images...')
+    
+    # Get all segmentation areas present in new or changed images
+    if n_jobs == 1:
+        labels = [GetFileLabels(x) for x in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            labels = list(pool.map(GetFileLabels, todo))
+    for file, file_labels in zip(todo, labels):
+        key = os.path.relpath(file, fmriprep_dir)
+        manifest[key] = {'size': state[key][0],
+                         'mtime_ns': state[key][1],
+                         'labels': file_labels}
+    # Keep only images which still exist
+    n_removed = len([key for key in manifest if key not in state])
+    manifest = {key: val for key, val in manifest.items() if key in state}
+    
+    # Output is kept in case no image was added, changed, or removed
+    save_file = os.path.join(fmriprep_dir,
+                             'available_seg.tsv')
+    if len(todo) == 0 and n_removed == 0 and os.path.exists(save_file):
+        # Give message to user
+        print('No new, changed, or removed images, keeping ' + save_file)
+        print('...done!')
+        return
+    
+    data = list()
     for seg_type in ['aparcaseg', 'aseg'] :
         
         # Load segmentation tables
-        seg_path = os.path.join(base_path,
-                                'derivatives',
-                                'preprocessing',
-                                'fmriprep',
+        seg_path = os.path.join(fmriprep_dir,
                                 'desc-' + seg_type + '_dseg.tsv')
         full_seg = pd.read_csv(seg_path, sep='\t')
         
-        
-        # Load image file
-        for sub_id in sub_list :
-            img_files = os.path.join(base_path,
-                                    'derivatives',
-                                    'preprocessing',
-                                    'fmriprep',
-                                    sub_id,
-                                    '*',
-                                    'func',
-                                    '*T1w_desc-' + seg_type + '*')
-            img_files = glob.glob(img_files)
+        for file_seg, sub_id, file in img_files :
+            if file_seg != seg_type:
+                continue
+            key = os.path.relpath(file, fmriprep_dir)
+            # Select only present segmentations
+            match = np.isin(full_seg['index'], manifest[key]['labels'])
+            seg_match = full_seg.loc[match, :].copy()
+            # Add relevant columns
+            file = file.split('/')[-1]
+            extra_cols = file.split('_')
+            ses = extra_cols[1]
+            task = extra_cols[2]
+            space = extra_cols[3]
+            seg_match['sub_id'] = sub_id
+            seg_match['seg_type'] = seg_type
+            seg_match['ses_id'] = ses
+            seg_match['task'] = task
+            seg_match['space'] = space
             
-            # for all image files
-            for file in img_files :
-                # Get all segmentation areas present in segmentation image
-                seg_img = image.load_img(file)
-                seg_data = seg_img.get_fdata()
-                seg_data = np.unique(seg_data)
-                # Select only present segmentations
-                match = [full_seg['index'][x] in seg_data for x in np.arange(len(full_seg))]
-                seg_match = copy.deepcopy(full_seg.loc[match, :])
-                # Add relevant columns
-                file = file.split('/')[-1]
-                extra_cols = file.split('_')
-                ses = extra_cols[1]
-                task = extra_cols[2]
-                space = extra_cols[3]
-                seg_match['sub_id'] = sub_id
-                seg_match['seg_type'] = seg_type
-                seg_match['ses_id'] = ses
-                seg_match['task'] = task
-                seg_match['space'] = space
-                
-                # Append data
-                data = data.append(seg_match)
+            # Append data
+            data.append(seg_match)
+    if len(data) == 0:
+        sys.exit('No segmentation images found in ' + fmriprep_dir)
+    data = pd.concat(data)
                 
     # Give message to user
     print('Saveing output...')
                 
     # Save output
-    save_file = os.path.join(base_path,
-                                'derivatives',
-                                'preprocessing',
-                                'fmriprep',
-                                'available_seg.tsv')
     data.to_csv(save_file, sep='\t', header=True, index=False)
     
+    # Save manifest (write temporary file first so an interrupted run leaves
+    # a valid manifest)
+    tmp_file = manifest_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'w') as out_file:
+        json.dump(manifest, out_file, indent=4)
+    os.replace(tmp_file, manifest_file)
+    
     # Give message to user
     print('...done!')
 
 
 # Get arguments parswd via commandline
-parser = argparse.ArgumentParser(description='DAMSON decoding script')
-parser.add_argument('--base_path',
-                    default=None,
-                    type=str,
-                    required=True,
-                    help='path to DAMSON repository',
-                    metavar='BASE_PATH')
-args = parser.parse_args()
-
-# Call function with user inputs
-AvailableSegmentation(base_path=args.base_path)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DAMSON decoding script')
+    parser.add_argument('--base_path',
+                        default=None,
+                        type=str,
+                        required=True,
+                        help='path to DAMSON repository',
+                        metavar='BASE_PATH')
+    parser.add_argument('--n_jobs',
+                        default=1,
+                        type=int,
+                        required=False,
+                        help='number of processes new or changed segmentation images are read in',
+                        metavar='N_JOBS')
+    args = parser.parse_args()
 
+    # Call function with user inputs
+    AvailableSegmentation(base_path=args.base_path,
+                          n_jobs=args.n_jobs)